@@ -0,0 +1,344 @@
+"""
+Two-tier cache backend: a bounded per-process LRU in front of a shared cache.
+
+Reads are served from process memory when possible and fall through to the
+shared alias (Redis in production) otherwise. Every write or delete goes to
+the shared cache and is broadcast on an invalidation channel, so the other
+processes drop their local copy. Local entries also expire after
+LOCAL_TIMEOUT seconds, which bounds staleness if a broadcast is missed.
+Without an INVALIDATION_URL the broadcast only reaches this process, so other
+workers can serve a stale copy for that long. Keys under SHARED_ONLY_PREFIXES
+never enter the local tier, which is where one-time and security state
+belongs: a used OTP or a revoked admin must not linger in another worker.
+Local values are kept by reference rather than pickled, so callers must not
+mutate what they get back.
+
+    CACHES = {
+        'default': {
+            'BACKEND': 'backend.cache.TieredCache',
+            'OPTIONS': {
+                'SHARED_ALIAS': 'shared',        # Any Django cache alias
+                'MAX_ENTRIES': 5000,             # Per-process LRU size
+                'LOCAL_TIMEOUT': 30,             # Seconds
+                'INVALIDATION_URL': 'redis://',  # Empty: in-process only
+                'SHARED_ONLY_PREFIXES': ['otp_'],
+                'METRIC_PREFIXES': ['post_list', 'otp'],
+            },
+        },
+        'shared': {...},
+    }
+"""
+import threading
+import time
+import uuid
+from collections import OrderedDict, defaultdict
+
+from django.core.cache import caches
+from django.core.cache.backends.base import DEFAULT_TIMEOUT, BaseCache
+from django.core.exceptions import ImproperlyConfigured
+
+from .metrics import record_cache
+
+_MISSING = object()
+
+INVALIDATION_CHANNEL = 'tiered-cache-invalidation'
+
+
+class LocalInvalidationBus:
+    """Delivers invalidations between TieredCache instances in this process only."""
+
+    def __init__(self):
+        self.subscribers = []
+
+    def subscribe(self, callback):
+        self.subscribers.append(callback)
+
+    def publish(self, message):
+        for callback in list(self.subscribers):
+            callback(message)
+
+
+class RedisInvalidationBus:
+    """Broadcasts invalidations to every process over Redis pub/sub."""
+
+    def __init__(self, url):
+        try:
+            import redis
+        except ImportError:
+            raise ImproperlyConfigured("INVALIDATION_URL needs the 'redis' package.")
+        self.client = redis.Redis.from_url(url)
+        self.callbacks = []
+        self.listener = None
+
+    def subscribe(self, callback):
+        self.callbacks.append(callback)
+        if self.listener is None:
+            self.listener = threading.Thread(target=self.listen, name='tiered-cache-invalidation', daemon=True)
+            self.listener.start()
+
+    def listen(self):
+        while True:
+            try:
+                pubsub = self.client.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(INVALIDATION_CHANNEL)
+                for message in pubsub.listen():
+                    for callback in self.callbacks:
+                        callback(message['data'].decode())
+            except Exception:
+                # Connection dropped: local entries still expire on their own,
+                # so just reconnect.
+                time.sleep(1)
+
+    def publish(self, message):
+        self.client.publish(INVALIDATION_CHANNEL, message)
+
+
+_buses = {}
+_buses_lock = threading.Lock()
+
+
+def get_invalidation_bus(url):
+    with _buses_lock:
+        if url not in _buses:
+            _buses[url] = RedisInvalidationBus(url) if url else LocalInvalidationBus()
+        return _buses[url]
+
+
+class LocalStore:
+    """The per-process LRU, shared by every thread's TieredCache instance."""
+
+    def __init__(self, bus):
+        self.entries = OrderedDict()  # key -> (expires_at, value)
+        self.lock = threading.Lock()
+        self.stats = defaultdict(lambda: {'local_hits': 0, 'shared_hits': 0, 'misses': 0})
+        # Tags our own broadcasts so we don't drop entries we just wrote
+        self.origin = uuid.uuid4().hex
+        self.bus = bus
+        bus.subscribe(self.on_invalidation)
+
+    def on_invalidation(self, message):
+        origin, *local_keys = message.split('\n')
+        if origin == self.origin:
+            return
+        with self.lock:
+            if '*' in local_keys:
+                self.entries.clear()
+            for local_key in local_keys:
+                self.entries.pop(local_key, None)
+
+
+# Like LocMemCache, Django builds one cache object per thread, so the local
+# tier lives at module level, keyed by LOCATION.
+_stores = {}
+_stores_lock = threading.Lock()
+
+
+class TieredCache(BaseCache):
+
+    def __init__(self, location, params):
+        super().__init__(params)
+        options = params.get('OPTIONS', {})
+        self.shared_alias = options.get('SHARED_ALIAS', 'shared')
+        self.local_timeout = options.get('LOCAL_TIMEOUT', 30)
+        self.shared_only_prefixes = tuple(options.get('SHARED_ONLY_PREFIXES', []))
+        self.metric_prefixes = sorted(options.get('METRIC_PREFIXES', []), key=len, reverse=True)
+
+        with _stores_lock:
+            if location not in _stores:
+                _stores[location] = LocalStore(get_invalidation_bus(options.get('INVALIDATION_URL', '')))
+            self.store = _stores[location]
+
+    @property
+    def shared(self):
+        return caches[self.shared_alias]
+
+    # Local tier
+
+    def _local_key(self, key, version):
+        # None for keys that must always be read from the shared tier
+        local_key = self.make_and_validate_key(key, version=version)
+        return None if key.startswith(self.shared_only_prefixes) else local_key
+
+    def _local_get(self, local_key):
+        if local_key is None:
+            return _MISSING
+        with self.store.lock:
+            entry = self.store.entries.get(local_key)
+            if entry is None:
+                return _MISSING
+            expires_at, value = entry
+            if expires_at <= time.monotonic():
+                del self.store.entries[local_key]
+                return _MISSING
+            self.store.entries.move_to_end(local_key)
+            return value
+
+    def _local_set(self, local_key, value, timeout):
+        if local_key is None:
+            return
+        ttl = self.local_timeout if timeout is None else min(timeout, self.local_timeout)
+        with self.store.lock:
+            if ttl <= 0:
+                self.store.entries.pop(local_key, None)
+                return
+            self.store.entries[local_key] = (time.monotonic() + ttl, value)
+            self.store.entries.move_to_end(local_key)
+            while len(self.store.entries) > self._max_entries:
+                self.store.entries.popitem(last=False)
+
+    def _invalidate(self, local_keys):
+        local_keys = [local_key for local_key in local_keys if local_key is not None]
+        if not local_keys:
+            return
+        with self.store.lock:
+            for local_key in local_keys:
+                self.store.entries.pop(local_key, None)
+        self.store.bus.publish('\n'.join([self.store.origin, *local_keys]))
+
+    # Metrics
+
+    def _prefix(self, key):
+        for prefix in self.metric_prefixes:
+            if key.startswith(prefix):
+                return prefix
+        return 'other'
+
+    def _record(self, key, outcome):
+        self.store.stats[self._prefix(key)][outcome] += 1
+        record_cache(outcome)
+
+    def metrics(self):
+        """Hit/miss counters for this process, per configured key prefix."""
+        return {prefix: dict(counts) for prefix, counts in self.store.stats.items()}
+
+    # Cache API
+
+    def _shared_timeout(self, timeout):
+        return self.default_timeout if timeout is DEFAULT_TIMEOUT else timeout
+
+    def get(self, key, default=None, version=None):
+        local_key = self._local_key(key, version)
+        value = self._local_get(local_key)
+        if value is not _MISSING:
+            self._record(key, 'local_hits')
+            return value
+
+        value = self.shared.get(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._record(key, 'misses')
+            return default
+        self._record(key, 'shared_hits')
+        self._local_set(local_key, value, self.local_timeout)
+        return value
+
+    def get_many(self, keys, version=None):
+        found = {}
+        missing = []
+        for key in keys:
+            value = self._local_get(self._local_key(key, version))
+            if value is _MISSING:
+                missing.append(key)
+            else:
+                self._record(key, 'local_hits')
+                found[key] = value
+
+        if missing:
+            fetched = self.shared.get_many(missing, version=version)
+            for key in missing:
+                if key in fetched:
+                    self._record(key, 'shared_hits')
+                    self._local_set(self._local_key(key, version), fetched[key], self.local_timeout)
+                else:
+                    self._record(key, 'misses')
+            found.update(fetched)
+        return found
+
+    async def aget(self, key, default=None, version=None):
+        # Local hits never leave the event loop; only misses await the shared tier.
+        local_key = self._local_key(key, version)
+        value = self._local_get(local_key)
+        if value is not _MISSING:
+            self._record(key, 'local_hits')
+            return value
+
+        value = await self.shared.aget(key, _MISSING, version=version)
+        if value is _MISSING:
+            self._record(key, 'misses')
+            return default
+        self._record(key, 'shared_hits')
+        self._local_set(local_key, value, self.local_timeout)
+        return value
+
+    def set(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self._local_key(key, version)
+        timeout = self._shared_timeout(timeout)
+        self.shared.set(key, value, timeout, version=version)
+        self._invalidate([local_key])
+        self._local_set(local_key, value, timeout)
+
+    def set_many(self, data, timeout=DEFAULT_TIMEOUT, version=None):
+        timeout = self._shared_timeout(timeout)
+        failed = self.shared.set_many(data, timeout, version=version)
+        local_keys = {key: self._local_key(key, version) for key in data}
+        self._invalidate(list(local_keys.values()))
+        for key, value in data.items():
+            if key not in failed:
+                self._local_set(local_keys[key], value, timeout)
+        return failed
+
+    async def aset(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self._local_key(key, version)
+        timeout = self._shared_timeout(timeout)
+        await self.shared.aset(key, value, timeout, version=version)
+        self._invalidate([local_key])
+        self._local_set(local_key, value, timeout)
+
+    def add(self, key, value, timeout=DEFAULT_TIMEOUT, version=None):
+        local_key = self._local_key(key, version)
+        added = self.shared.add(key, value, self._shared_timeout(timeout), version=version)
+        if added:
+            self._invalidate([local_key])
+        return added
+
+    def touch(self, key, timeout=DEFAULT_TIMEOUT, version=None):
+        self.make_and_validate_key(key, version=version)
+        return self.shared.touch(key, self._shared_timeout(timeout), version=version)
+
+    def delete(self, key, version=None):
+        local_key = self._local_key(key, version)
+        deleted = self.shared.delete(key, version=version)
+        self._invalidate([local_key])
+        return deleted
+
+    def delete_many(self, keys, version=None):
+        keys = list(keys)
+        if not keys:
+            return
+        local_keys = [self._local_key(key, version) for key in keys]
+        self.shared.delete_many(keys, version=version)
+        self._invalidate(local_keys)
+
+    def has_key(self, key, version=None):
+        local_key = self._local_key(key, version)
+        if self._local_get(local_key) is not _MISSING:
+            return True
+        return self.shared.has_key(key, version=version)
+
+    def incr(self, key, delta=1, version=None):
+        # Counters are atomic in the shared tier only; never cache them locally.
+        local_key = self._local_key(key, version)
+        value = self.shared.incr(key, delta, version=version)
+        self._invalidate([local_key])
+        return value
+
+    def decr(self, key, delta=1, version=None):
+        return self.incr(key, -delta, version=version)
+
+    def clear(self):
+        self.shared.clear()
+        with self.store.lock:
+            self.store.entries.clear()
+        self.store.bus.publish('\n'.join([self.store.origin, '*']))
+
+    def close(self, **kwargs):
+        self.shared.close(**kwargs)
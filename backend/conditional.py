@@ -0,0 +1,44 @@
+"""
+Conditional GET.
+
+Views derive an ETag and a Last-Modified time from the ``updated_at``
+columns of the rows behind a response, either from rows they have already
+loaded or from one narrow query, and check them before serializing
+anything. A client whose copy is still current gets an empty 304.
+
+The ETags are weak: they identify the state of the rows, not the bytes of
+the body.
+"""
+import hashlib
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+
+def make_validators(parts, modified):
+    """
+    The ETag for ``parts`` (anything the payload depends on) and the latest
+    of the ``modified`` datetimes as a Unix timestamp, or None if there are none.
+    """
+    digest = hashlib.md5('|'.join(map(str, parts)).encode()).hexdigest()
+    stamps = [moment.timestamp() for moment in modified if moment is not None]
+    return f'W/"{digest}"', int(max(stamps)) if stamps else None
+
+
+def is_conditional(request):
+    return 'If-None-Match' in request.headers or 'If-Modified-Since' in request.headers
+
+
+def set_validators(response, etag, last_modified):
+    response['ETag'] = etag
+    if last_modified is not None:
+        response['Last-Modified'] = http_date(last_modified)
+    return response
+
+
+def not_modified(request, etag, last_modified):
+    """A 304 (or 412) if the request's preconditions settle it, otherwise None."""
+    response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+    if response is not None:
+        set_validators(response, etag, last_modified)
+    return response
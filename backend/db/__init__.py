@@ -0,0 +1,57 @@
+"""
+Database engines that time how long it takes to get a connection.
+
+``backend.db.postgresql`` and ``backend.db.sqlite3`` are the stock Django
+backends plus a timer around get_new_connection(). That call either opens a
+new connection or, with DB_POOL on, checks one out of the psycopg pool, so
+its duration is the connection acquire time. A reused persistent connection
+(CONN_MAX_AGE) never calls it, so ``acquired`` counts what reuse didn't save.
+Every query also passes through backend.metrics.record_query.
+"""
+import logging
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+
+from backend.metrics import record_query
+
+logger = logging.getLogger(__name__)
+
+_stats = defaultdict(lambda: {'acquired': 0, 'slow': 0, 'total_ms': 0.0, 'max_ms': 0.0})
+_stats_lock = threading.Lock()
+
+
+def record_acquire(alias, elapsed_ms):
+    with _stats_lock:
+        stats = _stats[alias]
+        stats['acquired'] += 1
+        stats['total_ms'] += elapsed_ms
+        stats['max_ms'] = max(stats['max_ms'], elapsed_ms)
+        slow = elapsed_ms >= settings.DB_SLOW_ACQUIRE_MS
+        if slow:
+            stats['slow'] += 1
+    if slow:
+        logger.warning("Acquiring a '%s' database connection took %.1f ms", alias, elapsed_ms)
+
+
+def connection_metrics():
+    """Acquire counts and timings for this process, per database alias."""
+    with _stats_lock:
+        return {alias: dict(stats) for alias, stats in _stats.items()}
+
+
+class InstrumentedConnectMixin:
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        # Per-request query counts for backend.metrics
+        self.execute_wrappers.append(record_query)
+
+    def get_new_connection(self, conn_params):
+        start = time.perf_counter()
+        try:
+            return super().get_new_connection(conn_params)
+        finally:
+            record_acquire(self.alias, (time.perf_counter() - start) * 1000)
@@ -0,0 +1,7 @@
+from django.db.backends.sqlite3 import base
+
+from backend.db import InstrumentedConnectMixin
+
+
+class DatabaseWrapper(InstrumentedConnectMixin, base.DatabaseWrapper):
+    pass
@@ -0,0 +1,217 @@
+"""
+Per-endpoint request metrics.
+
+RequestMetricsMiddleware times every request and attributes it to the
+resolved view. Each request records its wall time, database queries and time,
+TieredCache hits and misses, and response size. The backend.db engines
+count queries and backend.cache counts cache hits, both into the current
+request's RequestMetrics through a context variable, so the counts are
+right under threads and ASGI alike.
+
+Percentiles come from the last METRICS_WINDOW requests per view, kept in
+process memory. backend.views.metrics serves them, together with the connection and
+cache counters, in the Prometheus text format. Each worker process reports
+its own numbers, so scrape every worker or aggregate them downstream.
+"""
+import threading
+import time
+from collections import defaultdict, deque
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+
+QUANTILES = (0.5, 0.9, 0.99)
+
+_current = ContextVar('request_metrics', default=None)
+
+
+class RequestMetrics:
+
+    def __init__(self):
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.cache = defaultdict(int)  # local_hits / shared_hits / misses
+
+
+def record_query(execute, sql, params, many, context):
+    """Database execute_wrapper that counts into the current request, if any."""
+    metrics = _current.get()
+    if metrics is None:
+        return execute(sql, params, many, context)
+    start = time.perf_counter()
+    try:
+        return execute(sql, params, many, context)
+    finally:
+        metrics.queries += 1
+        metrics.db_seconds += time.perf_counter() - start
+
+
+def record_cache(outcome):
+    metrics = _current.get()
+    if metrics is not None:
+        metrics.cache[outcome] += 1
+
+
+class EndpointStats:
+
+    def __init__(self, window):
+        self.durations = deque(maxlen=window)
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.queries = 0
+        self.db_seconds = 0.0
+        self.cache = defaultdict(int)
+        self.response_bytes = 0
+
+
+_endpoints = {}
+_endpoints_lock = threading.Lock()
+
+
+def record_request(view, seconds, status_code, metrics, response_bytes):
+    with _endpoints_lock:
+        stats = _endpoints.get(view)
+        if stats is None:
+            stats = _endpoints[view] = EndpointStats(settings.METRICS_WINDOW)
+        stats.durations.append(seconds)
+        stats.count += 1
+        stats.errors += status_code >= 500
+        stats.seconds += seconds
+        stats.queries += metrics.queries
+        stats.db_seconds += metrics.db_seconds
+        for outcome, count in metrics.cache.items():
+            stats.cache[outcome] += count
+        stats.response_bytes += response_bytes
+
+
+def endpoint_metrics():
+    """A snapshot of the per-view stats, with percentiles in seconds."""
+    with _endpoints_lock:
+        snapshot = {}
+        for view, stats in _endpoints.items():
+            durations = sorted(stats.durations)
+            snapshot[view] = {
+                'count': stats.count,
+                'errors': stats.errors,
+                'seconds': stats.seconds,
+                'quantiles': {q: durations[min(len(durations) - 1, int(q * len(durations)))] for q in QUANTILES},
+                'queries': stats.queries,
+                'db_seconds': stats.db_seconds,
+                'cache': dict(stats.cache),
+                'response_bytes': stats.response_bytes,
+            }
+        return snapshot
+
+
+def reset_endpoint_metrics():
+    with _endpoints_lock:
+        _endpoints.clear()
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    return match.view_name if match else 'unmatched'
+
+
+def server_timing(seconds, metrics):
+    cache = metrics.cache
+    hits = cache['local_hits'] + cache['shared_hits']
+    return (
+        f'app;dur={seconds * 1000:.1f}, '
+        f'db;dur={metrics.db_seconds * 1000:.1f};desc="{metrics.queries} queries", '
+        f'cache;desc="{hits} hits {cache["misses"]} misses"'
+    )
+
+
+class RequestMetricsMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, time.perf_counter() - start, metrics)
+
+    async def __acall__(self, request):
+        metrics = RequestMetrics()
+        token = _current.set(metrics)
+        start = time.perf_counter()
+        try:
+            response = await self.get_response(request)
+        finally:
+            _current.reset(token)
+        return self.finish(request, response, time.perf_counter() - start, metrics)
+
+    def finish(self, request, response, seconds, metrics):
+        # Streamed bodies aren't buffered just to measure them
+        size = 0 if response.streaming else len(response.content)
+        record_request(view_name(request), seconds, response.status_code, metrics, size)
+        if settings.SERVER_TIMING:
+            response['Server-Timing'] = server_timing(seconds, metrics)
+        return response
+
+
+def escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def render_prometheus():
+    from .db import connection_metrics  # backend.db imports this module
+
+    lines = []
+
+    def metric(name, kind, help_text, samples):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} {kind}')
+        for suffix, labels, value in samples:
+            label_text = ','.join(f'{key}="{escape(val)}"' for key, val in labels.items())
+            lines.append(f'{name}{suffix}{{{label_text}}} {value}')
+
+    endpoints = endpoint_metrics()
+    metric('http_request_duration_seconds', 'summary', 'Wall time per view, quantiles over the last METRICS_WINDOW requests.', [
+        sample
+        for view, stats in endpoints.items()
+        for sample in [
+            *[('', {'view': view, 'quantile': q}, stats['quantiles'][q]) for q in QUANTILES],
+            ('_sum', {'view': view}, stats['seconds']),
+            ('_count', {'view': view}, stats['count']),
+        ]
+    ])
+    metric('http_request_errors_total', 'counter', 'Responses with a 5xx status, per view.',
+           [('', {'view': view}, stats['errors']) for view, stats in endpoints.items()])
+    metric('http_response_bytes_total', 'counter', 'Response body bytes per view, streamed responses excluded.',
+           [('', {'view': view}, stats['response_bytes']) for view, stats in endpoints.items()])
+    metric('db_queries_total', 'counter', 'Database queries per view.',
+           [('', {'view': view}, stats['queries']) for view, stats in endpoints.items()])
+    metric('db_query_seconds_total', 'counter', 'Time spent in database queries per view.',
+           [('', {'view': view}, stats['db_seconds']) for view, stats in endpoints.items()])
+    metric('cache_requests_total', 'counter', 'Cache lookups per view by outcome.',
+           [('', {'view': view, 'outcome': outcome}, count)
+            for view, stats in endpoints.items() for outcome, count in sorted(stats['cache'].items())])
+
+    if hasattr(cache, 'metrics'):  # TieredCache
+        metric('cache_prefix_requests_total', 'counter', 'Process-wide cache lookups per key prefix by outcome.',
+               [('', {'prefix': prefix, 'outcome': outcome}, count)
+                for prefix, counts in sorted(cache.metrics().items()) for outcome, count in sorted(counts.items())])
+
+    connections = connection_metrics()
+    metric('db_connection_acquires_total', 'counter', 'New database connections or pool checkouts.',
+           [('', {'alias': alias}, stats['acquired']) for alias, stats in connections.items()])
+    metric('db_connection_acquire_seconds_total', 'counter', 'Time spent acquiring database connections.',
+           [('', {'alias': alias}, stats['total_ms'] / 1000) for alias, stats in connections.items()])
+    return '\n'.join(lines) + '\n'
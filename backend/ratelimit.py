@@ -0,0 +1,201 @@
+"""
+Rate limiting and load shedding.
+
+Views opt in with ``@throttle_classes(rate_limits('login'))``. The limits
+for a scope come from settings.RATE_LIMITS, e.g.
+``{'login': {'ip': '30/m', 'username': '10/m'}}``. Each rule keys a limit
+on the client IP ('ip'), the authenticated user ('user') or a request field
+such as 'email'. Rules are enforced with GCRA (the generic cell rate
+algorithm): a rate of N per period lets N requests through at once and then
+one every period/N. The only state per key is one timestamp, the
+theoretical arrival time, kept in the RATE_LIMIT_CACHE alias. On Redis a
+Lua script does the read-compare-write atomically across workers; other
+backends (the dev file cache, locmem in tests) use a process lock.
+
+LoadSheddingMiddleware counts the requests in flight in this worker
+process. Past LOAD_SHED_MAX_INFLIGHT it answers every request with an
+immediate 503. Rate-limited scopes are expensive (SMTP, password hashing),
+so they are shed earlier, at LOAD_SHED_EXPENSIVE_INFLIGHT. Both checks
+happen before any database work. The limits are per worker: a sync worker
+never has more than one request in flight, so shedding needs threaded
+(gthread) or ASGI workers, and the backlog of a saturated sync deployment
+queues in the server instead.
+"""
+import math
+import re
+import threading
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.core.cache.backends.redis import RedisCache
+from django.http import JsonResponse
+from rest_framework import status
+from rest_framework.exceptions import APIException
+from rest_framework.throttling import BaseThrottle
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+RATE_PATTERN = re.compile(r'^(\d+)/(\d*)([smhd])$')
+
+# KEYS[1]: the key; ARGV: now, emission interval, burst tolerance (all ms).
+# Returns how many ms to wait, 0 if the request is allowed.
+GCRA_SCRIPT = """
+local now = tonumber(ARGV[1])
+local tat = math.max(tonumber(redis.call('GET', KEYS[1]) or now), now)
+local wait = tat - tonumber(ARGV[3]) - now
+if wait > 0 then
+    return wait
+end
+tat = tat + tonumber(ARGV[2])
+redis.call('SET', KEYS[1], tat, 'PX', tat - now)
+return 0
+"""
+
+_local_lock = threading.Lock()
+_script = None
+
+
+def parse_rate(rate):
+    """'10/m' or '3/15m' as (requests, period in seconds)."""
+    match = RATE_PATTERN.match(rate)
+    if match is None:
+        raise ValueError(f"Invalid rate {rate!r}, expected e.g. '10/m' or '3/15m'.")
+    count, multiple, unit = match.groups()
+    return int(count), int(multiple or 1) * PERIODS[unit]
+
+
+def rate_limit_cache():
+    alias = settings.RATE_LIMIT_CACHE
+    return caches[alias if alias in settings.CACHES else 'default']
+
+
+def gcra(key, rate):
+    """Take one request from ``key``'s allowance; returns the seconds to wait, 0 if allowed."""
+    count, period = parse_rate(rate)
+    now = time.time_ns() // 1_000_000
+    interval = period * 1000 // count
+    tolerance = interval * (count - 1)
+    cache = rate_limit_cache()
+
+    if isinstance(cache, RedisCache):
+        global _script
+        client = cache._cache.get_client(key, write=True)
+        if _script is None:
+            _script = client.register_script(GCRA_SCRIPT)  # EVALSHA, falling back to EVAL once per server
+        wait = _script(keys=[cache.make_and_validate_key(key)], args=[now, interval, tolerance], client=client)
+    else:
+        with _local_lock:
+            tat = max(cache.get(key, now), now)
+            wait = tat - tolerance - now
+            if wait <= 0:
+                tat += interval
+                cache.set(key, tat, timeout=math.ceil((tat - now) / 1000))
+    return max(0, wait) / 1000
+
+
+def client_ip(request):
+    """
+    The client address. Behind RATE_LIMIT_PROXY_COUNT proxies, each of which
+    appends to X-Forwarded-For, it is that many entries from the right.
+    """
+    proxies = settings.RATE_LIMIT_PROXY_COUNT
+    forwarded = [ip.strip() for ip in request.META.get('HTTP_X_FORWARDED_FOR', '').split(',') if ip.strip()]
+    if proxies and len(forwarded) >= proxies:
+        return forwarded[-proxies]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def rule_identity(request, key):
+    if key == 'ip':
+        return client_ip(request)
+    if key == 'user':
+        return str(request.user.pk) if request.user.is_authenticated else None
+    data = request.data if hasattr(request.data, 'get') else {}
+    value = data.get(key)
+    return str(value).strip().lower() if value else None  # A missing field fails validation anyway
+
+
+class Overloaded(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = "The server is busy, please try again shortly."
+    default_code = 'overloaded'
+    wait = 1  # Sent as Retry-After by DRF's exception handler
+
+
+class RateLimitThrottle(BaseThrottle):
+    scope = None
+
+    def allow_request(self, request, view):
+        if in_flight() > settings.LOAD_SHED_EXPENSIVE_INFLIGHT:
+            raise Overloaded()
+        if not settings.RATE_LIMITS_ENABLED:
+            return True
+        self.waits = []
+        for key, rate in settings.RATE_LIMITS.get(self.scope, {}).items():
+            identity = rule_identity(request, key)
+            if identity:
+                self.waits.append(gcra(f'ratelimit:{self.scope}:{key}:{identity}', rate))
+        return not any(self.waits)
+
+    def wait(self):
+        return max(self.waits)
+
+
+def rate_limits(scope):
+    """Throttle classes enforcing settings.RATE_LIMITS[scope], for ``@throttle_classes``."""
+    return [type(f'RateLimitThrottle_{scope}', (RateLimitThrottle,), {'scope': scope})]
+
+
+class InFlight:
+
+    def __init__(self):
+        self.count = 0
+        self.lock = threading.Lock()
+
+    def __enter__(self):
+        with self.lock:
+            self.count += 1
+        return self.count
+
+    def __exit__(self, *exc_info):
+        with self.lock:
+            self.count -= 1
+
+
+_in_flight = InFlight()
+
+
+def in_flight():
+    """Requests this worker is serving right now, the current one included."""
+    return _in_flight.count
+
+
+def overloaded_response():
+    response = JsonResponse({'detail': Overloaded.default_detail}, status=Overloaded.status_code)
+    response['Retry-After'] = str(Overloaded.wait)
+    return response
+
+
+class LoadSheddingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        with _in_flight as count:
+            if count > settings.LOAD_SHED_MAX_INFLIGHT:
+                return overloaded_response()
+            return self.get_response(request)
+
+    async def __acall__(self, request):
+        with _in_flight as count:
+            if count > settings.LOAD_SHED_MAX_INFLIGHT:
+                return overloaded_response()
+            return await self.get_response(request)
@@ -0,0 +1,151 @@
+"""
+Read-replica routing.
+
+ReplicaRoutingMiddleware records the current request; ReplicaRouter then
+sends reads made while serving a GET/HEAD/OPTIONS request to a random
+replica from REPLICA_DATABASES. Writes, reads during unsafe requests and
+anything outside a request (workers, shell, migrations) use the primary.
+
+Read-your-writes: after a successful unsafe request, the user behind the
+Bearer token is pinned to the primary for REPLICA_STICKY_SECONDS. The pin
+is a cache key, so it holds across workers. The token is only decoded, not
+looked up, so routing never queries the database itself.
+"""
+import random
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.conf import settings
+from django.core.cache import cache
+from django.db import DEFAULT_DB_ALIAS
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.settings import api_settings
+
+PRIMARY_DB = DEFAULT_DB_ALIAS
+SAFE_METHODS = ('GET', 'HEAD', 'OPTIONS')
+
+jwt_auth = JWTAuthentication()
+
+
+def primary_pin_key(user_id):
+    return f'primary_pin_{user_id}'
+
+
+def token_user_id(request):
+    """The user id claimed by a valid Bearer token, without a database lookup."""
+    header = jwt_auth.get_header(request)
+    raw_token = header and jwt_auth.get_raw_token(header)
+    if not raw_token:
+        return None
+    try:
+        return jwt_auth.get_validated_token(raw_token)[api_settings.USER_ID_CLAIM]
+    except (InvalidToken, TokenError, KeyError):
+        return None
+
+
+class RoutingState:
+
+    def __init__(self, request):
+        self.request = request
+        self.force_primary = request.method not in SAFE_METHODS
+        self._user_id = self._pinned = None
+
+    @property
+    def user_id(self):
+        if self._user_id is None:
+            self._user_id = token_user_id(self.request) or False
+        return self._user_id
+
+    def is_pinned(self):
+        if self._pinned is None:
+            self._pinned = bool(self.user_id) and bool(cache.get(primary_pin_key(self.user_id)))
+        return self._pinned
+
+
+_state = ContextVar('replica_routing', default=None)
+
+
+def reads_use_primary():
+    state = _state.get()
+    return state is None or state.force_primary or state.is_pinned()
+
+
+@contextmanager
+def primary_reads(enabled=True):
+    """Send this request's reads to the primary inside the block."""
+    state = _state.get()
+    if not enabled or state is None or state.force_primary:
+        yield
+        return
+    state.force_primary = True
+    try:
+        yield
+    finally:
+        state.force_primary = False
+
+
+def pin_to_primary(user_id):
+    cache.set(primary_pin_key(user_id), True, timeout=settings.REPLICA_STICKY_SECONDS)
+
+
+class ReplicaRouter:
+
+    def db_for_read(self, model, **hints):
+        instance = hints.get('instance')
+        if instance is not None and instance._state.db:
+            return instance._state.db  # Keep related lookups on the same database
+        if not settings.REPLICA_DATABASES or reads_use_primary():
+            return PRIMARY_DB
+        return random.choice(settings.REPLICA_DATABASES)
+
+    def db_for_write(self, model, **hints):
+        return PRIMARY_DB
+
+    def allow_relation(self, obj1, obj2, **hints):
+        return True  # Replicas hold the same rows as the primary
+
+    def allow_migrate(self, db, app_label, model_name=None, **hints):
+        return db == PRIMARY_DB  # Replicas copy the schema through replication
+
+
+class ReplicaRoutingMiddleware:
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        if not settings.REPLICA_DATABASES:
+            return self.get_response(request)
+        state = RoutingState(request)
+        token = _state.set(state)
+        try:
+            response = self.get_response(request)
+        finally:
+            _state.reset(token)
+        if self.should_pin(request, response, state):
+            pin_to_primary(state.user_id)
+        return response
+
+    async def __acall__(self, request):
+        if not settings.REPLICA_DATABASES:
+            return await self.get_response(request)
+        state = RoutingState(request)
+        token = _state.set(state)
+        try:
+            response = await self.get_response(request)
+        finally:
+            _state.reset(token)
+        if self.should_pin(request, response, state):
+            await cache.aset(primary_pin_key(state.user_id), True, timeout=settings.REPLICA_STICKY_SECONDS)
+        return response
+
+    def should_pin(self, request, response, state):
+        return request.method not in SAFE_METHODS and response.status_code < 400 and state.user_id
@@ -1,9 +1,9 @@
 from pathlib import Path
 import os
 from datetime import timedelta
-from decouple import config
+from decouple import Csv, config
 from dotenv import load_dotenv
-from urllib.parse import urlparse
+import dj_database_url
 
 load_dotenv()
 
@@ -26,6 +26,17 @@ DEBUG = config('DEBUG', default=False, cast=bool)
 
 ALLOWED_HOSTS = ['blogologybackend.onrender.com','blogology.netlify.app','127.0.0.1', 'localhost']
 
+# Where this API is reached from the browser. Stored media URLs are built on
+# it because the frontend is served from another origin (e.g. http://localhost:8000 in development)
+BACKEND_URL = config('BACKEND_URL', default='https://blogologybackend.onrender.com').rstrip('/')
+
+# How many proxies in front of the app append to X-Forwarded-For. With 0 the
+# client IP is REMOTE_ADDR and the header is ignored, since clients could
+# write anything in it. Render's load balancer appends the client address,
+# so deployments there must set RATE_LIMIT_PROXY_COUNT=1; otherwise every
+# request looks like it comes from the balancer.
+RATE_LIMIT_PROXY_COUNT = config('RATE_LIMIT_PROXY_COUNT', default=0, cast=int)
+
 
 # Application definition
 
@@ -43,8 +54,11 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'backend.metrics.RequestMetricsMiddleware',
     'whitenoise.middleware.WhiteNoiseMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'backend.ratelimit.LoadSheddingMiddleware',  # After CORS, so browsers can read the 503
+    'backend.replicas.ReplicaRoutingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -56,6 +70,12 @@ MIDDLEWARE = [
 
 ROOT_URLCONF = 'backend.urls'
 
+# Request metrics (backend/metrics.py): percentiles cover the last
+# METRICS_WINDOW requests per view; SERVER_TIMING adds the per-request
+# breakdown to every response, which browsers show in their dev tools.
+METRICS_WINDOW = config('METRICS_WINDOW', default=1000, cast=int)
+SERVER_TIMING = config('SERVER_TIMING', default=DEBUG, cast=bool)
+
 TEMPLATES = [
     {
         'BACKEND': 'django.template.backends.django.DjangoTemplates',
@@ -78,23 +98,58 @@ WSGI_APPLICATION = 'backend.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/5.1/ref/settings/#databases
 
-# DATABASES = {
-#     'default': dj_database_url.config(default=config('DATABASE_URL'))
-# }
+# DATABASE_URL is postgres://... in production; sqlite:///db.sqlite3 works for
+# local runs. Both map onto the engines in backend/db, which time how long it
+# takes to get a connection.
+INSTRUMENTED_ENGINES = {
+    'django.db.backends.postgresql': 'backend.db.postgresql',
+    'django.db.backends.sqlite3': 'backend.db.sqlite3',
+}
+
+
+def database_config(url):
+    database = dj_database_url.parse(url)
+    database.update({
+        'ENGINE': INSTRUMENTED_ENGINES.get(database['ENGINE'], database['ENGINE']),
+        # Keep connections open between requests, checking them before reuse
+        'CONN_MAX_AGE': config('DB_CONN_MAX_AGE', default=600, cast=int),
+        'CONN_HEALTH_CHECKS': config('DB_CONN_HEALTH_CHECKS', default=True, cast=bool),
+    })
+    # Optional psycopg 3 connection pool (pip install "psycopg[binary,pool]").
+    # Django won't combine a pool with persistent connections, so CONN_MAX_AGE
+    # drops to 0 and each request checks a connection out of the pool instead.
+    if config('DB_POOL', default=False, cast=bool):
+        database['CONN_MAX_AGE'] = 0
+        database.setdefault('OPTIONS', {})['pool'] = {
+            'min_size': config('DB_POOL_MIN_SIZE', default=2, cast=int),
+            'max_size': config('DB_POOL_MAX_SIZE', default=10, cast=int),
+            'timeout': config('DB_POOL_TIMEOUT', default=10, cast=float),  # Seconds to wait for a free connection
+        }
+    return database
 
-tmpPostgres = urlparse(config("DATABASE_URL"))
 
 DATABASES = {
-    'default': {
-        'ENGINE': 'django.db.backends.postgresql',
-        'NAME': tmpPostgres.path.replace('/', ''),
-        'USER': tmpPostgres.username,
-        'PASSWORD': tmpPostgres.password,
-        'HOST': tmpPostgres.hostname,
-        'PORT': 5432,
-    }
+    'default': database_config(config('DATABASE_URL')),
 }
-    
+
+# Read replicas (backend/replicas.py): GET requests read from one of these,
+# everything else and anything run outside a request uses 'default'. In
+# tests each replica mirrors 'default', so two local databases are enough.
+REPLICA_DATABASES = []
+for i, url in enumerate(config('DATABASE_REPLICA_URLS', default='', cast=Csv())):
+    alias = f'replica_{i}'
+    DATABASES[alias] = {**database_config(url), 'TEST': {'MIRROR': 'default'}}
+    REPLICA_DATABASES.append(alias)
+
+DATABASE_ROUTERS = ['backend.replicas.ReplicaRouter']
+TEST_RUNNER = 'backend.test_runner.TestRunner'
+
+# After a successful write, the user's reads stay on the primary this long so
+# they see their own changes despite replication lag.
+REPLICA_STICKY_SECONDS = config('REPLICA_STICKY_SECONDS', default=10, cast=int)
+
+# Connection acquires slower than this are logged by backend.db
+DB_SLOW_ACQUIRE_MS = config('DB_SLOW_ACQUIRE_MS', default=100, cast=float)
 
 
 # Password validation
@@ -147,12 +202,12 @@ CORS_ALLOWED_ORIGINS = [
 ]
 
 
-MEDIA_URL = '/media/'
+MEDIA_URL = config('MEDIA_URL', default=f'{BACKEND_URL}/media/')  # Absolute, stored in URLFields and read by the frontend
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
 REST_FRAMEWORK = {
     'DEFAULT_AUTHENTICATION_CLASSES': [
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'user.auth.ClaimsJWTAuthentication',  # request.user from the token claims, no query
     ],
 
     'DEFAULT_PERMISSION_CLASSES': [
@@ -160,6 +215,58 @@ REST_FRAMEWORK = {
     ],
 }
 
+# Cursor pagination for the post feed
+POST_FEED_PAGE_SIZE = config('POST_FEED_PAGE_SIZE', default=20, cast=int)
+POST_FEED_MAX_PAGE_SIZE = config('POST_FEED_MAX_PAGE_SIZE', default=100, cast=int)
+
+# Home timeline: posts are pushed to followers on write, except for authors
+# with more than TIMELINE_FANOUT_LIMIT followers, whose posts are pulled on read
+TIMELINE_MAX_LENGTH = config('TIMELINE_MAX_LENGTH', default=800, cast=int)
+TIMELINE_FANOUT_LIMIT = config('TIMELINE_FANOUT_LIMIT', default=10000, cast=int)
+
+# Rotated refresh tokens are blacklisted by user.blacklist, not by simplejwt's
+# token_blacklist app. purge_token_blacklist publishes a bloom filter sized
+# for this many live blacklisted tokens, which every worker checks before
+# the table; run it from cron (or with --interval) so purged jtis drop out.
+TOKEN_BLACKLIST_BLOOM_CAPACITY = config('TOKEN_BLACKLIST_BLOOM_CAPACITY', default=1000000, cast=int)
+
+# Initials avatars (user/avatars.py): rendered sizes in px, and the one stored in CustomUser.image
+AVATAR_SIZES = config('AVATAR_SIZES', default='48,96,256', cast=Csv(int))
+AVATAR_DEFAULT_SIZE = config('AVATAR_DEFAULT_SIZE', default=96, cast=int)
+
+# Post image uploads (blog/images.py): variant widths in px, the JPEG width
+# that Post.image_url points at, and limits on what may be uploaded
+POST_IMAGE_WIDTHS = config('POST_IMAGE_WIDTHS', default='320,640,1280', cast=Csv(int))
+POST_IMAGE_DEFAULT_WIDTH = config('POST_IMAGE_DEFAULT_WIDTH', default=640, cast=int)
+POST_IMAGE_MAX_BYTES = config('POST_IMAGE_MAX_BYTES', default=10 * 1024 * 1024, cast=int)
+POST_IMAGE_MAX_PIXELS = config('POST_IMAGE_MAX_PIXELS', default=40_000_000, cast=int)
+
+# Rate limits (backend/ratelimit.py) per scope, keyed on the client IP, the
+# request user or a request field. Rates are '<count>/<period>', e.g. '3/15m'.
+RATE_LIMITS_ENABLED = config('RATE_LIMITS_ENABLED', default=True, cast=bool)
+RATE_LIMIT_CACHE = 'shared'  # Limits must be shared by every worker, so skip the per-process tier
+# RATE_LIMIT_PROXY_COUNT, how to find the client IP, is next to ALLOWED_HOSTS
+RATE_LIMITS = {
+    'register': {'ip': '10/h', 'email': '5/h'},
+    'login': {'ip': '30/m', 'username': '10/m'},
+    'send_otp': {'ip': '10/h', 'email': '3/15m'},
+    'password_reset': {'ip': '10/h', 'email': '3/h'},
+}
+
+# Load shedding: requests in flight per worker process past which every
+# request gets a 503, and the lower bound for the rate-limited (expensive)
+# scopes. A sync gunicorn worker serves one request at a time, so shedding
+# only takes effect with threaded (--threads) or ASGI workers; size these
+# against the threads or concurrent requests one worker runs.
+LOAD_SHED_MAX_INFLIGHT = config('LOAD_SHED_MAX_INFLIGHT', default=64, cast=int)
+LOAD_SHED_EXPENSIVE_INFLIGHT = config('LOAD_SHED_EXPENSIVE_INFLIGHT', default=16, cast=int)
+
+# How long user.auth caches the account columns its permission checks read
+USER_CACHE_SECONDS = config('USER_CACHE_SECONDS', default=60, cast=int)
+
+# NDJSON bulk ingest: rows validated, inserted and invalidated per batch
+BULK_INGEST_BATCH_SIZE = config('BULK_INGEST_BATCH_SIZE', default=500, cast=int)
+
 
 
 SIMPLE_JWT = {
@@ -194,7 +301,7 @@ SIMPLE_JWT = {
     "SLIDING_TOKEN_REFRESH_LIFETIME": timedelta(days=7),
 
     "TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainPairSerializer",
-    "TOKEN_REFRESH_SERIALIZER": "rest_framework_simplejwt.serializers.TokenRefreshSerializer",
+    "TOKEN_REFRESH_SERIALIZER": "user.auth.ClaimsTokenRefreshSerializer",
     "TOKEN_VERIFY_SERIALIZER": "rest_framework_simplejwt.serializers.TokenVerifySerializer",
     "TOKEN_BLACKLIST_SERIALIZER": "rest_framework_simplejwt.serializers.TokenBlacklistSerializer",
     "SLIDING_TOKEN_OBTAIN_SERIALIZER": "rest_framework_simplejwt.serializers.TokenObtainSlidingSerializer",
@@ -226,10 +333,34 @@ STATIC_ROOT = os.path.join(BASE_DIR, 'staticfiles')
 
 #Caching 
 
+# A per-process LRU (backend/cache.py) in front of a cache shared by every
+# worker: Redis when REDIS_URL is set, the local file cache otherwise.
+REDIS_URL = config('REDIS_URL', default='')
 CACHES_DIR = os.path.join(BASE_DIR,'cache')
+# The per-process tier hears about writes from other workers over Redis
+# pub/sub. Without REDIS_URL it only hears its own process, so another
+# worker may serve a stale entry for up to LOCAL_CACHE_TIMEOUT seconds.
+# OTPs, the cached account columns behind permission checks and the token
+# blacklist state therefore skip the local tier and are always read from
+# the shared cache.
 CACHES = {
     'default': {
+        'BACKEND': 'backend.cache.TieredCache',
+        'LOCATION': 'default',
+        'OPTIONS': {
+            'SHARED_ALIAS': 'shared',
+            'MAX_ENTRIES': config('LOCAL_CACHE_MAX_ENTRIES', default=5000, cast=int),
+            'LOCAL_TIMEOUT': config('LOCAL_CACHE_TIMEOUT', default=30, cast=int),
+            'INVALIDATION_URL': REDIS_URL,
+            'SHARED_ONLY_PREFIXES': ['otp_', 'auth_user_', 'token_blacklist_'],
+            'METRIC_PREFIXES': ['post_list', 'post_detail', 'follow_state', 'otp'],
+        },
+    },
+    'shared': {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    } if REDIS_URL else {
         'BACKEND': 'django.core.cache.backends.filebased.FileBasedCache',
         'LOCATION': CACHES_DIR,
-    }
-}
\ No newline at end of file
+    },
+}
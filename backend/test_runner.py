@@ -0,0 +1,47 @@
+import copy
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.db import connections
+from django.test.runner import DiscoverRunner
+from django.test.utils import override_settings
+
+
+class TestRunner(DiscoverRunner):
+    """
+    Runs replica aliases on their mirror's connection.
+
+    Replicas are test mirrors of 'default' (see settings.py), but on a
+    connection of their own they would not see rows written inside a
+    TestCase transaction. Queries are still routed, logged and allowed or
+    forbidden per alias, so tests can check what went to a replica.
+
+    Files written during the run (avatars, uploads, and file cache entries
+    from tests that keep the configured CACHES) go to a temporary directory
+    that is removed afterwards, never into the source tree.
+    """
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        self.files_root = tempfile.mkdtemp(prefix='test-files-')
+        caches = copy.deepcopy(settings.CACHES)
+        for cache in caches.values():
+            if cache['BACKEND'].endswith('.FileBasedCache'):
+                cache['LOCATION'] = os.path.join(self.files_root, 'cache')
+        self.file_settings = override_settings(MEDIA_ROOT=os.path.join(self.files_root, 'media'), CACHES=caches)
+        self.file_settings.enable()
+
+    def teardown_test_environment(self, **kwargs):
+        self.file_settings.disable()
+        shutil.rmtree(self.files_root, ignore_errors=True)
+        super().teardown_test_environment(**kwargs)
+
+    def setup_databases(self, **kwargs):
+        old_config = super().setup_databases(**kwargs)
+        for alias in settings.REPLICA_DATABASES:
+            primary = connections[connections[alias].settings_dict['TEST']['MIRROR']]
+            primary.ensure_connection()
+            connections[alias].connection = primary.connection
+        return old_config
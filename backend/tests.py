@@ -0,0 +1,275 @@
+from datetime import date
+from unittest import mock, skipUnless
+
+from django.conf import settings
+from django.core.cache import cache, caches
+from django.db import close_old_connections, connection, connections, router
+from django.test import SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from blog.models import Post
+from user.auth import ClaimsRefreshToken
+from user.models import CustomUser
+
+from .db import connection_metrics
+from .metrics import endpoint_metrics, reset_endpoint_metrics
+from .db.sqlite3.base import DatabaseWrapper as SQLiteWrapper
+
+
+def tiered(location, **options):
+    return {
+        'BACKEND': 'backend.cache.TieredCache',
+        'LOCATION': location,
+        'OPTIONS': {
+            'SHARED_ALIAS': 'shared', 'SHARED_ONLY_PREFIXES': ['otp_'], 'METRIC_PREFIXES': ['post_list', 'otp'],
+            **options,
+        },
+    }
+
+
+# Two tiered caches over one shared LocMemCache stand in for two worker
+# processes talking to the same Redis.
+@override_settings(CACHES={
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'tiered-tests'},
+    'worker_a': tiered('worker_a'),
+    'worker_b': tiered('worker_b', MAX_ENTRIES=3),
+})
+class TieredCacheTests(SimpleTestCase):
+
+    def setUp(self):
+        self.a = caches['worker_a']
+        self.b = caches['worker_b']
+        self.a.clear()
+        self.a.store.stats.clear()
+        self.b.store.stats.clear()
+
+    def test_reads_fall_through_then_stay_local(self):
+        self.a.set('post_list_1', 'page')
+        self.assertEqual(self.b.get('post_list_1'), 'page')
+        self.assertEqual(self.b.get('post_list_1'), 'page')
+        self.assertEqual(self.b.get('post_list_2'), None)
+        self.assertEqual(self.b.metrics(), {'post_list': {'local_hits': 1, 'shared_hits': 1, 'misses': 1}})
+
+    def test_writes_invalidate_other_processes(self):
+        self.a.set('post_list_x', 'old')
+        self.b.get('post_list_x')
+        self.a.set('post_list_x', 'new')
+        self.assertEqual(self.b.get('post_list_x'), 'new')
+        self.a.delete('post_list_x')
+        self.assertIsNone(self.b.get('post_list_x'))
+
+    def test_shared_only_keys_skip_the_local_tier(self):
+        self.a.set('otp_x', '111111')
+        self.assertEqual(self.b.get('otp_x'), '111111')
+        caches['shared'].delete('otp_x')  # A broadcast that never arrives, as between processes without Redis
+        self.assertIsNone(self.a.get('otp_x'))
+        self.assertIsNone(self.b.get('otp_x'))
+        self.assertNotIn(self.a.make_key('otp_x'), self.a.store.entries)
+        self.assertEqual(self.b.metrics(), {'otp': {'local_hits': 0, 'shared_hits': 1, 'misses': 1}})
+
+    def test_local_tier_is_bounded(self):
+        for i in range(5):
+            self.b.set(f'key_{i}', i)
+        self.assertEqual(list(self.b.store.entries), [self.b.make_key(f'key_{i}') for i in range(2, 5)])
+        self.assertEqual(self.b.get('key_0'), 0)  # Still in the shared tier
+
+    def test_local_entries_expire(self):
+        self.a.set('post_list_y', 'old')
+        self.b.get('post_list_y')
+        caches['shared'].set('post_list_y', 'new')  # A write whose broadcast was lost
+        with mock.patch('backend.cache.time.monotonic', return_value=10 ** 9):
+            self.assertEqual(self.b.get('post_list_y'), 'new')
+
+    def test_incr_goes_to_the_shared_tier(self):
+        self.a.set('counter', 1)
+        self.b.get('counter')
+        self.a.incr('counter')
+        self.assertEqual(self.b.get('counter'), 2)
+
+    async def test_async_reads_and_writes(self):
+        await self.a.aset('post_list_3', 'page')
+        self.assertEqual(await self.b.aget('post_list_3'), 'page')
+        self.assertEqual(await self.b.aget('post_list_3'), 'page')
+        await self.a.aset('post_list_3', 'newer')
+        self.assertEqual(await self.b.aget('post_list_3'), 'newer')
+        self.assertEqual(self.b.metrics(), {'post_list': {'local_hits': 1, 'shared_hits': 2, 'misses': 0}})
+
+
+class ConnectionReuseTests(TransactionTestCase):
+
+    def acquired(self, alias='default'):
+        return connection_metrics().get(alias, {}).get('acquired', 0)
+
+    def test_connections_are_reused_across_requests(self):
+        self.assertGreater(connection.settings_dict['CONN_MAX_AGE'], 0)
+        self.client.get('/api/blog/posts/')
+        raw_connection, acquired = connection.connection, self.acquired()
+        for _ in range(3):
+            # The test client skips the handler's connection cleanup; run it
+            # as a real request would.
+            close_old_connections()
+            self.client.get('/api/blog/posts/')
+            close_old_connections()
+        self.assertIs(connection.connection, raw_connection)
+        self.assertEqual(self.acquired(), acquired)
+
+    def test_new_connections_are_timed(self):
+        wrapper = SQLiteWrapper({**connection.settings_dict, 'NAME': ':memory:'}, alias='probe')
+        wrapper.ensure_connection()
+        wrapper.ensure_connection()  # Already open
+        self.assertEqual(self.acquired('probe'), 1)
+        self.assertGreater(connection_metrics()['probe']['total_ms'], 0)
+        wrapper.close()
+
+
+@skipUnless(settings.REPLICA_DATABASES, "Set DATABASE_REPLICA_URLS to test replica routing.")
+@override_settings(CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+class ReplicaRoutingTests(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        cls.reader = CustomUser.objects.create_user(username='reader', email='reader@example.com', password='x')
+        cls.post = Post.objects.create(title='Post', content='Body', author=cls.author, date_posted=date(2025, 1, 1))
+
+    def setUp(self):
+        cache.clear()
+
+    def client_for(self, user):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {AccessToken.for_user(user)}')
+        return client
+
+    def databases_used(self, client, method, url, **kwargs):
+        replica = settings.REPLICA_DATABASES[0]
+        with CaptureQueriesContext(connections['default']) as on_primary, \
+                CaptureQueriesContext(connections[replica]) as on_replica:
+            response = getattr(client, method)(url, **kwargs)
+        self.assertLess(response.status_code, 400)
+        return {alias for alias, queries in (('default', on_primary), ('replica', on_replica)) if len(queries)}
+
+    def test_reads_go_to_a_replica(self):
+        self.assertEqual(self.databases_used(APIClient(), 'get', f'/api/blog/posts/{self.post.pk}/comments/'), {'replica'})
+        self.assertEqual(self.databases_used(self.client_for(self.reader), 'get', f'/api/user/profile/{self.author.pk}/'), {'replica'})
+
+    def test_writers_read_their_own_writes(self):
+        author = self.client_for(self.author)
+        url = f'/api/blog/posts/{self.post.pk}/comments/'
+        self.assertEqual(self.databases_used(author, 'post', f'{url}add/', data={'content': 'Hi'}, format='json'), {'default'})
+        self.assertEqual(self.databases_used(author, 'get', url), {'default'})
+        self.assertEqual(self.databases_used(self.client_for(self.reader), 'get', url), {'replica'})
+
+        cache.clear()  # The pin expires
+        self.assertEqual(self.databases_used(author, 'get', url), {'replica'})
+
+    def test_cache_fills_after_a_write_read_the_primary(self):
+        self.client_for(self.author).post('/api/blog/posts/create/', {'title': 'New', 'content': 'Body'}, format='json')
+        self.assertEqual(self.databases_used(APIClient(), 'get', '/api/blog/posts/'), {'default'})
+
+    def test_reads_outside_requests_use_the_primary(self):
+        self.assertEqual(router.db_for_read(Post), 'default')
+
+
+@override_settings(CACHES={
+    'default': tiered('request-metrics', METRIC_PREFIXES=['post_detail']),
+    'shared': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'request-metrics-tests'},
+}, SERVER_TIMING=True)
+class RequestMetricsTests(TestCase):
+    databases = '__all__'
+
+    @classmethod
+    def setUpTestData(cls):
+        author = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        cls.staff = CustomUser.objects.create_user(username='staff', email='staff@example.com', password='x', is_staff=True)
+        cls.admin = CustomUser.objects.create_user(username='admin', email='admin@example.com', password='x', is_admin=True)
+        cls.post = Post.objects.create(title='Post', content='Body', author=author, date_posted=date(2025, 1, 1))
+
+    def setUp(self):
+        cache.clear()
+        reset_endpoint_metrics()
+        self.client = APIClient()
+
+    def test_requests_are_recorded_per_view(self):
+        first = self.client.get(f'/api/blog/posts/{self.post.pk}/')
+        self.client.get(f'/api/blog/posts/{self.post.pk}/')  # Served from the local cache tier
+        self.client.get('/nowhere/')
+
+        stats = endpoint_metrics()['blog.views.post_detail']
+        self.assertEqual(stats['count'], 2)
+        self.assertGreaterEqual(stats['queries'], 1)
+        self.assertEqual(stats['cache'], {'misses': 2, 'local_hits': 1})  # Entry and feed version, then the entry
+        self.assertEqual(stats['response_bytes'], 2 * len(first.content))
+        self.assertEqual(endpoint_metrics()['unmatched']['count'], 1)
+        self.assertRegex(first['Server-Timing'], r'^app;dur=[\d.]+, db;dur=[\d.]+;desc="\d+ queries", cache;desc="\d+ hits \d+ misses"$')
+
+    def test_prometheus_endpoint_is_admin_only(self):
+        self.client.get(f'/api/blog/posts/{self.post.pk}/comments/')
+        self.assertEqual(self.client.get('/metrics/').status_code, 401)
+        self.client.force_authenticate(self.staff)  # is_staff is Django's admin site flag, not the app's
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+
+        self.client.force_authenticate(None)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {ClaimsRefreshToken.for_user(self.admin).access_token}')
+        body = self.client.get('/metrics/').content.decode()
+        self.assertIn('# TYPE http_request_duration_seconds summary', body)
+        self.assertIn('http_request_duration_seconds_count{view="get_comments"} 1', body)
+        self.assertRegex(body, r'db_queries_total\{view="get_comments"\} [1-9]')
+
+        # The token still says admin, but the account no longer is
+        self.admin.is_admin = False
+        self.admin.save()
+        self.assertEqual(self.client.get('/metrics/').status_code, 403)
+
+
+@override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache', 'LOCATION': 'ratelimit-tests'}},
+    RATE_LIMITS={'login': {'ip': '3/m', 'username': '2/m'}},
+)
+class RateLimitTests(TestCase):
+    databases = '__all__'  # Reads may be routed to a replica
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def login(self, username, **extra):
+        return self.client.post('/api/user/login/', {'username': username, 'password': 'wrong'}, format='json', **extra)
+
+    def test_limits_per_field_and_per_ip(self):
+        self.assertEqual(self.login('alice').status_code, 401)
+        self.assertEqual(self.login('Alice').status_code, 401)  # Same key, case-insensitively
+        response = self.login('alice')
+        self.assertEqual(response.status_code, 429)
+        self.assertGreaterEqual(int(response['Retry-After']), 29)  # One request every 30s after the burst
+
+        self.assertEqual(self.login('bob', REMOTE_ADDR='10.0.0.2').status_code, 401)
+        self.assertEqual(self.login('carol').status_code, 429)  # 127.0.0.1 has used its 3/m
+
+    @override_settings(RATE_LIMIT_PROXY_COUNT=1)
+    def test_client_ip_from_the_trusted_proxy(self):
+        for i in range(3):
+            self.login(f'user{i}', HTTP_X_FORWARDED_FOR='1.2.3.4, 10.0.0.9')
+        self.assertEqual(self.login('user4', HTTP_X_FORWARDED_FOR='1.2.3.4, 10.0.0.9').status_code, 429)
+        # Only the entry the proxy appended counts, not what the client sent
+        self.assertEqual(self.login('user5', HTTP_X_FORWARDED_FOR='1.2.3.4, 10.0.0.8').status_code, 401)
+
+    def test_defaults_to_no_proxy(self):
+        # A client connecting directly can't dodge the limit with a forged header
+        for i in range(3):
+            self.login(f'user{i}', HTTP_X_FORWARDED_FOR=f'1.2.3.{i}')
+        self.assertEqual(self.login('user3', HTTP_X_FORWARDED_FOR='5.6.7.8').status_code, 429)
+        self.assertEqual(self.login('user4', REMOTE_ADDR='10.0.0.2').status_code, 401)
+
+    def test_load_shedding(self):
+        with self.settings(LOAD_SHED_EXPENSIVE_INFLIGHT=0):
+            response = self.login('alice')
+            self.assertEqual(response.status_code, 503)
+            self.assertEqual(response['Retry-After'], '1')
+            self.assertEqual(self.client.get('/api/blog/posts/').status_code, 200)
+        with self.settings(LOAD_SHED_MAX_INFLIGHT=0), CaptureQueriesContext(connection) as queries:
+            self.assertEqual(self.client.get('/api/blog/posts/').status_code, 503)
+        self.assertEqual(len(queries), 0)
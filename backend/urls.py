@@ -1,9 +1,15 @@
 from django.contrib import admin
 from django.urls import path,include
+from backend import views
+from blog.views import serve_post_image
+from user.views import serve_avatar
 
 
 urlpatterns = [
     path('admin/', admin.site.urls),
+    path('metrics/', views.metrics, name='metrics'),
     path('api/user/', include('user.urls')),
     path('api/blog/', include('blog.urls')),
+    path('media/avatars/<path:path>', serve_avatar, name='serve_avatar'),
+    path('media/posts/<path:path>', serve_post_image, name='serve_post_image'),
 ] 
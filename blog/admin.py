@@ -1,11 +1,11 @@
 from django.contrib import admin
-from .models import Post, Comment
+from .models import Post, Comment, BackfillJob, FanoutJob, PostImage
 from django.utils.html import format_html
 
 
 @admin.register(Post)
 class PostAdmin(admin.ModelAdmin):
-    list_display = ('title', 'author', 'date_posted', 'image_url_preview')
+    list_display = ('title', 'author', 'date_posted', 'comment_count', 'image_url_preview')
     list_filter = ('date_posted', 'author')
     search_fields = ('title', 'content', 'author__username')
     ordering = ('-date_posted',)
@@ -22,3 +22,22 @@ class CommentAdmin(admin.ModelAdmin):
     list_filter = ('date_posted', 'author')
     search_fields = ('post__title', 'author__username')
     ordering = ('-date_posted',)
+
+
+@admin.register(FanoutJob)
+class FanoutJobAdmin(admin.ModelAdmin):
+    list_display = ('post', 'created_at')
+    ordering = ('created_at',)
+
+
+@admin.register(BackfillJob)
+class BackfillJobAdmin(admin.ModelAdmin):
+    list_display = ('owner', 'author', 'created_at')
+    ordering = ('created_at',)
+
+
+@admin.register(PostImage)
+class PostImageAdmin(admin.ModelAdmin):
+    list_display = ('post', 'status', 'width', 'height', 'uploaded_at', 'processed_at')
+    list_filter = ('status',)
+    ordering = ('-uploaded_at',)
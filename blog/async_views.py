@@ -0,0 +1,105 @@
+"""
+Native async versions of the read-heavy blog endpoints.
+
+Served under ASGI, a request waiting on the cache or the database yields the
+event loop instead of holding a whole worker. The URLs live under /api/blog/async/
+next to their sync twins and return the same JSON, so clients can switch one
+endpoint at a time (see the bench_async command for the side-by-side numbers).
+"""
+from django.core.cache import cache
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import require_GET
+from rest_framework.exceptions import NotFound
+from rest_framework.renderers import JSONRenderer
+
+from backend.conditional import not_modified
+from backend.replicas import primary_reads
+from .models import Post, Comment
+from .serializers import PostSerializer, PostDetailSerializer, CommentSerializer
+from .pagination import PostFeedPagination, CommentThreadPagination
+from .cache import acache_entry, apost_list_version, entry_response, post_detail_key, post_list_key, recently_invalidated
+from .queryplan import sparse_fieldset, sparse_signature
+from .views import COMMENT_FIELDS
+
+
+def json_response(data, status=200):
+    # Same renderer as the DRF views, so dates and decimals come out identical
+    return HttpResponse(JSONRenderer().render(data), content_type='application/json', status=status)
+
+
+def not_found(detail="Not found."):
+    return JsonResponse({"detail": detail}, status=404)
+
+
+@require_GET
+async def post_list(request):
+    """
+    List posts newest first, one cursor page at a time.
+    """
+    paginator = PostFeedPagination()
+    context = {'sparse': sparse_fieldset(request)}  # ?fields=, ?exclude=, ?expand=
+    try:
+        cursor = paginator.get_cursor(request, Post)  # Validated before it goes into a cache key
+    except NotFound as e:
+        return not_found(e.detail)
+    version = await apost_list_version()
+    cache_key = post_list_key(
+        cursor, paginator.get_page_size(request), version, sparse_signature(context['sparse']),
+    )
+    entry = await cache.aget(cache_key)  # Cached pages are already rendered JSON
+
+    if entry is None:  # If not cached, fetch from the database
+        try:
+            with primary_reads(recently_invalidated(version)):
+                posts = await paginator.apaginate_queryset(PostSerializer.plan_queryset(Post.objects.all(), context), request)
+        except NotFound as e:
+            return not_found(e.detail)
+        validators = PostSerializer.http_validators(posts, paginator.next_cursor, list_version=version)
+        unchanged = not_modified(request, *validators)
+        if unchanged is not None:
+            return unchanged  # The client's copy is current, skip serializing
+        serializer = PostSerializer(posts, many=True, context=context)
+        entry = await acache_entry(cache_key, paginator.get_paginated_data(serializer.data), *validators)
+
+    return entry_response(request, entry)
+
+
+@require_GET
+async def post_detail(request, pk):
+    """
+    Retrieve a specific post.
+    """
+    context = {'sparse': sparse_fieldset(request)}
+    shape = sparse_signature(context['sparse'])
+    cache_key = post_detail_key(pk, shape, shape and await apost_list_version())
+    entry = await cache.aget(cache_key)  # Cached posts are already rendered JSON
+
+    if entry is None:  # If not cached, fetch from the database
+        try:
+            with primary_reads(recently_invalidated(await apost_list_version())):
+                post = await PostDetailSerializer.plan_queryset(Post.objects.all(), context).aget(pk=pk)
+        except Post.DoesNotExist:
+            return not_found()
+        validators = PostDetailSerializer.http_validators([post])
+        unchanged = not_modified(request, *validators)
+        if unchanged is not None:
+            return unchanged
+        entry = await acache_entry(cache_key, PostDetailSerializer(post, context=context).data, *validators)
+
+    return entry_response(request, entry)
+
+
+@require_GET
+async def get_comments(request, pk):
+    """
+    A post's comments, oldest first, one cursor page at a time.
+    """
+    paginator = CommentThreadPagination()
+    context = {'sparse': sparse_fieldset(request)}
+    comments = CommentSerializer.plan_queryset(Comment.objects.filter(post_id=pk).only(*COMMENT_FIELDS), context)
+    try:
+        page = await paginator.apaginate_queryset(comments, request)
+    except NotFound as e:
+        return not_found(e.detail)
+    serializer = CommentSerializer(page, many=True, context=context)
+    return json_response(paginator.get_paginated_data(serializer.data))
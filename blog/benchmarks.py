@@ -0,0 +1,233 @@
+"""
+Reproducible API benchmarks.
+
+seed() fills a database with a synthetic community. Follower counts follow
+a power law, and posts and comments cluster on the popular accounts and
+threads. The SCENARIOS replay scripted traffic through the Django test
+client in process, so a run needs no server and measures only the app. Each
+scenario reports latency percentiles and, from backend.metrics, queries
+per request. The run_benchmarks command writes the report as JSON and diffs
+it against an earlier one.
+"""
+import random
+import statistics
+import time
+from datetime import date, timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.core.cache import cache
+from rest_framework.test import APIClient
+
+from backend.metrics import endpoint_metrics, reset_endpoint_metrics
+from user.avatars import avatar_url
+from user.counters import reconcile_counters
+from user.models import CustomUser
+from .content import apply_rendered
+from .models import Post, Comment
+from .search import get_search_backend
+from .timeline import fan_out
+
+USERNAME_PREFIX = 'bench_'
+PASSWORD = 'Bench@1234'
+ZIPF_EXPONENT = 1.1
+WORDS = (
+    'django query cache index replica latency cursor timeline follower comment post feed profile '
+    'garden coffee travel music design python postgres redis worker async signal counter search '
+    'morning weekend story photo recipe city river mountain book film idea note draft update'
+).split()
+
+
+def percentile(sorted_values, pct):
+    index = min(len(sorted_values) - 1, int(round(pct / 100 * (len(sorted_values) - 1))))
+    return sorted_values[index]
+
+
+def zipf_weights(n, exponent=ZIPF_EXPONENT):
+    return [1 / rank ** exponent for rank in range(1, n + 1)]
+
+
+def sentence(rng, low, high):
+    return ' '.join(rng.choice(WORDS) for _ in range(rng.randint(low, high)))
+
+
+def seed(users=200, posts=1000, comments=5000, follows=10, rng_seed=42, batch_size=1000):
+    """
+    Create the synthetic data set and return the user ids, most popular first.
+
+    Rows go in with bulk_create, which skips the signal handlers, so the
+    counters, search index and timelines are rebuilt afterwards.
+    """
+    rng = random.Random(rng_seed)
+    password = make_password(PASSWORD)  # Hash once, not once per user
+
+    CustomUser.objects.bulk_create([
+        CustomUser(
+            username=f'{USERNAME_PREFIX}{i}', email=f'{USERNAME_PREFIX}{i}@example.com', password=password,
+            image=avatar_url(f'{USERNAME_PREFIX}{i}'),
+        )
+        for i in range(users)
+    ], batch_size=batch_size)
+    user_ids = list(
+        CustomUser.objects.filter(username__startswith=USERNAME_PREFIX).order_by('pk').values_list('pk', flat=True)
+    )
+    user_weights = zipf_weights(len(user_ids))
+
+    # Each user follows ~`follows` accounts, picked by popularity
+    Follow = CustomUser.followers.through
+    edges = set()
+    for follower_id in user_ids:
+        count = max(1, round(rng.expovariate(1 / follows)))
+        for author_id in rng.choices(user_ids, user_weights, k=count):
+            if author_id != follower_id:
+                edges.add((author_id, follower_id))
+    Follow.objects.bulk_create(
+        [Follow(from_customuser_id=author_id, to_customuser_id=follower_id) for author_id, follower_id in sorted(edges)],
+        batch_size=batch_size, ignore_conflicts=True,
+    )
+
+    today = date.today()
+    Post.objects.bulk_create([
+        apply_rendered(Post(
+            author_id=author_id, title=sentence(rng, 3, 8).capitalize(), content=sentence(rng, 40, 120),
+            date_posted=today - timedelta(days=rng.randrange(365)),
+        ))
+        for author_id in rng.choices(user_ids, user_weights, k=posts)
+    ], batch_size=batch_size)
+
+    post_ids = list(Post.objects.filter(author_id__in=user_ids).values_list('pk', flat=True))
+    rng.shuffle(post_ids)  # Hot threads are spread over the authors
+    Comment.objects.bulk_create([
+        Comment(post_id=post_id, author_id=rng.choice(user_ids), content=sentence(rng, 5, 30))
+        for post_id in rng.choices(post_ids, zipf_weights(len(post_ids)), k=comments)
+    ], batch_size=batch_size)
+
+    reconcile_counters(batch_size)
+    get_search_backend().rebuild()
+    for post in Post.objects.filter(author_id__in=user_ids).select_related('author').iterator():
+        fan_out(post)
+    return list(user_ids)
+
+
+class BenchRun:
+    """Times the requests of one scenario."""
+
+    def __init__(self, user_ids, rng):
+        self.user_ids = user_ids
+        self.rng = rng
+        self.users = CustomUser.objects.in_bulk(user_ids)
+        self.clients = {}
+        self.latencies = []
+        self.errors = 0
+
+    def popular_user(self):
+        return self.rng.choices(self.user_ids, zipf_weights(len(self.user_ids)))[0]
+
+    def random_user(self):
+        return self.rng.choice(self.user_ids)
+
+    def call(self, user_id, method, url, **kwargs):
+        client = self.clients.get(user_id)
+        if client is None:
+            client = self.clients[user_id] = APIClient()
+            if user_id is not None:
+                client.force_authenticate(self.users[user_id])
+        start = time.perf_counter()
+        response = getattr(client, method)(url, format='json', **kwargs)
+        self.latencies.append(time.perf_counter() - start)
+        if response.status_code >= 400:
+            self.errors += 1
+        return response
+
+
+def feed_reads(run, requests):
+    """Anonymous readers paging through the feed, and users opening their timeline."""
+    cursor = None
+    for i in range(requests):
+        if i % 2:
+            run.call(run.random_user(), 'get', '/api/blog/timeline/')
+            continue
+        response = run.call(None, 'get', '/api/blog/posts/', data={'cursor': cursor} if cursor else None)
+        cursor = response.json().get('next') if response.status_code == 200 else None
+
+
+def profile_views(run, requests):
+    """Profile and summary views, mostly of popular accounts."""
+    for i in range(requests):
+        target = run.popular_user()
+        suffix = 'summary/' if i % 4 == 3 else ''
+        run.call(run.random_user(), 'get', f'/api/user/profile/{target}/{suffix}')
+
+
+def follow_storm(run, requests):
+    """Many users following and then unfollowing the most popular account."""
+    celebrity = run.user_ids[0]
+    followers = set(CustomUser.followers.through.objects.filter(from_customuser_id=celebrity).values_list('to_customuser_id', flat=True))
+    fans = [pk for pk in run.user_ids[1:] if pk not in followers] or run.user_ids[1:]
+    for i in range(requests):
+        fan = fans[(i // 2) % len(fans)]
+        action = 'follow' if fan not in followers else 'unfollow'
+        run.call(fan, 'post', f'/api/user/{action}/{celebrity}/')
+        followers ^= {fan}
+
+
+def comment_burst(run, requests):
+    """A thread going viral: new comments interleaved with readers reloading it."""
+    post_id = Post.objects.order_by('-comment_count', 'pk').values_list('pk', flat=True).first()
+    for i in range(requests):
+        if i % 4 == 3:
+            run.call(None, 'get', f'/api/blog/posts/{post_id}/comments/')
+        else:
+            run.call(run.random_user(), 'post', f'/api/blog/posts/{post_id}/comments/add/', data={'content': sentence(run.rng, 5, 20)})
+
+
+SCENARIOS = {
+    'feed_reads': feed_reads,
+    'profile_views': profile_views,
+    'follow_storm': follow_storm,
+    'comment_burst': comment_burst,
+}
+
+
+def run_scenario(name, user_ids, requests=200, rng_seed=42):
+    run = BenchRun(user_ids, random.Random(rng_seed))
+    cache.clear()  # Every scenario starts cold
+    reset_endpoint_metrics()
+
+    start = time.perf_counter()
+    SCENARIOS[name](run, requests)
+    elapsed = time.perf_counter() - start
+
+    views = endpoint_metrics()
+    handled = sum(stats['count'] for stats in views.values()) or 1
+    latencies = sorted(run.latencies)
+    return {
+        'requests': len(latencies),
+        'errors': run.errors,
+        'requests_per_second': round(len(latencies) / elapsed, 1),
+        'mean_ms': round(statistics.fmean(latencies) * 1000, 2),
+        'p50_ms': round(percentile(latencies, 50) * 1000, 2),
+        'p95_ms': round(percentile(latencies, 95) * 1000, 2),
+        'p99_ms': round(percentile(latencies, 99) * 1000, 2),
+        'queries_per_request': round(sum(stats['queries'] for stats in views.values()) / handled, 2),
+        'db_ms_per_request': round(sum(stats['db_seconds'] for stats in views.values()) * 1000 / handled, 2),
+        'views': {
+            view: {'requests': stats['count'], 'queries_per_request': round(stats['queries'] / stats['count'], 2)}
+            for view, stats in sorted(views.items())
+        },
+    }
+
+
+COMPARED_METRICS = ('p50_ms', 'p95_ms', 'p99_ms', 'queries_per_request')
+
+
+def compare(old, new):
+    """(scenario, metric, old, new, % change) for the scenarios both reports ran."""
+    rows = []
+    for name, result in new['scenarios'].items():
+        before = old.get('scenarios', {}).get(name)
+        if before is None:
+            continue
+        for metric in COMPARED_METRICS:
+            change = (result[metric] - before[metric]) / before[metric] * 100 if before[metric] else 0.0
+            rows.append((name, metric, before[metric], result[metric], round(change, 1)))
+    return rows
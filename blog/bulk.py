@@ -0,0 +1,121 @@
+"""
+NDJSON bulk ingest and export of posts.
+
+ingest_posts() reads one JSON post per line and works through them
+BULK_INGEST_BATCH_SIZE at a time. Each row is validated with PostSerializer,
+the valid ones go in with a single bulk_create, and the work the post
+signals would have done (post_count, search index, fan-out jobs) plus the
+feed cache invalidation happens once per batch. Rejected rows are reported
+by line number and skipped.
+
+export_lines() streams posts, each followed by its comments, reading both
+tables through server-side cursors so memory stays flat however large the
+export gets.
+"""
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from user.models import CustomUser
+from .cache import invalidate_post_list
+from .content import apply_rendered
+from .models import Post, Comment, FanoutJob
+from .search import get_search_backend
+from .serializers import PostSerializer
+
+NDJSON_CONTENT_TYPE = 'application/x-ndjson'
+EXPORT_CHUNK_SIZE = 2000
+POST_EXPORT_FIELDS = ('id', 'author', 'title', 'content', 'date_posted', 'image_url')
+COMMENT_EXPORT_FIELDS = ('id', 'post', 'author', 'content', 'date_posted')
+
+
+def parse_lines(lines):
+    """(line number, row, errors) for every non-blank line; row is None when errors isn't."""
+    for number, line in enumerate(lines, start=1):
+        if not line.strip():
+            continue
+        try:
+            row = json.loads(line)
+        except ValueError:  # Also covers undecodable bytes
+            yield number, None, {'non_field_errors': ['Invalid JSON.']}
+            continue
+        if not isinstance(row, dict) or row.get('type', 'post') != 'post':
+            yield number, None, {'non_field_errors': ['Expected a post object.']}
+            continue
+        yield number, row, None
+
+
+def validate_rows(rows, author):
+    """Split a batch of parsed lines into unsaved posts and per-line errors."""
+    posts, errors = [], []
+    today = timezone.now().date()
+    for number, row, row_errors in rows:
+        if row_errors is None:
+            # Like create_post, unless the row keeps its original date
+            serializer = PostSerializer(data={'date_posted': today, **row})
+            if serializer.is_valid():
+                # bulk_create skips Post.save(), which renders the content
+                posts.append(apply_rendered(Post(author_id=author.pk, **serializer.validated_data)))
+                continue
+            row_errors = serializer.errors
+        errors.append({'line': number, 'errors': row_errors})
+    return posts, errors
+
+
+def save_batch(posts, author):
+    with transaction.atomic():  # Rows, counters and fan-out jobs commit together
+        posts = Post.objects.bulk_create(posts)
+        CustomUser.objects.filter(pk=author.pk).update(
+            post_count=F('post_count') + len(posts), updated_at=timezone.now(),
+        )
+        FanoutJob.objects.bulk_create([FanoutJob(post=post) for post in posts])
+        get_search_backend().index_posts(posts)
+    invalidate_post_list()
+    return posts
+
+
+def ingest_posts(lines, author, batch_size=None):
+    """
+    Create posts by ``author`` from an iterable of NDJSON lines.
+
+    Returns ``{'created', 'failed', 'errors'}``, where each error carries the
+    line number and the serializer errors for that line.
+    """
+    batch_size = batch_size or settings.BULK_INGEST_BATCH_SIZE
+    report = {'created': 0, 'failed': 0, 'errors': []}
+    rows = parse_lines(lines)
+    while batch := list(islice(rows, batch_size)):
+        posts, errors = validate_rows(batch, author)
+        if posts:
+            report['created'] += len(save_batch(posts, author))
+        report['failed'] += len(errors)
+        report['errors'] += errors
+    return report
+
+
+def ndjson_line(kind, row):
+    return json.dumps({'type': kind, **row}, cls=DjangoJSONEncoder) + '\n'
+
+
+def export_lines(author_id=None, chunk_size=EXPORT_CHUNK_SIZE):
+    """NDJSON lines for every post (or ``author_id``'s posts), each followed by its comments."""
+    posts = Post.objects.order_by('pk')
+    comments = Comment.objects.order_by('post', 'pk')
+    if author_id is not None:
+        posts = posts.filter(author_id=author_id)
+        comments = comments.filter(post__author_id=author_id)
+
+    comments = comments.values(*COMMENT_EXPORT_FIELDS).iterator(chunk_size=chunk_size)
+    pending = next(comments, None)
+    for post in posts.values(*POST_EXPORT_FIELDS).iterator(chunk_size=chunk_size):
+        yield ndjson_line('post', post)
+        # Both cursors are ordered by post, so they advance together
+        while pending is not None and pending['post'] <= post['id']:
+            if pending['post'] == post['id']:
+                yield ndjson_line('comment', pending)
+            pending = next(comments, None)
@@ -0,0 +1,106 @@
+"""
+Response-level cache for the public post endpoints.
+
+Entries hold the final JSON bytes and their validators (ETag and
+Last-Modified, see backend/conditional.py), so a hit costs one cache read
+and never touches the ORM or the DRF serializers. The write paths call
+the ``invalidate_*`` helpers below.
+"""
+import time
+
+from django.conf import settings
+from django.core.cache import cache
+from django.http import HttpResponse
+from rest_framework.renderers import JSONRenderer
+
+from backend.conditional import not_modified, set_validators
+
+CACHE_TIMEOUT = 60 * 15  # 15 minutes
+
+# Every post_list page key embeds this version, so one write drops every
+# cached page at once without having to know which cursors were cached.
+POST_LIST_VERSION_KEY = 'post_list_version'
+
+
+def post_list_version():
+    version = cache.get(POST_LIST_VERSION_KEY)
+    if version is None:
+        # A fresh timestamp can never collide with pages cached under an
+        # older, evicted version.
+        version = time.time_ns()
+        cache.set(POST_LIST_VERSION_KEY, version, timeout=None)
+    return version
+
+
+async def apost_list_version():
+    version = await cache.aget(POST_LIST_VERSION_KEY)
+    if version is None:
+        version = time.time_ns()
+        await cache.aset(POST_LIST_VERSION_KEY, version, timeout=None)
+    return version
+
+
+def post_list_key(cursor, page_size, version=None, shape=''):
+    """``shape`` is the sparse_signature of the requested fields."""
+    if version is None:
+        version = post_list_version()
+    return f'post_list_json_{version}_{page_size}_{cursor or ""}_{shape}'
+
+
+def recently_invalidated(version):
+    """
+    Whether a post write happened within the replica sticky window. Cache
+    fills read from the primary then, so a lagging replica never gets frozen
+    into a cached entry.
+    """
+    return time.time_ns() - version < settings.REPLICA_STICKY_SECONDS * 10 ** 9
+
+
+def post_detail_key(pk, shape='', version=None):
+    """
+    Sparse shapes of a post can't all be deleted by key, so their entries
+    embed the post list version, which every post write moves on.
+    """
+    if not shape:
+        return f'post_detail_json_{pk}'
+    return f'post_detail_json_{pk}_{version}_{shape}'
+
+
+def render_entry(data, etag, last_modified):
+    return {
+        'body': JSONRenderer().render(data),
+        'etag': etag,
+        'last_modified': last_modified,
+    }
+
+
+def cache_entry(key, data, etag, last_modified):
+    """Render ``data`` to JSON once and store the bytes with their validators."""
+    entry = render_entry(data, etag, last_modified)
+    cache.set(key, entry, timeout=CACHE_TIMEOUT)
+    return entry
+
+
+async def acache_entry(key, data, etag, last_modified):
+    entry = render_entry(data, etag, last_modified)
+    await cache.aset(key, entry, timeout=CACHE_TIMEOUT)
+    return entry
+
+
+def entry_response(request, entry):
+    """Serve a cached entry, or a 304 if the client's copy is still current."""
+    etag, last_modified = entry['etag'], entry.get('last_modified')
+    response = not_modified(request, etag, last_modified)
+    if response is None:
+        response = set_validators(HttpResponse(entry['body'], content_type='application/json'), etag, last_modified)
+    return response
+
+
+def invalidate_post_list():
+    cache.set(POST_LIST_VERSION_KEY, time.time_ns(), timeout=None)
+
+
+def invalidate_posts(pks):
+    """Drop the detail entries for ``pks`` and every cached feed page."""
+    cache.delete_many([post_detail_key(pk) for pk in pks])
+    invalidate_post_list()
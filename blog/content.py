@@ -0,0 +1,56 @@
+"""
+Derived post content, computed when a post is saved.
+
+Post.save() (and bulk ingest, which bypasses it) stores an excerpt, the
+word count, the reading time and the body rendered to HTML. List payloads
+ship the excerpt instead of the whole article, and clients get HTML they can
+insert as is: the text is escaped before links and paragraphs are added,
+so nothing an author types comes through as markup.
+"""
+import math
+
+from django.utils.html import linebreaks, urlize
+from django.utils.text import Truncator
+
+EXCERPT_WORDS = 40
+EXCERPT_MAX_LENGTH = 400  # Characters; caps an excerpt made of very long "words"
+WORDS_PER_MINUTE = 200
+RENDERED_FIELDS = ('excerpt', 'word_count', 'reading_time', 'content_html')
+
+
+def render_content(text):
+    """The derived fields for a post body ``text``, as a dict of Post field values."""
+    words = text.split()
+    excerpt = Truncator(' '.join(words)).words(EXCERPT_WORDS, truncate='…')
+    return {
+        'excerpt': Truncator(excerpt).chars(EXCERPT_MAX_LENGTH, truncate='…'),
+        'word_count': len(words),
+        'reading_time': max(1, math.ceil(len(words) / WORDS_PER_MINUTE)),
+        'content_html': linebreaks(urlize(text, nofollow=True, autoescape=True)),
+    }
+
+
+def apply_rendered(post):
+    for field, value in render_content(post.content).items():
+        setattr(post, field, value)
+    return post
+
+
+def backfill_rendered_content(batch_size=500):
+    """Render the derived fields of every post; returns how many were updated."""
+    from django.utils import timezone
+
+    from .cache import invalidate_posts
+    from .models import Post
+
+    updated, last_pk = 0, 0
+    posts = Post.objects.order_by('pk').only('pk', 'content')
+    while batch := list(posts.filter(pk__gt=last_pk)[:batch_size]):
+        now = timezone.now()
+        for post in batch:
+            apply_rendered(post).updated_at = now  # The payload changes, so do the validators
+        Post.objects.bulk_update(batch, [*RENDERED_FIELDS, 'updated_at'])
+        invalidate_posts([post.pk for post in batch])
+        updated += len(batch)
+        last_pk = batch[-1].pk
+    return updated
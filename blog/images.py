@@ -0,0 +1,244 @@
+"""
+Post image uploads.
+
+upload_post_image() takes an upload that Django has already streamed to a
+temporary file in chunks, checks that it is an image, and moves it into
+storage as the post's original. A PostImage row in the pending state then
+waits for run_image_worker. The worker renders a WebP and a JPEG variant
+at each POST_IMAGE_WIDTHS width the original covers, plus a BlurHash
+placeholder, and points Post.image_url at the JPEG nearest
+POST_IMAGE_DEFAULT_WIDTH so clients that ignore the srcset still get a
+small file.
+
+Every upload gets a fresh directory, so a file never changes once written
+and serve_post_image (blog/views.py) can send it as immutable.
+
+The worker claims rows in a short transaction, marking them processing for
+CLAIM_LEASE, and renders outside it so a re-upload is never blocked behind
+a render. Each result is written only if the row still holds the same
+upload and lease; otherwise the render is discarded. A worker that dies
+mid-render leaves its rows to be claimed again when the lease runs out.
+"""
+import math
+import uuid
+from datetime import timedelta
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import transaction
+from django.db.models import Q
+from django.utils import timezone
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .cache import invalidate_posts
+from .models import Post, PostImage
+
+IMAGE_DIR = 'posts'
+IMAGE_MAX_AGE = 60 * 60 * 24 * 365
+UPLOAD_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+VARIANT_FORMATS = (('webp', 'WEBP', {'quality': 80, 'method': 4}), ('jpeg', 'JPEG', {'quality': 82, 'progressive': True, 'optimize': True}))
+
+CLAIM_LEASE = timedelta(minutes=5)
+
+BLURHASH_COMPONENTS = (4, 3)
+BLURHASH_SAMPLE = 32  # Placeholders are computed on a thumbnail this wide
+BASE83 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~'
+
+
+class InvalidImage(Exception):
+    pass
+
+
+def upload_post_image(post, upload):
+    """Store ``upload`` as ``post``'s original and queue it; raises InvalidImage."""
+    try:
+        with Image.open(upload) as image:  # Reads the header only
+            image_format, (width, height) = image.format, image.size
+    except (UnidentifiedImageError, Image.DecompressionBombError, OSError):
+        raise InvalidImage("Upload a JPEG, PNG, WebP or GIF image.")
+    if image_format not in UPLOAD_FORMATS:
+        raise InvalidImage("Upload a JPEG, PNG, WebP or GIF image.")
+    if width * height > settings.POST_IMAGE_MAX_PIXELS:
+        raise InvalidImage(f"Images may have at most {settings.POST_IMAGE_MAX_PIXELS} pixels.")
+
+    upload.seek(0)
+    # A temporary upload is moved into place rather than copied
+    original = default_storage.save(f'{IMAGE_DIR}/{post.pk}/{uuid.uuid4().hex}/original.{UPLOAD_FORMATS[image_format]}', upload)
+    previous = PostImage.objects.filter(post=post).first()
+    image, _ = PostImage.objects.update_or_create(post=post, defaults={
+        'original': original, 'status': PostImage.PENDING, 'width': width, 'height': height,
+        'variants': [], 'placeholder': '', 'last_error': '', 'processed_at': None, 'claimed_until': None,
+    })
+    if previous is not None:
+        transaction.on_commit(lambda: delete_image_files(previous))
+    return image
+
+
+def image_paths(image):
+    return [image.original] + [variant[name] for variant in image.variants for name, _, _ in VARIANT_FORMATS]
+
+
+def delete_image_files(image):
+    for path in image_paths(image):
+        default_storage.delete(path)
+
+
+def variant_widths(width):
+    """The POST_IMAGE_WIDTHS an original ``width`` px wide covers, never upscaled."""
+    widths = sorted(w for w in settings.POST_IMAGE_WIDTHS if w < width)
+    largest = min(width, max(settings.POST_IMAGE_WIDTHS))
+    return widths if largest in widths else widths + [largest]
+
+
+def render_variants(image, source):
+    directory = image.original.rsplit('/', 1)[0]
+    variants = []
+    for width in variant_widths(source.width):
+        resized = source.resize((width, max(1, round(source.height * width / source.width))), Image.LANCZOS)
+        variant = {'width': width}
+        for name, image_format, options in VARIANT_FORMATS:
+            out = BytesIO()
+            resized.save(out, format=image_format, **options)
+            variant[name] = default_storage.save(f'{directory}/{width}.{name}', ContentFile(out.getvalue()))
+        variants.append(variant)
+    return variants
+
+
+def fallback_variant(variants):
+    """The widest variant no wider than POST_IMAGE_DEFAULT_WIDTH, else the narrowest."""
+    fitting = [variant for variant in variants if variant['width'] <= settings.POST_IMAGE_DEFAULT_WIDTH]
+    return fitting[-1] if fitting else variants[0]
+
+
+def render_image(image):
+    """Render ``image``'s variants and placeholder into storage, without saving the row."""
+    with default_storage.open(image.original) as original, Image.open(original) as source:
+        source.draft('RGB', (max(settings.POST_IMAGE_WIDTHS),) * 2)  # JPEGs decode at a reduced scale
+        source = ImageOps.exif_transpose(source)
+        if source.mode != 'RGB':
+            # Variants are opaque, so flatten any transparency onto white
+            rgba = source.convert('RGBA')
+            source = Image.new('RGB', rgba.size, 'white')
+            source.paste(rgba, mask=rgba.getchannel('A'))
+        image.variants = render_variants(image, source)
+        image.placeholder = blurhash(source)
+
+
+def claim_images(limit):
+    now = timezone.now()
+    lease = now + CLAIM_LEASE
+    with transaction.atomic():
+        images = list(
+            PostImage.objects.select_for_update(skip_locked=True)
+            .filter(Q(status=PostImage.PENDING) | Q(status=PostImage.PROCESSING, claimed_until__lt=now))
+            .order_by('id')[:limit]
+        )
+        PostImage.objects.filter(pk__in=[image.pk for image in images]).update(
+            status=PostImage.PROCESSING, claimed_until=lease,
+        )
+    for image in images:
+        image.status, image.claimed_until = PostImage.PROCESSING, lease
+    return images
+
+
+def still_claimed(image):
+    """The row of ``image`` if it still holds this upload and this worker's lease."""
+    return PostImage.objects.filter(
+        pk=image.pk, status=PostImage.PROCESSING, original=image.original, claimed_until=image.claimed_until,
+    )
+
+
+def process_image(image):
+    """Render a claimed ``image`` and publish it; returns False if it was replaced meanwhile."""
+    render_image(image)
+    now = timezone.now()
+    with transaction.atomic():
+        published = still_claimed(image).update(
+            status=PostImage.READY, variants=image.variants, placeholder=image.placeholder,
+            processed_at=now, claimed_until=None,
+        )
+        if published:
+            Post.objects.filter(pk=image.post_id).update(
+                image_url=default_storage.url(fallback_variant(image.variants)['jpeg']), updated_at=now,
+            )
+    if not published:
+        # Re-uploaded, deleted or re-claimed while rendering; the original is not ours to delete
+        for path in image_paths(image)[1:]:
+            default_storage.delete(path)
+    return bool(published)
+
+
+def process_post_images(limit=10):
+    """Process up to ``limit`` pending uploads; returns how many were handled."""
+    images = claim_images(limit)
+    for image in images:
+        try:
+            process_image(image)
+        except Exception as e:  # A broken upload must not stall the queue
+            still_claimed(image).update(status=PostImage.FAILED, last_error=f"{type(e).__name__}: {e}", claimed_until=None)
+    if images:
+        invalidate_posts([image.post_id for image in images])
+    return len(images)
+
+
+def srcsets(image):
+    """``{'webp': ..., 'jpeg': ...}`` srcset strings for a processed image."""
+    return {
+        name: ', '.join(f"{default_storage.url(variant[name])} {variant['width']}w" for variant in image.variants)
+        for name, _, _ in VARIANT_FORMATS
+    }
+
+
+def _srgb_to_linear(value):
+    value /= 255
+    return value / 12.92 if value <= 0.04045 else ((value + 0.055) / 1.055) ** 2.4
+
+
+def _linear_to_srgb(value):
+    value = min(1.0, max(0.0, value))
+    return round(value * 12.92 * 255) if value <= 0.0031308 else round((1.055 * value ** (1 / 2.4) - 0.055) * 255)
+
+
+def _base83(value, length):
+    return ''.join(BASE83[value // 83 ** (length - i) % 83] for i in range(1, length + 1))
+
+
+def blurhash(image, components=BLURHASH_COMPONENTS):
+    """The BlurHash (https://blurha.sh) of an RGB image."""
+    x_components, y_components = components
+    sample = image.copy()
+    sample.thumbnail((BLURHASH_SAMPLE, BLURHASH_SAMPLE))
+    width, height = sample.size
+    linear = [tuple(map(_srgb_to_linear, pixel)) for pixel in sample.getdata()]
+
+    factors = []
+    for j in range(y_components):
+        column_basis = [math.cos(math.pi * j * y / height) for y in range(height)]
+        for i in range(x_components):
+            row_basis = [math.cos(math.pi * i * x / width) for x in range(width)]
+            scale = (1 if i == j == 0 else 2) / (width * height)
+            totals = [0.0, 0.0, 0.0]
+            for y in range(height):
+                for x in range(width):
+                    basis = row_basis[x] * column_basis[y]
+                    pixel = linear[y * width + x]
+                    for channel in range(3):
+                        totals[channel] += basis * pixel[channel]
+            factors.append([total * scale for total in totals])
+
+    dc, ac = factors[0], factors[1:]
+    result = _base83(x_components - 1 + (y_components - 1) * 9, 1)
+    if ac:
+        quantised_max = max(0, min(82, math.floor(max(abs(v) for factor in ac for v in factor) * 166 - 0.5)))
+        maximum = (quantised_max + 1) / 166
+    else:
+        quantised_max, maximum = 0, 1
+    result += _base83(quantised_max, 1)
+    r, g, b = map(_linear_to_srgb, dc)
+    result += _base83((r << 16) + (g << 8) + b, 4)
+    for factor in ac:
+        r, g, b = (max(0, min(18, math.floor(math.copysign(abs(v / maximum) ** 0.5, v) * 9 + 9.5))) for v in factor)
+        result += _base83(r * 19 * 19 + g * 19 + b, 2)
+    return result
@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from blog.content import backfill_rendered_content
+
+
+class Command(BaseCommand):
+    help = "Compute the excerpt, word count, reading time and HTML of existing posts."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Posts per UPDATE (default: 500).")
+
+    def handle(self, *args, **options):
+        updated = backfill_rendered_content(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"Rendered {updated} post(s)."))
@@ -0,0 +1,94 @@
+import statistics
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.benchmarks import percentile
+
+# (name, sync path, async path); {post} and {user} are filled from the options
+SCENARIOS = [
+    ('post_list', 'api/blog/posts/', 'api/blog/async/posts/'),
+    ('post_detail', 'api/blog/posts/{post}/', 'api/blog/async/posts/{post}/'),
+    ('get_comments', 'api/blog/posts/{post}/comments/', 'api/blog/async/posts/{post}/comments/'),
+    ('user_profile', 'api/user/profile/{user}/', 'api/user/async/profile/{user}/'),
+]
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare the sync and async read endpoints of a running server. Start the "
+        "same number of workers for both stacks, e.g. `gunicorn backend.wsgi -w 2` "
+        "and `gunicorn backend.asgi:application -w 2 -k uvicorn.workers.UvicornWorker`, "
+        "over a database filled by seed_bench_data."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--base-url', default='http://127.0.0.1:8000/', help="Server to benchmark (default: http://127.0.0.1:8000/).")
+        parser.add_argument('--sync-base-url', help="Serve the sync endpoints from a different server, e.g. a WSGI one.")
+        parser.add_argument('--concurrency', type=int, default=50, help="Requests in flight at once (default: 50).")
+        parser.add_argument('--requests', type=int, default=1000, help="Requests per scenario and stack (default: 1000).")
+        parser.add_argument('--workers', type=int, default=1, help="Server worker processes, to report throughput per worker (default: 1).")
+        parser.add_argument('--post', type=int, default=1, help="Post id for the detail and comment scenarios.")
+        parser.add_argument('--user', type=int, default=1, help="User id for the profile scenario.")
+        parser.add_argument('--token', default='', help="Access token; the profile scenario is skipped without one.")
+        parser.add_argument('--scenario', action='append', choices=[name for name, _, _ in SCENARIOS], help="Run only these scenarios.")
+
+    def fetch(self, url, token):
+        request = urllib.request.Request(url)
+        if token:
+            request.add_header('Authorization', f'Bearer {token}')
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request, timeout=30) as response:
+                response.read()
+                ok = response.status < 400
+        except (urllib.error.URLError, OSError):
+            ok = False
+        return time.perf_counter() - start, ok
+
+    def run(self, url, options):
+        with ThreadPoolExecutor(max_workers=options['concurrency']) as pool:
+            start = time.perf_counter()
+            results = list(pool.map(lambda _: self.fetch(url, options['token']), range(options['requests'])))
+            elapsed = time.perf_counter() - start
+
+        latencies = sorted(latency for latency, ok in results if ok)
+        errors = sum(1 for _, ok in results if not ok)
+        if not latencies:
+            raise CommandError(f"Every request to {url} failed; is the server running?")
+        throughput = len(latencies) / elapsed
+        return {
+            'rps': throughput,
+            'rps_per_worker': throughput / options['workers'],
+            'p50': percentile(latencies, 50) * 1000,
+            'p95': percentile(latencies, 95) * 1000,
+            'p99': percentile(latencies, 99) * 1000,
+            'mean': statistics.fmean(latencies) * 1000,
+            'errors': errors,
+        }
+
+    def handle(self, *args, **options):
+        base_url = options['base_url'].rstrip('/') + '/'
+        sync_base_url = (options['sync_base_url'] or base_url).rstrip('/') + '/'
+        wanted = options['scenario'] or [name for name, _, _ in SCENARIOS]
+
+        self.stdout.write(
+            f"{'scenario':<14}{'stack':<7}{'req/s':>9}{'req/s/wkr':>11}"
+            f"{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'errors':>8}"
+        )
+        for name, sync_path, async_path in SCENARIOS:
+            if name not in wanted:
+                continue
+            if name == 'user_profile' and not options['token']:
+                self.stdout.write(f"{name:<14}skipped: needs --token")
+                continue
+            for stack, url in (('sync', sync_base_url + sync_path), ('async', base_url + async_path)):
+                url = url.format(post=options['post'], user=options['user'])
+                result = self.run(url, options)
+                self.stdout.write(
+                    f"{name:<14}{stack:<7}{result['rps']:>9.1f}{result['rps_per_worker']:>11.1f}"
+                    f"{result['p50']:>9.1f}{result['p95']:>9.1f}{result['p99']:>9.1f}{result['errors']:>8}"
+                )
@@ -0,0 +1,99 @@
+import json
+import subprocess
+from datetime import datetime, timezone
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test.utils import get_runner, setup_test_environment, teardown_test_environment
+
+from blog.benchmarks import SCENARIOS, compare, run_scenario, seed
+from .seed_bench_data import add_seed_arguments
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True, check=True, cwd=settings.BASE_DIR,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+class Command(BaseCommand):
+    help = (
+        "Seed a throwaway test database and replay the benchmark scenarios against it in process. "
+        "Writes a JSON report and optionally diffs it against an earlier one."
+    )
+
+    def add_arguments(self, parser):
+        add_seed_arguments(parser)
+        parser.add_argument('--scenario', action='append', choices=list(SCENARIOS), help="Run only these scenarios.")
+        parser.add_argument('--requests', type=int, default=200, help="Requests per scenario (default: 200).")
+        parser.add_argument('--output', help="Write the JSON report to this file.")
+        parser.add_argument('--compare', help="Diff against an earlier JSON report.")
+        parser.add_argument('--keepdb', action='store_true', help="Keep the test database between runs (it is reseeded either way).")
+
+    def handle(self, *args, **options):
+        baseline = None
+        if options['compare']:
+            try:
+                with open(options['compare']) as f:
+                    baseline = json.load(f)
+            except (OSError, ValueError) as e:
+                raise CommandError(f"Can't read {options['compare']}: {e}")
+
+        # Same database setup as the test suite, so a run never touches real data
+        setup_test_environment()
+        runner = get_runner(settings)(verbosity=0, interactive=False, keepdb=options['keepdb'])
+        old_config = runner.setup_databases()
+        try:
+            report = self.run(options)
+        finally:
+            runner.teardown_databases(old_config)
+            teardown_test_environment()
+
+        self.print_report(report)
+        if baseline:
+            self.print_comparison(compare(baseline, report))
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                json.dump(report, f, indent=2, sort_keys=True)
+                f.write('\n')
+            self.stdout.write(f"Report written to {options['output']}")
+
+    def run(self, options):
+        self.stdout.write("Seeding...")
+        user_ids = seed(
+            users=options['users'], posts=options['posts'], comments=options['comments'],
+            follows=options['follows'], rng_seed=options['seed'],
+        )
+        scenarios = {}
+        for name in options['scenario'] or SCENARIOS:
+            self.stdout.write(f"Running {name}...")
+            scenarios[name] = run_scenario(name, user_ids, requests=options['requests'], rng_seed=options['seed'])
+        return {
+            'created_at': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'git_revision': git_revision(),
+            'database': connection.vendor,
+            'data': {key: options[key] for key in ('users', 'posts', 'comments', 'follows', 'seed')},
+            'requests_per_scenario': options['requests'],
+            'scenarios': scenarios,
+        }
+
+    def print_report(self, report):
+        self.stdout.write(
+            f"\n{'scenario':<15}{'req/s':>8}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}{'queries':>9}{'db ms':>8}{'errors':>8}"
+        )
+        for name, result in report['scenarios'].items():
+            self.stdout.write(
+                f"{name:<15}{result['requests_per_second']:>8}{result['p50_ms']:>9}{result['p95_ms']:>9}"
+                f"{result['p99_ms']:>9}{result['queries_per_request']:>9}{result['db_ms_per_request']:>8}{result['errors']:>8}"
+            )
+
+    def print_comparison(self, rows):
+        self.stdout.write(f"\n{'scenario':<15}{'metric':<21}{'before':>10}{'after':>10}{'change':>9}")
+        for name, metric, before, after, change in rows:
+            line = f"{name:<15}{metric:<21}{before:>10}{after:>10}{change:>+8}%"
+            # Flag anything more than 10% worse
+            self.stdout.write(self.style.ERROR(line) if change > 10 else line)
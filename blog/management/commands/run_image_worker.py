@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.images import process_post_images
+
+
+class Command(BaseCommand):
+    help = "Render the resized variants and placeholders of uploaded post images."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit.")
+        parser.add_argument('--batch-size', type=int, default=10, help="Images claimed per transaction (default: 10).")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty (default: 1).")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_post_images(limit=options['batch_size'])
+            if processed:
+                self.stdout.write(f"Processed {processed} image(s)")
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
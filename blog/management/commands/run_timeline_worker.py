@@ -0,0 +1,28 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from blog.timeline import process_backfill_jobs, process_fanout_jobs
+
+
+class Command(BaseCommand):
+    help = "Push newly created posts into their followers' home timelines and backfill new follows."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit.")
+        parser.add_argument('--batch-size', type=int, default=100, help="Jobs claimed per transaction (default: 100).")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to sleep when the queue is empty (default: 1).")
+
+    def handle(self, *args, **options):
+        while True:
+            processed = process_fanout_jobs(limit=options['batch_size'])
+            if processed:
+                self.stdout.write(f"Fanned out {processed} post(s)")
+            backfilled = process_backfill_jobs(limit=options['batch_size'])
+            if backfilled:
+                self.stdout.write(f"Backfilled {backfilled} follow(s)")
+            if processed or backfilled:
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
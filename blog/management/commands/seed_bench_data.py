@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from blog.benchmarks import PASSWORD, USERNAME_PREFIX, seed
+from user.models import CustomUser
+
+
+def add_seed_arguments(parser):
+    parser.add_argument('--users', type=int, default=200, help="Users to create (default: 200).")
+    parser.add_argument('--posts', type=int, default=1000, help="Posts to create (default: 1000).")
+    parser.add_argument('--comments', type=int, default=5000, help="Comments to create (default: 5000).")
+    parser.add_argument('--follows', type=int, default=10, help="Average accounts each user follows (default: 10).")
+    parser.add_argument('--seed', type=int, default=42, help="Random seed; the same seed gives the same data (default: 42).")
+
+
+class Command(BaseCommand):
+    help = "Fill the current database with synthetic users, posts, comments and follows for benchmarking."
+
+    def add_arguments(self, parser):
+        add_seed_arguments(parser)
+
+    def handle(self, *args, **options):
+        if CustomUser.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError(f"Benchmark users ({USERNAME_PREFIX}*) already exist in this database.")
+        user_ids = seed(
+            users=options['users'], posts=options['posts'], comments=options['comments'],
+            follows=options['follows'], rng_seed=options['seed'],
+        )
+        self.stdout.write(self.style.SUCCESS(
+            f"Seeded {len(user_ids)} users. Log in as {USERNAME_PREFIX}0 ... {USERNAME_PREFIX}{len(user_ids) - 1} "
+            f"with password {PASSWORD}."
+        ))
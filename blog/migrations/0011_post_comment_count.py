@@ -0,0 +1,35 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:15
+
+from django.db import migrations, models
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_post_counters(apps, schema_editor):
+    CustomUser = apps.get_model('user', 'CustomUser')
+    Post = apps.get_model('blog', 'Post')
+    Comment = apps.get_model('blog', 'Comment')
+
+    def count_of(model, field):
+        counts = model.objects.filter(**{field: OuterRef('pk')}).order_by().values(field).annotate(n=Count('*')).values('n')
+        return Coalesce(Subquery(counts), 0)
+
+    Post.objects.update(comment_count=count_of(Comment, 'post'))
+    CustomUser.objects.update(post_count=count_of(Post, 'author'))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0010_post_post_feed_idx_post_post_author_feed_idx'),
+        ('user', '0008_customuser_followers_count_and_more'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='post',
+            name='comment_count',
+            field=models.PositiveIntegerField(default=0, editable=False),
+        ),
+        migrations.RunPython(backfill_post_counters, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,49 @@
+# Generated by Django 5.1.4 on 2026-10-18 10:21
+
+import django.contrib.postgres.search
+from django.contrib.postgres.search import SearchVector
+from django.db import migrations
+
+
+# GIN indexes and tsvectors only exist on PostgreSQL; other databases use
+# the in-process fallback index in blog/search.py.
+
+def create_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    Post = apps.get_model('blog', 'Post')
+    Comment = apps.get_model('blog', 'Comment')
+    Post.objects.update(
+        search_vector=SearchVector('title', weight='A', config='english') + SearchVector('content', weight='B', config='english'),
+    )
+    Comment.objects.update(search_vector=SearchVector('content', weight='B', config='english'))
+    schema_editor.execute('CREATE INDEX post_search_idx ON blog_post USING gin (search_vector);')
+    schema_editor.execute('CREATE INDEX comment_search_idx ON blog_comment USING gin (search_vector);')
+
+
+def drop_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    schema_editor.execute('DROP INDEX IF EXISTS post_search_idx;')
+    schema_editor.execute('DROP INDEX IF EXISTS comment_search_idx;')
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0012_fanoutjob_timelineentry'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='comment',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.AddField(
+            model_name='post',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True),
+        ),
+        migrations.RunPython(create_search_indexes, drop_search_indexes),
+    ]
@@ -0,0 +1,28 @@
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.db import migrations
+from django.db.models import Value
+from django.db.models.functions import Concat, Substr
+
+
+def absolute_image_urls(apps, schema_editor):
+    """Prefix image URLs stored host-relative with the now absolute MEDIA_URL."""
+    Post = apps.get_model('blog', 'Post')
+    relative = urlsplit(settings.MEDIA_URL).path
+    if relative == settings.MEDIA_URL:
+        return  # MEDIA_URL is itself relative, nothing to rewrite
+    Post.objects.filter(image_url__startswith=f'{relative}posts/').update(
+        image_url=Concat(Value(settings.MEDIA_URL), Substr('image_url', len(relative) + 1)),
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('blog', '0017_post_rendered_content'),
+    ]
+
+    operations = [
+        migrations.RunPython(absolute_image_urls, migrations.RunPython.noop),
+    ]
@@ -1,5 +1,7 @@
 from django.db import models
+from django.contrib.postgres.search import SearchVectorField
 from user.models import CustomUser  
+from .content import RENDERED_FIELDS, apply_rendered
 
 class Post(models.Model):
     title = models.CharField(max_length=200)
@@ -7,6 +9,21 @@ class Post(models.Model):
     author = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="posts")  
     date_posted = models.DateField()
     image_url = models.URLField(default='https://via.placeholder.com/300x150')
+    # Derived from content on save, see blog/content.py
+    excerpt = models.CharField(max_length=400, blank=True, default='', editable=False)
+    word_count = models.PositiveIntegerField(default=0, editable=False)
+    reading_time = models.PositiveSmallIntegerField(default=1, editable=False)  # Minutes
+    content_html = models.TextField(blank=True, default='', editable=False)
+    comment_count = models.PositiveIntegerField(default=0, editable=False)  # Kept in sync by blog/signals.py
+    search_vector = SearchVectorField(null=True, editable=False)  # PostgreSQL only, see blog/search.py
+    updated_at = models.DateTimeField(auto_now=True)  # Conditional GET validators, see backend/conditional.py
+
+    class Meta:
+        indexes = [
+            # Keyset pagination for the feed and for an author's posts
+            models.Index(fields=['-date_posted', '-id'], name='post_feed_idx'),
+            models.Index(fields=['author', '-date_posted', '-id'], name='post_author_feed_idx'),
+        ]
 
     def __str__(self):
         return self.title
@@ -14,11 +31,89 @@ class Post(models.Model):
     def get_image_url(self):
         return self.image_url
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or 'content' in update_fields:
+            apply_rendered(self)
+            if update_fields is not None:
+                kwargs['update_fields'] = {*update_fields, *RENDERED_FIELDS}
+        super().save(*args, **kwargs)
+
 class Comment(models.Model):
     post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="comments")
     author = models.ForeignKey(CustomUser, on_delete=models.CASCADE)
     content = models.TextField()
     date_posted = models.DateTimeField(auto_now_add=True)
+    search_vector = SearchVectorField(null=True, editable=False)  # PostgreSQL only, see blog/search.py
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of a post's thread
+            models.Index(fields=['post', 'date_posted', 'id'], name='comment_thread_idx'),
+        ]
 
     def __str__(self):
         return f"Comment by {self.author.username} on {self.post.title}"
+
+
+class TimelineEntry(models.Model):
+    """A post pushed into a follower's home timeline by blog.timeline.fan_out."""
+    owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="timeline_entries")
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="+")
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['owner', 'post'], name='timeline_entry_unique'),
+        ]
+
+    def __str__(self):
+        return f"Post {self.post_id} in timeline of user {self.owner_id}"
+
+
+class FanoutJob(models.Model):
+    """A new post waiting for run_timeline_worker to push it to followers."""
+    post = models.ForeignKey(Post, on_delete=models.CASCADE, related_name="+")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Fan-out of post {self.post_id}"
+
+
+class BackfillJob(models.Model):
+    """A new follow waiting for run_timeline_worker to seed the follower's timeline."""
+    owner = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="+")
+    author = models.ForeignKey(CustomUser, on_delete=models.CASCADE, related_name="+")
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Backfill of user {self.author_id}'s posts into the timeline of user {self.owner_id}"
+
+
+class PostImage(models.Model):
+    """An uploaded post image and its variants, rendered by run_image_worker (see blog/images.py)."""
+    PENDING = 'pending'
+    PROCESSING = 'processing'
+    READY = 'ready'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (PROCESSING, 'Processing'), (READY, 'Ready'), (FAILED, 'Failed')]
+
+    post = models.OneToOneField(Post, on_delete=models.CASCADE, related_name="image")
+    original = models.CharField(max_length=255)  # Storage path
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    width = models.PositiveIntegerField()
+    height = models.PositiveIntegerField()
+    variants = models.JSONField(default=list)  # [{'width', 'webp', 'jpeg'}], narrowest first
+    placeholder = models.CharField(max_length=100, blank=True, default='')  # BlurHash
+    last_error = models.TextField(blank=True, default='')
+    uploaded_at = models.DateTimeField(auto_now=True)
+    processed_at = models.DateTimeField(null=True, blank=True)
+    claimed_until = models.DateTimeField(null=True, blank=True)  # Lease of the worker rendering it
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'id'], name='post_image_queue_idx'),
+        ]
+
+    def __str__(self):
+        return f"Image of post {self.post_id} ({self.status})"
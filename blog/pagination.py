@@ -0,0 +1,144 @@
+import base64
+import binascii
+import json
+from datetime import date, datetime
+
+from django.conf import settings
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+from rest_framework.exceptions import NotFound
+from rest_framework.response import Response
+
+
+class KeysetPagination:
+    """
+    Cursor pagination over a composite ordering, newest first by default.
+
+    Each page is located with a WHERE clause on the last row of the previous
+    page instead of an OFFSET, so page 10,000 costs the same as page 1 as long
+    as an index covers ``keys``. The cursor handed to clients is an opaque,
+    url-safe token holding those key values.
+    """
+    keys = ('id',)
+    descending = True
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    page_size = 20
+    max_page_size = 100
+    invalid_cursor_message = 'Invalid cursor.'
+
+    def __init__(self):
+        self.next_cursor = None
+
+    @staticmethod
+    def get_query_params(request):
+        # DRF requests and the plain Django requests of the async views
+        return getattr(request, 'query_params', request.GET)
+
+    def get_page_size(self, request):
+        try:
+            size = int(self.get_query_params(request)[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return self.page_size
+        return max(1, min(size, self.max_page_size))
+
+    def encode_cursor(self, obj):
+        if isinstance(obj, dict):  # .values() projections
+            return self.encode_values([obj[key] for key in self.keys])
+        return self.encode_values([getattr(obj, key) for key in self.keys])
+
+    @staticmethod
+    def encode_values(values):
+        # isoformat() keeps microseconds, which DjangoJSONEncoder would round
+        # away and make rows that share a millisecond unreachable.
+        values = [value.isoformat() if isinstance(value, (date, datetime)) else value for value in values]
+        raw = json.dumps(values, separators=(',', ':'))
+        return base64.urlsafe_b64encode(raw.encode()).decode().rstrip('=')
+
+    def decode_cursor(self, model, token):
+        try:
+            raw = base64.urlsafe_b64decode(token + '=' * (-len(token) % 4))
+            values = json.loads(raw)
+            if not isinstance(values, list) or len(values) != len(self.keys):
+                raise ValueError
+            # Only scalars we issued: a null would reach .filter() and fail there
+            if any(value is None or isinstance(value, bool) or not isinstance(value, (str, int)) for value in values):
+                raise ValueError
+            return [
+                model._meta.get_field(key).to_python(value)
+                for key, value in zip(self.keys, values)
+            ]
+        except (binascii.Error, UnicodeDecodeError, TypeError, ValueError, ValidationError):
+            raise NotFound(self.invalid_cursor_message)
+
+    def get_cursor(self, request, model):
+        """
+        The request's cursor re-encoded from its decoded values, or None for
+        the first page; raises NotFound for an invalid one. Equivalent tokens
+        map to one string, so it is safe to put in a cache key.
+        """
+        token = self.get_query_params(request).get(self.cursor_query_param)
+        return self.encode_values(self.decode_cursor(model, token)) if token else None
+
+    def get_keyset_filter(self, values):
+        # (k1, k2, ...) < (v1, v2, ...) expanded into ORs, plus a plain range
+        # bound on the leading key so the planner can seek into the index.
+        past, bound = ('lt', 'lte') if self.descending else ('gt', 'gte')
+        condition = Q()
+        for i, key in enumerate(self.keys):
+            equal = {k: v for k, v in zip(self.keys[:i], values[:i])}
+            condition |= Q(**equal, **{f'{key}__{past}': values[i]})
+        return Q(**{f'{self.keys[0]}__{bound}': values[0]}) & condition
+
+    def get_page_queryset(self, queryset, request):
+        """The sliced queryset for the requested page, plus one look-ahead row."""
+        page_size = self.get_page_size(request)
+        token = self.get_query_params(request).get(self.cursor_query_param)
+
+        if token:
+            values = self.decode_cursor(queryset.model, token)
+            queryset = queryset.filter(self.get_keyset_filter(values))
+
+        ordering = [f'-{key}' if self.descending else key for key in self.keys]
+        return queryset.order_by(*ordering)[:page_size + 1], page_size
+
+    def finish_page(self, rows, page_size):
+        # Fetching one extra row tells us whether there is a next page
+        # without a separate COUNT query.
+        if len(rows) > page_size:
+            rows = rows[:page_size]
+            self.next_cursor = self.encode_cursor(rows[-1])
+        else:
+            self.next_cursor = None
+        return rows
+
+    def paginate_queryset(self, queryset, request):
+        page, page_size = self.get_page_queryset(queryset, request)
+        return self.finish_page(list(page), page_size)
+
+    async def apaginate_queryset(self, queryset, request):
+        page, page_size = self.get_page_queryset(queryset, request)
+        return self.finish_page([row async for row in page], page_size)
+
+    def get_paginated_data(self, data):
+        return {
+            'next': self.next_cursor,
+            'results': data,
+        }
+
+    def get_paginated_response(self, data):
+        return Response(self.get_paginated_data(data))
+
+
+class PostFeedPagination(KeysetPagination):
+    keys = ('date_posted', 'id')
+    page_size = settings.POST_FEED_PAGE_SIZE
+    max_page_size = settings.POST_FEED_MAX_PAGE_SIZE
+
+
+class CommentThreadPagination(KeysetPagination):
+    # Threads read oldest first
+    keys = ('date_posted', 'id')
+    descending = False
+    page_size = 50
+    max_page_size = 200
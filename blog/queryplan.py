@@ -0,0 +1,192 @@
+import hashlib
+
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Prefetch
+from rest_framework import serializers
+
+SPARSE_PARAMS = ('fields', 'exclude', 'expand')
+
+
+def sparse_fieldset(request):
+    """
+    The ?fields=, ?exclude= and ?expand= parameters, for the ``sparse`` entry
+    of a serializer context. Each is a set of field names, dotted for fields
+    of nested serializers: ``?fields=id,title,author.username``.
+    """
+    params = request.GET  # DRF requests and the plain Django requests of the async views
+    return {
+        name: frozenset(part.strip() for part in params[name].split(',') if part.strip())
+        for name in SPARSE_PARAMS if name in params
+    }
+
+
+def sparse_signature(sparse):
+    """A short, stable token for a sparse fieldset, for cache keys; '' for the full shape."""
+    if not sparse:
+        return ''
+    raw = ';'.join(f"{name}={','.join(sorted(sparse[name]))}" for name in SPARSE_PARAMS if name in sparse)
+    return hashlib.md5(raw.encode()).hexdigest()[:16]
+
+
+def select_field_names(sparse, path, names, expandable):
+    """Which of ``names``, the fields of a serializer at ``path`` (a tuple), the response includes."""
+    prefix = ''.join(f'{part}.' for part in path)
+
+    def scoped(entries, leaf_only=False):
+        rest = [entry[len(prefix):] for entry in entries if entry.startswith(prefix)]
+        return {entry.split('.')[0] for entry in rest if not (leaf_only and '.' in entry)}
+
+    wanted = scoped(sparse.get('fields', ()))
+    expanded = scoped(sparse.get('expand', ())) | wanted
+    excluded = scoped(sparse.get('exclude', ()), leaf_only=True)
+    return [
+        name for name in names
+        if (name not in expandable or name in expanded)
+        and (not wanted or name in wanted)
+        and name not in excluded
+    ]
+
+
+class QueryPlanMixin:
+    """
+    Serializer mixin that derives a queryset plan from the serializer's fields.
+
+    Nested serializers become ``select_related`` (single) or ``Prefetch``
+    (many) lookups, and dotted sources such as ``author.username`` select
+    their relation. Anything read inside a ``SerializerMethodField`` has to be
+    declared on the class through ``select_related``, ``prefetch_related``,
+    ``field_select_related`` or ``get_annotations``. Views then fetch with
+    ``plan_queryset`` instead of building the queryset by hand.
+
+    A ``sparse`` context entry (see sparse_fieldset) narrows the fields, so
+    method fields that aren't asked for never run, and the plan follows:
+    relations of dropped fields aren't joined or prefetched, and their
+    columns are deferred. ``expandable_fields`` are only included when asked
+    for, and ``deferred_fields`` are large columns left out unless a field
+    that needs them is included. ``required_fields`` are never deferred,
+    e.g. the keys a paginator reads.
+    """
+    select_related = ()
+    prefetch_related = ()
+    field_select_related = {}  # Method field name -> the lookups it reads
+    expandable_fields = ()
+    deferred_fields = ()
+    required_fields = ()
+
+    @property
+    def sparse_path(self):
+        """Where this serializer sits in the response, as field names."""
+        path, node = [], self
+        while node.parent is not None:
+            if node.field_name:
+                path.append(node.field_name)
+            node = node.parent
+        return (*node._context.get('sparse_path', ()), *reversed(path))
+
+    def get_fields(self):
+        fields = super().get_fields()
+        names = select_field_names(self.context.get('sparse', {}), self.sparse_path, fields, self.expandable_fields)
+        return {name: fields[name] for name in names}
+
+    @classmethod
+    def wants_field(cls, name, context):
+        return name in cls(context=context).fields
+
+    @classmethod
+    def get_annotations(cls, context):
+        """Per-request annotations, e.g. anything that depends on request.user."""
+        return {}
+
+    @classmethod
+    def plan_queryset(cls, queryset, context=None):
+        context = context or {}
+        select, prefetch = cls.get_related_lookups(context)
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        deferred = cls.get_deferred_columns(context)
+        if deferred:
+            queryset = queryset.defer(*deferred)
+        annotations = cls.get_annotations(context)
+        if annotations:
+            queryset = queryset.annotate(**annotations)
+        return queryset
+
+    @classmethod
+    def get_deferred_columns(cls, context):
+        """Columns of this model that no included field reads."""
+        serializer = cls(context=context)
+        every = super(QueryPlanMixin, serializer).get_fields()  # Unbound, so source may still be unset
+        unused = model_columns(cls.Meta.model, every.items()) | set(cls.deferred_fields)
+        used = model_columns(cls.Meta.model, [(name, field) for name, field in serializer.fields.items() if not field.write_only])
+        return sorted(unused - used - set(cls.required_fields))
+
+    @classmethod
+    def get_related_lookups(cls, context):
+        model = cls.Meta.model
+        select = list(cls.select_related)
+        prefetch = list(cls.prefetch_related)
+        serializer = cls(context=context)
+        here = serializer.sparse_path
+
+        for name, field in serializer.fields.items():
+            select += cls.field_select_related.get(name, ())
+            if field.write_only or field.source == '*':
+                continue
+            nested_context = {**context, 'sparse_path': (*here, name)}
+
+            if isinstance(field, serializers.ListSerializer):
+                child = field.child
+                queryset = child.Meta.model.objects.all()
+                if isinstance(child, QueryPlanMixin):
+                    queryset = child.plan_queryset(queryset, nested_context)
+                prefetch.append(Prefetch(field.source, queryset=queryset))
+
+            elif isinstance(field, serializers.BaseSerializer):
+                select.append(field.source)
+                if isinstance(field, QueryPlanMixin):
+                    child_select, child_prefetch = field.get_related_lookups(nested_context)
+                    select += [f'{field.source}__{lookup}' for lookup in child_select]
+                    prefetch += [_prefix_prefetch(field.source, lookup) for lookup in child_prefetch]
+
+            elif '.' in field.source:
+                path = _forward_relation_path(model, field.source.split('.'))
+                if path:
+                    select.append(path)
+
+        return list(dict.fromkeys(select)), prefetch
+
+
+def model_columns(model, fields):
+    """The local, non-relation model fields that ``fields`` (name, field pairs) read directly."""
+    columns = set()
+    for name, field in fields:
+        try:
+            model_field = model._meta.get_field(field.source or name)
+        except FieldDoesNotExist:
+            continue
+        if model_field.concrete and not model_field.is_relation and not model_field.primary_key:
+            columns.add(model_field.name)
+    return columns
+
+
+def _forward_relation_path(model, parts):
+    """The longest FK/one-to-one prefix of a dotted source, as a lookup."""
+    path = []
+    for part in parts[:-1]:
+        try:
+            field = model._meta.get_field(part)
+        except FieldDoesNotExist:
+            break
+        if not (field.many_to_one or field.one_to_one):
+            break
+        path.append(part)
+        model = field.related_model
+    return '__'.join(path)
+
+
+def _prefix_prefetch(prefix, lookup):
+    if isinstance(lookup, Prefetch):
+        return Prefetch(f'{prefix}__{lookup.prefetch_through}', queryset=lookup.queryset)
+    return f'{prefix}__{lookup}'
@@ -0,0 +1,237 @@
+"""
+Ranked full-text search over posts and comments.
+
+On PostgreSQL, Post and Comment carry a ``search_vector`` tsvector column
+with a GIN index (see migration 0013). The post_save signals refresh it one
+row at a time. Any other database (SQLite test runs) falls back to
+PythonSearchIndex, an in-process inverted index with the same ranking and
+highlighting behaviour. Highlights are HTML: the stored text is escaped
+and only the <b> markers around matches are markup.
+"""
+import math
+import re
+import threading
+from collections import defaultdict
+from html import escape
+
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.db import connection
+from django.db.models import F, Value
+from django.db.models.functions import Replace
+
+from .models import Post, Comment
+
+SEARCH_CONFIG = 'english'
+# ts_headline copies the text verbatim, so it marks matches with control
+# characters that survive escaping and are swapped for <b> afterwards
+START_SEL, STOP_SEL = '\x02', '\x03'
+HEADLINE_OPTIONS = {'start_sel': START_SEL, 'stop_sel': STOP_SEL, 'max_words': 35, 'min_words': 15}
+
+POST_VECTOR = SearchVector('title', weight='A', config=SEARCH_CONFIG) + SearchVector('content', weight='B', config=SEARCH_CONFIG)
+COMMENT_VECTOR = SearchVector('content', weight='B', config=SEARCH_CONFIG)
+
+
+def unmarked(field):
+    """``field`` without any sentinel characters of its own, so only ts_headline's become tags."""
+    return Replace(Replace(F(field), Value(START_SEL), Value('')), Value(STOP_SEL), Value(''))
+
+
+class PostgresSearchBackend:
+
+    def index_post(self, post):
+        Post.objects.filter(pk=post.pk).update(search_vector=POST_VECTOR)
+
+    def index_comment(self, comment):
+        Comment.objects.filter(pk=comment.pk).update(search_vector=COMMENT_VECTOR)
+
+    def index_posts(self, posts):
+        """Index rows created with bulk_create, in one UPDATE."""
+        Post.objects.filter(pk__in=[post.pk for post in posts]).update(search_vector=POST_VECTOR)
+
+    def remove_post(self, post):
+        pass  # The row and its vector are gone together
+
+    def remove_comment(self, comment):
+        pass
+
+    def rebuild(self):
+        """Recompute every vector, after writes that bypassed the signals (bulk_create)."""
+        Post.objects.update(search_vector=POST_VECTOR)
+        Comment.objects.update(search_vector=COMMENT_VECTOR)
+
+    def search_posts(self, text, limit):
+        query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+        posts = (
+            Post.objects.filter(search_vector=query)
+            .annotate(rank=SearchRank(F('search_vector'), query))
+            .order_by('-rank', '-id')
+            .annotate(
+                title_highlight=SearchHeadline(unmarked('title'), query, config=SEARCH_CONFIG, highlight_all=True,
+                                               start_sel=START_SEL, stop_sel=STOP_SEL),
+                content_highlight=SearchHeadline(unmarked('content'), query, config=SEARCH_CONFIG, **HEADLINE_OPTIONS),
+            )
+            .values('id', 'title', 'date_posted', 'author_id', 'rank', 'title_highlight', 'content_highlight',
+                    author_username=F('author__username'))
+        )
+        return [
+            dict(post, title_highlight=headline_html(post['title_highlight']),
+                 content_highlight=headline_html(post['content_highlight']))
+            for post in posts[:limit]
+        ]
+
+    def search_comments(self, text, limit):
+        query = SearchQuery(text, search_type='websearch', config=SEARCH_CONFIG)
+        comments = (
+            Comment.objects.filter(search_vector=query)
+            .annotate(rank=SearchRank(F('search_vector'), query))
+            .order_by('-rank', '-id')
+            .annotate(content_highlight=SearchHeadline(unmarked('content'), query, config=SEARCH_CONFIG, **HEADLINE_OPTIONS))
+            .values('id', 'post_id', 'date_posted', 'rank', 'content_highlight',
+                    author_username=F('author__username'))
+        )
+        return [dict(comment, content_highlight=headline_html(comment['content_highlight'])) for comment in comments[:limit]]
+
+
+def headline_html(headline):
+    """Escape a ts_headline result and turn its sentinel markers into <b> tags."""
+    return escape(headline).replace(START_SEL, '<b>').replace(STOP_SEL, '</b>')
+
+
+TOKEN_RE = re.compile(r'\w+')
+STOP_WORDS = frozenset('a an and are as at be but by for if in into is it no not of on or such that the their then there these they this to was will with'.split())
+
+
+def tokenize(text):
+    return [token for token in TOKEN_RE.findall(text.lower()) if token not in STOP_WORDS]
+
+
+def highlight(text, terms, max_words=HEADLINE_OPTIONS['max_words']):
+    """Escape ``text`` and wrap matching words in <b>, trimmed to a window around the first match."""
+    words = text.split()
+    hits = [i for i, word in enumerate(words) if set(tokenize(word)) & terms]
+    start = max(0, hits[0] - max_words // 3) if hits else 0
+    window = words[start:start + max_words]
+    return ' '.join(f'<b>{escape(word)}</b>' if set(tokenize(word)) & terms else escape(word) for word in window)
+
+
+class PythonSearchIndex:
+    """
+    Inverted index kept in process memory. It is built from the database on
+    first use and then maintained by the same signals as the tsvector columns.
+    Only meant for SQLite test and development runs.
+    """
+    # Mirrors the tsvector weights: title (A) counts more than content (B)
+    FIELD_WEIGHTS = {Post: {'title': 1.0, 'content': 0.4}, Comment: {'content': 0.4}}
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        self.built = False
+        self.postings = {model: defaultdict(dict) for model in self.FIELD_WEIGHTS}  # term -> {pk: weight}
+        self.doc_terms = {model: {} for model in self.FIELD_WEIGHTS}  # pk -> terms, for removal
+        self.lengths = {model: {} for model in self.FIELD_WEIGHTS}
+
+    def build(self):
+        for model, fields in self.FIELD_WEIGHTS.items():
+            for obj in model.objects.only('pk', *fields).iterator():
+                self._add(model, obj)
+        self.built = True
+
+    def _add(self, model, obj):
+        length = 0
+        for field, weight in self.FIELD_WEIGHTS[model].items():
+            tokens = tokenize(getattr(obj, field))
+            length += len(tokens)
+            for token in tokens:
+                scores = self.postings[model][token]
+                scores[obj.pk] = scores.get(obj.pk, 0) + weight
+                self.doc_terms[model].setdefault(obj.pk, set()).add(token)
+        self.lengths[model][obj.pk] = length
+
+    def _remove(self, model, pk):
+        for term in self.doc_terms[model].pop(pk, ()):
+            self.postings[model][term].pop(pk, None)
+        self.lengths[model].pop(pk, None)
+
+    def _update(self, model, obj, remove_only=False):
+        with self.lock:
+            if not self.built:
+                return  # Picked up by build() on first search
+            self._remove(model, obj.pk)
+            if not remove_only:
+                self._add(model, obj)
+
+    def index_post(self, post):
+        self._update(Post, post)
+
+    def index_comment(self, comment):
+        self._update(Comment, comment)
+
+    def index_posts(self, posts):
+        with self.lock:
+            if not self.built:
+                return
+            for post in posts:
+                self._remove(Post, post.pk)
+                self._add(Post, post)
+
+    def remove_post(self, post):
+        self._update(Post, post, remove_only=True)
+
+    def remove_comment(self, comment):
+        self._update(Comment, comment, remove_only=True)
+
+    def rebuild(self):
+        with self.lock:
+            self.reset()  # Rebuilt from the database on the next search
+
+    def rank(self, model, terms, limit):
+        with self.lock:
+            if not self.built:
+                self.build()
+            if not terms:
+                return []
+            matches = [self.postings[model].get(term, {}) for term in terms]
+            pks = set.intersection(*(set(scores) for scores in matches))
+            ranked = {
+                pk: sum(scores[pk] for scores in matches) / (1 + math.log(1 + self.lengths[model][pk]))
+                for pk in pks
+            }
+        return sorted(ranked.items(), key=lambda item: (-item[1], -item[0]))[:limit]
+
+    def search_posts(self, text, limit):
+        terms = set(tokenize(text))
+        ranked = self.rank(Post, terms, limit)
+        posts = Post.objects.select_related('author').in_bulk([pk for pk, _ in ranked])
+        return [
+            {
+                'id': pk, 'title': posts[pk].title, 'date_posted': posts[pk].date_posted,
+                'author_id': posts[pk].author_id, 'author_username': posts[pk].author.username, 'rank': rank,
+                'title_highlight': highlight(posts[pk].title, terms),
+                'content_highlight': highlight(posts[pk].content, terms),
+            }
+            for pk, rank in ranked if pk in posts
+        ]
+
+    def search_comments(self, text, limit):
+        terms = set(tokenize(text))
+        ranked = self.rank(Comment, terms, limit)
+        comments = Comment.objects.select_related('author').in_bulk([pk for pk, _ in ranked])
+        return [
+            {
+                'id': pk, 'post_id': comments[pk].post_id, 'date_posted': comments[pk].date_posted,
+                'author_username': comments[pk].author.username, 'rank': rank,
+                'content_highlight': highlight(comments[pk].content, terms),
+            }
+            for pk, rank in ranked if pk in comments
+        ]
+
+
+postgres_backend = PostgresSearchBackend()
+python_index = PythonSearchIndex()
+
+
+def get_search_backend():
+    return postgres_backend if connection.vendor == 'postgresql' else python_index
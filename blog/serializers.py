@@ -1,9 +1,14 @@
+from datetime import datetime, timezone
+
 from rest_framework import serializers
 from .models import Post, Comment
+from .images import srcsets
 from user.models import CustomUser
+from .queryplan import QueryPlanMixin
+from backend.conditional import make_validators
 
 
-class UserSerializer(serializers.ModelSerializer):
+class UserSerializer(QueryPlanMixin, serializers.ModelSerializer):
     
 
     class Meta:
@@ -14,24 +19,77 @@ class UserSerializer(serializers.ModelSerializer):
         return obj.get_image_url()
 
 
-class PostSerializer(serializers.ModelSerializer):
+class PostSerializer(QueryPlanMixin, serializers.ModelSerializer):
     author = UserSerializer(read_only=True) 
+    srcset = serializers.SerializerMethodField()
+    placeholder = serializers.SerializerMethodField()
+    select_related = ('author',)  # http_validators reads the author, embedded or not
+    field_select_related = {'srcset': ('image',), 'placeholder': ('image',)}
+    expandable_fields = ('content_html',)  # Lists ship the excerpt unless ?expand=content_html
+    deferred_fields = ('content', 'content_html')
+    required_fields = ('date_posted',)  # The feed cursor
 
     class Meta:
         model = Post
-        fields = ['id', 'title', 'content', 'author', 'date_posted', 'image_url']
+        fields = [
+            'id', 'title', 'content', 'excerpt', 'word_count', 'reading_time', 'author', 'date_posted',
+            'image_url', 'srcset', 'placeholder', 'content_html',
+        ]
+        extra_kwargs = {'content': {'write_only': True}}
+
+    @staticmethod
+    def processed_image(obj):
+        image = getattr(obj, 'image', None)  # No PostImage raises an AttributeError subclass
+        return image if image is not None and image.status == image.READY else None
+
+    def get_srcset(self, obj):
+        # {'webp': ..., 'jpeg': ...} for a <picture>; null until an upload is processed
+        image = self.processed_image(obj)
+        return srcsets(image) if image else None
+
+    def get_placeholder(self, obj):
+        image = self.processed_image(obj)
+        return image.placeholder if image else None
+
+    @staticmethod
+    def http_validators(posts, *extra, list_version=None):
+        """
+        ETag and Last-Modified for ``posts``, loaded with their authors,
+        without serializing them. The ETag covers the author fields that are
+        embedded rather than author.updated_at, which also moves with the
+        author's follower and post counts.
+
+        A deleted row leaves no updated_at behind, so list pages pass the
+        post list version (a time_ns every post write moves on) and it
+        counts towards Last-Modified.
+        """
+        parts = [(post.pk, post.updated_at, post.author.username, post.author.image, post.author.email) for post in posts]
+        modified = [post.updated_at for post in posts] + [post.author.updated_at for post in posts]
+        if list_version is not None:
+            modified.append(datetime.fromtimestamp(list_version / 10 ** 9, tz=timezone.utc))
+        return make_validators([*parts, *extra], modified)
 
     def create(self, validated_data):
         user = self.context['request'].user
-        post = Post.objects.create(author=user, **validated_data)
+        post = Post.objects.create(author_id=user.pk, **validated_data)
         return post
 
 
+class PostDetailSerializer(PostSerializer):
+    """A single post: the list fields plus the body, raw for editing and rendered for display."""
+    expandable_fields = ()
+    deferred_fields = ()
+
+    class Meta(PostSerializer.Meta):
+        extra_kwargs = {}
+
+
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(QueryPlanMixin, serializers.ModelSerializer):
     # Adding the username of the author
     author_username = serializers.CharField(source='author.username', read_only=True)
     image_url = serializers.URLField(source='author.image', read_only=True)
+    required_fields = ('date_posted',)  # The thread cursor
 
     class Meta:
         model = Comment
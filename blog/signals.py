@@ -0,0 +1,61 @@
+from django.db import transaction
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_delete, post_save
+from django.dispatch import receiver
+from django.utils import timezone
+
+from user.models import CustomUser
+from .models import Post, Comment, PostImage
+from .images import delete_image_files
+from .timeline import drop_from_timeline, enqueue_backfill
+from .search import get_search_backend
+
+
+@receiver(post_save, sender=Post)
+def count_new_post(sender, instance, created, **kwargs):
+    if created:
+        CustomUser.objects.filter(pk=instance.author_id).update(post_count=F('post_count') + 1, updated_at=timezone.now())
+    get_search_backend().index_post(instance)
+
+
+@receiver(post_delete, sender=Post)
+def count_deleted_post(sender, instance, **kwargs):
+    CustomUser.objects.filter(pk=instance.author_id).update(post_count=Greatest(F('post_count') - 1, 0), updated_at=timezone.now())
+    get_search_backend().remove_post(instance)
+
+
+@receiver(post_delete, sender=PostImage)
+def delete_post_image_files(sender, instance, **kwargs):
+    # Also runs when the post is deleted; files go only if the delete commits
+    transaction.on_commit(lambda: delete_image_files(instance))
+
+
+@receiver(post_save, sender=Comment)
+def count_new_comment(sender, instance, created, **kwargs):
+    if created:
+        Post.objects.filter(pk=instance.post_id).update(comment_count=F('comment_count') + 1)
+    get_search_backend().index_comment(instance)
+
+
+@receiver(post_delete, sender=Comment)
+def count_deleted_comment(sender, instance, **kwargs):
+    Post.objects.filter(pk=instance.post_id).update(comment_count=Greatest(F('comment_count') - 1, 0))
+    get_search_backend().remove_comment(instance)
+
+
+@receiver(m2m_changed, sender=CustomUser.followers.through)
+def sync_timeline_follows(sender, instance, action, reverse, pk_set, **kwargs):
+    # Follows queue a backfill of the author's recent posts; unfollows drop them.
+    if action not in ('post_add', 'post_remove') or not pk_set:
+        return
+    if reverse:  # instance follows/unfollows the users in pk_set
+        owner_ids, author_ids = [instance.pk], list(pk_set)
+    else:  # the users in pk_set follow/unfollow instance
+        owner_ids, author_ids = list(pk_set), [instance.pk]
+
+    if action == 'post_add':
+        enqueue_backfill(owner_ids, author_ids)
+    else:
+        for owner_id in owner_ids:
+            drop_from_timeline(owner_id, author_ids)
@@ -1,3 +1,773 @@
-from django.test import TestCase
+import base64
+import json
+from contextlib import ExitStack
+from datetime import date, datetime, timedelta, timezone as dt_timezone
+from io import BytesIO, StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.db import connections
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from PIL import Image
+from rest_framework.test import APIClient
+
+from user.models import CustomUser
+from .models import Post, Comment, BackfillJob, FanoutJob, PostImage, TimelineEntry
+from .cache import POST_LIST_VERSION_KEY
+from .pagination import CommentThreadPagination, PostFeedPagination
+from .images import blurhash, claim_images, process_image
+from .timeline import process_backfill_jobs, process_fanout_jobs, push_to_timelines
+from .search import START_SEL, STOP_SEL, headline_html, python_index
+from .benchmarks import SCENARIOS, run_scenario, seed
+
+LOCMEM_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+class QueryBudgetMixin:
+    """
+    Fails a test when an endpoint runs more queries than its budget.
+
+    Budgets are checked on a cold cache against data with several related
+    rows per object, so an N+1 regression blows the budget straight away.
+    """
+
+    def assertQueryBudget(self, budget, method, url, **kwargs):
+        # Count every database, since reads may go to a replica
+        with ExitStack() as stack:
+            contexts = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+            response = getattr(self.client, method)(url, **kwargs)
+        queries = [query for context in contexts for query in context.captured_queries]
+        self.assertLessEqual(
+            len(queries), budget,
+            f"{method.upper()} {url} ran {len(queries)} queries (budget {budget}):\n"
+            + "\n".join(q['sql'] for q in queries),
+        )
+        return response
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PostQueryBudgetTests(QueryBudgetMixin, TestCase):
+    databases = '__all__'  # Reads may be routed to a replica
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.authors = [
+            CustomUser.objects.create_user(username=f'author{i}', email=f'author{i}@example.com', password='x')
+            for i in range(5)
+        ]
+        for i in range(15):
+            post = Post.objects.create(
+                title=f'Post {i}', content='Body', author=cls.authors[i % 5], date_posted=date(2025, 1, 1 + i),
+            )
+            for author in cls.authors:
+                Comment.objects.create(post=post, author=author, content='Nice')
+        cls.post = post
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_post_list(self):
+        response = self.assertQueryBudget(1, 'get', '/api/blog/posts/')
+        self.assertEqual(len(response.json()['results']), 15)
+
+    def test_post_detail(self):
+        self.assertQueryBudget(1, 'get', f'/api/blog/posts/{self.post.pk}/')
+
+    def test_get_comments(self):
+        response = self.assertQueryBudget(1, 'get', f'/api/blog/posts/{self.post.pk}/comments/')
+        self.assertEqual(len(response.json()['results']), 5)
+
+    def test_comment_pages_walk_the_thread_in_order(self):
+        seen = []
+        url = f'/api/blog/posts/{self.post.pk}/comments/?page_size=2'
+        while url:
+            page = self.assertQueryBudget(1, 'get', url).json()
+            seen += [comment['id'] for comment in page['results']]
+            url = page['next'] and f'/api/blog/posts/{self.post.pk}/comments/?page_size=2&cursor={page["next"]}'
+        self.assertEqual(seen, sorted(Comment.objects.filter(post=self.post).values_list('id', flat=True)))
+
+    def test_comment_counts(self):
+        ids = ','.join(str(pk) for pk in Post.objects.values_list('id', flat=True))
+        counts = self.assertQueryBudget(1, 'get', f'/api/blog/comments/counts/?ids={ids}').json()
+        self.assertEqual(set(counts.values()), {5})
+        self.assertEqual(len(counts), 15)
+
+    def test_edit_post(self):
+        self.client.force_authenticate(self.post.author)
+        self.assertQueryBudget(1, 'get', f'/api/blog/posts/{self.post.pk}/edit/')
+        # The first write also loads the account for the active check; later ones hit the user cache
+        self.assertQueryBudget(3, 'put', f'/api/blog/posts/{self.post.pk}/edit/', data={'title': 'Edited'})
+        self.assertQueryBudget(2, 'put', f'/api/blog/posts/{self.post.pk}/edit/', data={'title': 'Edited again'})
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class PaginationTests(TestCase):
+    databases = '__all__'  # Reads may be routed to a replica
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        # Three posts share each day, so pages must break ties on id
+        cls.posts = [
+            Post.objects.create(title=f'Post {i}', content='Body', author=cls.author, date_posted=date(2025, 1, 1 + i // 3))
+            for i in range(8)
+        ]
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def walk(self, url, **params):
+        ids, cursor = [], None
+        while True:
+            data = self.client.get(url, dict(params, **({'cursor': cursor} if cursor else {}))).json()
+            ids += [row['id'] for row in data['results']]
+            cursor = data['next']
+            if cursor is None:
+                return ids
+
+    def test_cursors_walk_the_feed_once_in_order(self):
+        expected = list(Post.objects.order_by('-date_posted', '-id').values_list('id', flat=True))
+        for page_size in (1, 2, 3, 8):
+            self.assertEqual(self.walk('/api/blog/posts/', page_size=page_size), expected)
+
+    def test_ties_on_date_posted_split_across_pages(self):
+        first = self.client.get('/api/blog/posts/', {'page_size': 2}).json()
+        second = self.client.get('/api/blog/posts/', {'page_size': 2, 'cursor': first['next']}).json()
+        # The newest day holds posts 6 and 7, the next one 3, 4 and 5
+        self.assertEqual([row['id'] for row in first['results']], [self.posts[7].pk, self.posts[6].pk])
+        self.assertEqual([row['id'] for row in second['results']], [self.posts[5].pk, self.posts[4].pk])
+
+    def test_comment_threads_read_oldest_first(self):
+        post = self.posts[0]
+        comments = [Comment.objects.create(post=post, author=self.author, content=f'Comment {i}') for i in range(5)]
+        self.assertEqual(self.walk(f'/api/blog/posts/{post.pk}/comments/', page_size=2), [comment.pk for comment in comments])
+
+    def test_cursor_round_trips_microseconds(self):
+        paginator = CommentThreadPagination()
+        moment = datetime(2025, 1, 1, 12, 0, 0, 123456, tzinfo=dt_timezone.utc)
+        token = paginator.encode_cursor({'date_posted': moment, 'id': 7})
+        self.assertNotIn('=', token)
+        self.assertEqual(paginator.decode_cursor(Comment, token), [moment, 7])
+
+    def test_invalid_cursors_are_404(self):
+        def token(value):
+            return base64.urlsafe_b64encode(json.dumps(value).encode()).decode().rstrip('=')
+
+        cursors = (
+            'not a cursor', '%%%', token({'id': 1}), token(['2025-01-01']), token(['yesterday', 1]), token(['2025-01-01', 'x']),
+            token([None, None]), token(['2025-01-01', None]),  # Nulls would reach .filter()
+            token([[1], 2]), token([{'a': 1}, 1]), token([True, 1]),  # Not scalars
+        )
+        self.client.force_authenticate(self.author)
+        for url in ('/api/blog/posts/', '/api/blog/async/posts/', '/api/blog/timeline/', f'/api/blog/posts/{self.posts[0].pk}/comments/'):
+            for cursor in cursors:
+                with self.subTest(url=url, cursor=cursor):
+                    self.assertEqual(self.client.get(url, {'cursor': cursor}).status_code, 404)
+
+    def test_invalid_cursors_are_not_cached(self):
+        self.client.get('/api/blog/posts/', {'cursor': 'junk'})
+        self.assertFalse([key for key in cache._cache if 'post_list_json' in key])
+        # Equivalent spellings of one cursor share an entry
+        first = self.client.get('/api/blog/posts/', {'page_size': 2}).json()['next']
+        self.client.get('/api/blog/posts/', {'page_size': 2, 'cursor': first})
+        values = json.loads(base64.urlsafe_b64decode(first + '=' * (-len(first) % 4)))
+        spaced = base64.urlsafe_b64encode(json.dumps(values, indent=1).encode()).decode()
+        self.assertNotEqual(spaced, first)
+        self.client.get('/api/blog/posts/', {'page_size': 2, 'cursor': spaced})
+        self.assertEqual(len([key for key in cache._cache if 'post_list_json' in key]), 2)
+
+    def test_page_size_is_capped(self):
+        with mock.patch.object(PostFeedPagination, 'max_page_size', 3):
+            self.assertEqual(len(self.client.get('/api/blog/posts/', {'page_size': 1000}).json()['results']), 3)
+        self.assertEqual(len(self.client.get('/api/blog/posts/', {'page_size': 0}).json()['results']), 1)
+        self.assertEqual(len(self.client.get('/api/blog/posts/', {'page_size': 'all'}).json()['results']), 8)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ConditionalGetTests(QueryBudgetMixin, TestCase):
+    databases = '__all__'  # Reads may be routed to a replica
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        cls.fan = CustomUser.objects.create_user(username='fan', email='fan@example.com', password='x')
+        cls.post = Post.objects.create(title='Post', content='Body', author=cls.author, date_posted=date(2025, 1, 1))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_post_detail_revalidates_without_serializing(self):
+        url = f'/api/blog/posts/{self.post.pk}/'
+        first = self.client.get(url)
+        self.assertTrue(first['ETag'].startswith('W/"'))
+        self.assertIn('Last-Modified', first)
+
+        self.assertEqual(self.assertQueryBudget(0, 'get', url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+        cache.clear()  # Cold cache: one query for the validators, nothing cached
+        response = self.assertQueryBudget(1, 'get', url, HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+
+        self.client.force_authenticate(self.author)
+        self.client.put(f'{url}edit/', {'title': 'Edited'}, format='json')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], first['ETag'])
+
+    def test_post_etag_follows_the_embedded_author(self):
+        url = f'/api/blog/posts/{self.post.pk}/'
+        etag = self.client.get(url)['ETag']
+
+        self.author.followers.add(self.fan)  # Counters aren't part of the post
+        cache.clear()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+
+        self.author.username = 'renamed'
+        self.author.save()
+        cache.clear()
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_post_list_pages_revalidate(self):
+        first = self.client.get('/api/blog/posts/')
+        cache.clear()
+        self.assertEqual(self.client.get('/api/blog/posts/', HTTP_IF_NONE_MATCH=first['ETag']).status_code, 304)
+
+        Post.objects.create(title='Newer', content='Body', author=self.author, date_posted=date(2025, 1, 2))
+        response = self.client.get('/api/blog/posts/', HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 2)
+
+    def test_post_list_last_modified_moves_on_delete(self):
+        # By another author, so nothing left on the page changes when it goes
+        older = Post.objects.create(title='Older', content='Body', author=self.fan, date_posted=date(2024, 1, 1))
+        # Rows and list version well in the past, so the delete lands in a later second
+        past = timezone.now() - timedelta(days=1)
+        Post.objects.update(updated_at=past)
+        CustomUser.objects.update(updated_at=past)
+        cache.set(POST_LIST_VERSION_KEY, int(past.timestamp()) * 10 ** 9, timeout=None)
+        first = self.client.get('/api/blog/posts/')
+        self.assertEqual(self.client.get('/api/blog/posts/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified']).status_code, 304)
+
+        self.client.force_authenticate(self.fan)
+        self.client.delete(f'/api/blog/posts/{older.pk}/delete/')
+        response = self.client.get('/api/blog/posts/', HTTP_IF_MODIFIED_SINCE=first['Last-Modified'])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.json()['results']), 1)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ResponseCacheTests(QueryBudgetMixin, TestCase):
+    databases = '__all__'  # Reads may be routed to a replica
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        cls.post = Post.objects.create(title='Post', content='Body', author=cls.author, date_posted=date(2025, 1, 1))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.detail_url = f'/api/blog/posts/{self.post.pk}/'
+
+    def titles(self):
+        return [post['title'] for post in self.client.get('/api/blog/posts/').json()['results']]
+
+    def test_hits_skip_the_database(self):
+        for url in ('/api/blog/posts/', self.detail_url):
+            first = self.client.get(url)
+            response = self.assertQueryBudget(0, 'get', url)
+            self.assertEqual(response.content, first.content)
+            self.assertEqual(response['ETag'], first['ETag'])
+
+    def test_hits_answer_if_none_match_with_304(self):
+        for url in ('/api/blog/posts/', self.detail_url):
+            etag = self.client.get(url)['ETag']
+            response = self.assertQueryBudget(0, 'get', url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b'')
+
+    def test_create_edit_and_delete_invalidate(self):
+        self.assertEqual(self.titles(), ['Post'])
+        self.client.get(self.detail_url)
+        self.client.force_authenticate(self.author)
+
+        created = self.client.post('/api/blog/posts/create/', {'title': 'New', 'content': 'Body'}).json()
+        self.assertEqual(self.titles(), ['New', 'Post'])
+
+        self.client.put(f'{self.detail_url}edit/', {'title': 'Edited'}, format='json')
+        self.assertEqual(self.client.get(self.detail_url).json()['title'], 'Edited')
+        self.assertEqual(self.titles(), ['New', 'Edited'])
+
+        self.client.delete(f'{self.detail_url}delete/')
+        self.assertEqual(self.client.get(self.detail_url).status_code, 404)
+        self.assertEqual(self.titles(), ['New'])
+        self.assertEqual(self.client.get(f"/api/blog/posts/{created['id']}/").json()['title'], 'New')
+
+    def test_profile_patch_invalidates_the_embedded_author(self):
+        self.assertEqual(self.client.get(self.detail_url).json()['author']['username'], 'author')
+        self.client.get('/api/blog/posts/')
+        self.client.force_authenticate(self.author)
+        self.client.patch('/api/user/update-profile/', {'username': 'renamed'}, format='json')
+        self.assertEqual(self.client.get(self.detail_url).json()['author']['username'], 'renamed')
+        self.assertEqual(self.client.get('/api/blog/posts/').json()['results'][0]['author']['username'], 'renamed')
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TimelineTests(TestCase):
+    databases = '__all__'  # Reads may be routed to a replica
+
+    def setUp(self):
+        cache.clear()
+        self.author = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        self.reader = CustomUser.objects.create_user(username='reader', email='reader@example.com', password='x')
+        self.author.followers.add(self.reader)
+        self.client = APIClient()
+
+    def publish(self, title):
+        self.client.force_authenticate(self.author)
+        return self.client.post('/api/blog/posts/create/', {'title': title, 'content': 'Body'}).json()['id']
+
+    def read_timeline(self):
+        self.client.force_authenticate(self.reader)
+        return [post['title'] for post in self.client.get('/api/blog/timeline/').json()['results']]
+
+    def test_posts_reach_followers_through_the_worker(self):
+        self.publish('First')
+        self.assertEqual(FanoutJob.objects.count(), 1)
+        self.assertEqual(self.read_timeline(), [])
+
+        call_command('run_timeline_worker', once=True, stdout=StringIO())
+        self.assertEqual(FanoutJob.objects.count(), 0)
+        self.assertEqual(self.read_timeline(), ['First'])
+
+    @override_settings(TIMELINE_FANOUT_LIMIT=0)
+    def test_large_accounts_are_pulled_on_read(self):
+        self.publish('Popular')
+        process_fanout_jobs()
+        self.assertFalse(TimelineEntry.objects.exists())
+        self.assertEqual(self.read_timeline(), ['Popular'])
+
+    def test_follow_backfills_through_the_worker_and_unfollow_drops(self):
+        self.author.followers.remove(self.reader)
+        self.publish('Older')
+        self.author.followers.add(self.reader)
+        self.assertEqual(BackfillJob.objects.count(), 1)
+        self.assertEqual(self.read_timeline(), [])
+
+        out = StringIO()
+        call_command('run_timeline_worker', once=True, stdout=out)
+        self.assertIn('Backfilled 1 follow(s)', out.getvalue())
+        self.assertEqual(self.read_timeline(), ['Older'])
+
+        self.author.followers.remove(self.reader)
+        self.assertEqual(self.read_timeline(), [])
+
+    def test_unfollow_cancels_a_queued_backfill(self):
+        self.author.followers.remove(self.reader)
+        self.publish('Older')
+        self.author.followers.add(self.reader)
+        self.author.followers.remove(self.reader)
+        self.assertEqual(process_backfill_jobs(), 0)
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.reader).exists())
+
+    @override_settings(TIMELINE_MAX_LENGTH=10)
+    def test_timelines_are_trimmed(self):
+        for i in range(12):
+            self.publish(f'Post {i}')
+        process_fanout_jobs()
+        self.assertEqual(TimelineEntry.objects.filter(owner=self.reader).count(), 10)
+        self.assertEqual(self.read_timeline()[0], 'Post 11')
+
+    @override_settings(TIMELINE_MAX_LENGTH=10)
+    def test_trimming_follows_date_posted_not_ids(self):
+        for i in range(10):
+            self.publish(f'Post {i}')
+        process_fanout_jobs()
+        # Imported with a higher id, but older than everything on the timeline
+        other = CustomUser.objects.create_user(username='other', email='other@example.com', password='x')
+        older = [Post.objects.create(title=f'Archive {i}', content='Body', author=other, date_posted=date(2020, 1, 1)) for i in range(2)]
+        push_to_timelines([self.reader.pk], [post.pk for post in older])
+        titles = set(TimelineEntry.objects.filter(owner=self.reader).values_list('post__title', flat=True))
+        self.assertEqual(titles, {f'Post {i}' for i in range(10)})
+
+
+class SearchTests(TestCase):
+    # Runs against the in-process fallback index unless the test database is PostgreSQL
+    databases = '__all__'  # Reads may be routed to a replica
+
+    def setUp(self):
+        python_index.reset()
+        author = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        self.django = Post.objects.create(title='Django caching', content='How we cache rendered JSON.', author=author, date_posted=date(2025, 1, 1))
+        self.other = Post.objects.create(title='Gardening', content='Tomatoes and a little Django on the side.', author=author, date_posted=date(2025, 1, 2))
+        Comment.objects.create(post=self.other, author=author, content='Caching tomatoes is hard.')
+        self.client = APIClient()
+
+    def search(self, q):
+        return self.client.get('/api/blog/search/', {'q': q}).json()
+
+    def test_title_matches_rank_first_and_are_highlighted(self):
+        results = self.search('django')
+        self.assertEqual([post['id'] for post in results['posts']], [self.django.pk, self.other.pk])
+        self.assertIn('<b>Django</b>', results['posts'][0]['title_highlight'])
+
+    def test_comments_are_searched(self):
+        results = self.search('tomatoes caching')
+        self.assertEqual(results['posts'], [])
+        self.assertEqual(len(results['comments']), 1)
+
+    def test_index_follows_edits_and_deletes(self):
+        self.search('django')  # Build the index
+        self.django.title = 'Flask caching'
+        self.django.save()
+        self.other.delete()
+        self.assertEqual(self.search('django')['posts'], [])
+        self.assertEqual(len(self.search('flask')['posts']), 1)
+
+    def test_q_is_required(self):
+        self.assertEqual(self.client.get('/api/blog/search/').status_code, 400)
+
+    def test_highlights_escape_stored_markup(self):
+        Post.objects.create(title='<script>alert(1)</script> XSS', content='<img src=x onerror=alert(1)> hello world',
+                            author=self.django.author, date_posted=date(2025, 1, 3))
+        post = self.search('hello')['posts'][0]
+        self.assertEqual(post['content_highlight'], '&lt;img src=x onerror=alert(1)&gt; <b>hello</b> world')
+        self.assertNotIn('<script>', post['title_highlight'])
+        # PostgreSQL headlines carry sentinel markers that become the only tags
+        self.assertEqual(headline_html(f'<img onerror=x> {START_SEL}hello{STOP_SEL}'), '&lt;img onerror=x&gt; <b>hello</b>')
+
+
+@override_settings(CACHES=LOCMEM_CACHES, BULK_INGEST_BATCH_SIZE=2)
+class BulkTests(TestCase):
+    databases = '__all__'  # Reads may be routed to a replica
+
+    def setUp(self):
+        cache.clear()
+        python_index.reset()
+        self.author = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def ingest(self, *lines):
+        return self.client.generic('POST', '/api/blog/posts/bulk/', '\n'.join(lines), content_type='application/x-ndjson')
+
+    def test_ingest_creates_valid_rows_and_reports_the_rest(self):
+        self.client.get('/api/blog/posts/')  # Cache the empty feed
+        self.client.get('/api/blog/search/', {'q': 'imported'})  # Build the search index
+        response = self.ingest(
+            '{"title": "Imported one", "content": "Body", "date_posted": "2019-05-01"}',
+            '{"title": "Imported two", "content": "Body"}',
+            'not json',
+            '',
+            '{"content": "No title"}',
+            '{"type": "comment", "content": "Not a post"}',
+            '{"title": "Imported three", "content": "Body"}',
+        )
+        report = response.json()
+        self.assertEqual((report['created'], report['failed']), (3, 3))
+        self.assertEqual([error['line'] for error in report['errors']], [3, 5, 6])
+        self.assertIn('title', report['errors'][1]['errors'])
+
+        self.assertEqual(Post.objects.get(title='Imported one').date_posted, date(2019, 5, 1))
+        self.author.refresh_from_db()
+        self.assertEqual(self.author.post_count, 3)
+        self.assertEqual(FanoutJob.objects.count(), 3)
+        self.assertEqual(len(self.client.get('/api/blog/posts/').json()['results']), 3)
+        self.assertEqual(len(self.client.get('/api/blog/search/', {'q': 'imported'}).json()['posts']), 3)
+
+    def test_ingest_needs_ndjson(self):
+        response = self.client.post('/api/blog/posts/bulk/', {'title': 'x', 'content': 'y'}, format='json')
+        self.assertEqual(response.status_code, 415)
+
+    def test_ingest_accepts_media_type_parameters(self):
+        line = '{"title": "With charset", "content": "Body"}'
+        response = self.client.generic('POST', '/api/blog/posts/bulk/', line, content_type='application/x-ndjson; charset=utf-8')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()['created'], 1)
+
+    def test_export_streams_posts_with_their_comments(self):
+        other = CustomUser.objects.create_user(username='other', email='other@example.com', password='x')
+        first = Post.objects.create(title='First', content='Body', author=self.author, date_posted=date(2025, 1, 1))
+        second = Post.objects.create(title='Second', content='Body', author=other, date_posted=date(2025, 1, 2))
+        third = Post.objects.create(title='Third', content='Body', author=self.author, date_posted=date(2025, 1, 3))
+        Comment.objects.create(post=third, author=other, content='Late')
+        Comment.objects.create(post=first, author=other, content='Hi')
+        Comment.objects.create(post=second, author=self.author, content='Yo')
+
+        def export(**params):
+            response = self.client.get('/api/blog/posts/export/', params)
+            self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+            return [json.loads(line) for line in b''.join(response.streaming_content).splitlines()]
+
+        rows = export()
+        self.assertEqual(
+            [(row['type'], row.get('title') or row['content']) for row in rows],
+            [('post', 'First'), ('comment', 'Hi'), ('post', 'Second'), ('comment', 'Yo'), ('post', 'Third'), ('comment', 'Late')],
+        )
+        self.assertEqual([row['id'] for row in export(author=self.author.pk) if row['type'] == 'post'], [first.pk, third.pk])
+        self.assertEqual(self.client.get('/api/blog/posts/export/', {'author': 'me'}).status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class RenderedContentTests(TestCase):
+    databases = '__all__'  # Reads may be routed to a replica
+
+    def setUp(self):
+        cache.clear()
+        self.author = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        self.body = '\n\n'.join(['Some <b>bold</b> words about https://example.com and more.'] + ['Lorem ipsum dolor sit amet. ' * 40] * 30)
+        self.post = Post.objects.create(title='Long read', content=self.body, author=self.author, date_posted=date(2025, 1, 1))
+
+    def test_lists_ship_the_excerpt_and_detail_the_body(self):
+        self.assertEqual(self.post.word_count, len(self.body.split()))
+        self.assertEqual(self.post.reading_time, 31)  # 6009 words at 200 a minute
+
+        listed = self.client.get('/api/blog/posts/')
+        row = listed.json()['results'][0]
+        self.assertNotIn('content', row)
+        self.assertTrue(row['excerpt'].endswith('…'))
+        self.assertEqual(row['reading_time'], 31)
+        self.assertLess(len(listed.content) * 10, len(self.body))
+
+        detail = self.client.get(f'/api/blog/posts/{self.post.pk}/').json()
+        self.assertEqual(detail['content'], self.body)
+        self.assertIn('&lt;b&gt;bold&lt;/b&gt;', detail['content_html'])
+        self.assertIn('<a href="https://example.com" rel="nofollow">', detail['content_html'])
+
+    def test_edit_rerenders_and_backfill_covers_old_rows(self):
+        self.post.content = 'Short now'
+        self.post.save(update_fields=['content'])
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.excerpt, self.post.word_count), ('Short now', 2))
+
+        Post.objects.filter(pk=self.post.pk).update(excerpt='', word_count=0, content_html='')
+        out = StringIO()
+        call_command('backfill_post_content', stdout=out)
+        self.assertIn('Rendered 1 post(s)', out.getvalue())
+        self.post.refresh_from_db()
+        self.assertEqual((self.post.excerpt, self.post.word_count, self.post.content_html), ('Short now', 2, '<p>Short now</p>'))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class SparseFieldsetTests(QueryBudgetMixin, TestCase):
+    databases = '__all__'  # Reads may be routed to a replica
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.author = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        cls.post = Post.objects.create(title='Sparse', content='A long body', author=cls.author, date_posted=date(2025, 1, 1))
+        for i in range(3):
+            Comment.objects.create(post=cls.post, author=cls.author, content=f'Comment {i}')
+
+    def setUp(self):
+        cache.clear()
+
+    def get(self, url, budget, **params):
+        with ExitStack() as stack:
+            contexts = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+            response = self.assertQueryBudget(budget, 'get', url, data=params)
+        return response.json(), ' '.join(query['sql'] for context in contexts for query in context.captured_queries)
+
+    def test_fields_narrow_the_payload_and_the_query(self):
+        data, sql = self.get('/api/blog/posts/', 1, fields='id,title')
+        self.assertEqual(list(data['results'][0]), ['id', 'title'])
+        self.assertNotIn('"excerpt"', sql)
+        self.assertNotIn('blog_postimage', sql)  # srcset and placeholder never ran
+
+        data, sql = self.get('/api/blog/posts/', 1, fields='id,author.username')
+        self.assertEqual(data['results'][0], {'id': self.post.pk, 'author': {'username': 'author'}})
+
+        # Full payloads are cached separately from sparse ones
+        self.assertIn('excerpt', self.client.get('/api/blog/posts/').json()['results'][0])
+
+    def test_exclude_and_expand(self):
+        data, sql = self.get('/api/blog/posts/', 1, exclude='srcset,placeholder,author.email')
+        row = data['results'][0]
+        self.assertNotIn('srcset', row)
+        self.assertNotIn('email', row['author'])
+        self.assertNotIn('blog_postimage', sql)
+        self.assertNotIn('"content_html"', sql)
+
+        data, sql = self.get('/api/blog/posts/', 1, expand='content_html')
+        self.assertEqual(data['results'][0]['content_html'], '<p>A long body</p>')
+
+        data, sql = self.get(f'/api/blog/posts/{self.post.pk}/', 1, fields='title')
+        self.assertEqual(data, {'title': 'Sparse'})
+        self.assertNotIn('"content"', sql)
+        self.assertIn('content', self.client.get(f'/api/blog/posts/{self.post.pk}/').json())
+
+    def test_comments(self):
+        data, sql = self.get(f'/api/blog/posts/{self.post.pk}/comments/', 1, fields='id,content')
+        self.assertEqual([list(row) for row in data['results']], [['id', 'content']] * 3)
+
+
+def image_file(size, name='photo.png', image_format='PNG'):
+    out = BytesIO()
+    Image.new('RGBA' if image_format == 'PNG' else 'RGB', size, (200, 40, 40)).save(out, format=image_format)
+    return SimpleUploadedFile(name, out.getvalue())
+
+
+@override_settings(CACHES=LOCMEM_CACHES, POST_IMAGE_WIDTHS=[320, 640, 1280], POST_IMAGE_DEFAULT_WIDTH=640)
+class PostImageTests(TestCase):
+    databases = '__all__'  # Reads may be routed to a replica
+
+    def setUp(self):
+        cache.clear()
+        self.author = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        self.post = Post.objects.create(title='Photo', content='Body', author=self.author, date_posted=date(2025, 1, 1))
+        self.client = APIClient()
+        self.client.force_authenticate(self.author)
+
+    def upload(self, upload, **kwargs):
+        return self.client.post(f'/api/blog/posts/{self.post.pk}/image/', {'image': upload}, format='multipart', **kwargs)
+
+    def test_upload_is_processed_into_variants(self):
+        self.assertIsNone(self.client.get(f'/api/blog/posts/{self.post.pk}/').json()['srcset'])  # Cache the post
+        response = self.upload(image_file((800, 400)))
+        self.assertEqual(response.status_code, 202)
+        image = PostImage.objects.get(post=self.post)
+        self.assertTrue(default_storage.exists(image.original))
+
+        out = StringIO()
+        call_command('run_image_worker', '--once', stdout=out)
+        self.assertIn('Processed 1 image(s)', out.getvalue())
+        image.refresh_from_db()
+        self.assertEqual(image.status, PostImage.READY)
+        self.assertEqual([variant['width'] for variant in image.variants], [320, 640, 800])  # Never upscaled
+        with default_storage.open(image.variants[0]['webp']) as variant:
+            self.assertEqual(Image.open(variant).size, (320, 160))
+
+        data = self.client.get(f'/api/blog/posts/{self.post.pk}/').json()
+        self.assertTrue(data['srcset']['webp'].endswith('/800.webp 800w'))
+        self.assertIn('/640.jpeg 640w', data['srcset']['jpeg'])
+        self.assertTrue(data['image_url'].endswith('/640.jpeg'))
+        self.assertEqual(data['placeholder'], image.placeholder)
+
+        response = self.client.get(data['image_url'])
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('immutable', response['Cache-Control'])
+
+        # The stored URL is absolute, so sending the post back validates
+        self.assertTrue(data['image_url'].startswith(settings.MEDIA_URL))
+        edit = self.client.get(f'/api/blog/posts/{self.post.pk}/edit/').json()
+        response = self.client.put(f'/api/blog/posts/{self.post.pk}/edit/', dict(edit, content='Edited'), format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(Post.objects.get(pk=self.post.pk).image_url, data['image_url'])
+
+    def test_replacing_or_deleting_removes_old_files(self):
+        self.upload(image_file((400, 400)))
+        call_command('run_image_worker', '--once', stdout=StringIO())
+        first = PostImage.objects.get(post=self.post)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.upload(image_file((300, 300), name='photo.jpg', image_format='JPEG'))
+        self.assertFalse(default_storage.exists(first.original))
+        self.assertFalse(default_storage.exists(first.variants[0]['jpeg']))
+
+        second = PostImage.objects.get(post=self.post)
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post.delete()
+        self.assertFalse(default_storage.exists(second.original))
+
+    def test_reupload_while_rendering_discards_the_render(self):
+        self.upload(image_file((400, 400)))
+        claimed, = claim_images(10)
+        self.assertEqual(self.upload(image_file((300, 300))).status_code, 202)  # Not blocked by the worker
+        self.assertFalse(process_image(claimed))
+        image = PostImage.objects.get(post=self.post)
+        self.assertEqual((image.status, image.width), (PostImage.PENDING, 300))
+        self.assertNotIn('/posts/', Post.objects.get(pk=self.post.pk).image_url)
+
+        call_command('run_image_worker', '--once', stdout=StringIO())
+        image.refresh_from_db()
+        self.assertEqual([variant['width'] for variant in image.variants], [300])
+
+    def test_expired_claims_are_taken_over(self):
+        self.upload(image_file((400, 400)))
+        stalled, = claim_images(10)
+        self.assertEqual(claim_images(10), [])  # Leased
+        PostImage.objects.update(claimed_until=timezone.now())
+        out = StringIO()
+        call_command('run_image_worker', '--once', stdout=out)
+        self.assertIn('Processed 1 image(s)', out.getvalue())
+        self.assertFalse(process_image(stalled))  # The stalled worker's late result is dropped
+        self.assertEqual(PostImage.objects.get().status, PostImage.READY)
+
+    def test_rejects_bad_uploads(self):
+        self.assertEqual(self.upload(SimpleUploadedFile('notes.png', b'not an image')).status_code, 400)
+        self.assertEqual(self.client.post(f'/api/blog/posts/{self.post.pk}/image/', {}, format='multipart').status_code, 400)
+        with self.settings(POST_IMAGE_MAX_BYTES=100):
+            self.assertEqual(self.upload(image_file((400, 400))).status_code, 413)
+        self.assertEqual(self.upload(image_file((40, 40)), CONTENT_LENGTH='12abc').status_code, 400)
+
+        other = CustomUser.objects.create_user(username='other', email='other@example.com', password='x')
+        self.client.force_authenticate(other)
+        self.assertEqual(self.upload(image_file((400, 400))).status_code, 403)
+        self.assertFalse(PostImage.objects.exists())
+
+    def test_blurhash(self):
+        # 4x3 components: 1 size + 1 maximum + 4 DC + 2 per AC component
+        self.assertEqual(blurhash(Image.new('RGB', (64, 48), (0, 0, 0))), 'L00000fQfQfQfQfQfQfQfQfQfQfQ')
+        self.assertEqual(len(blurhash(Image.linear_gradient('L').convert('RGB'))), 28)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AsyncViewTests(TestCase):
+    databases = '__all__'  # Reads may be routed to a replica
+
+    @classmethod
+    def setUpTestData(cls):
+        author = CustomUser.objects.create_user(username='author', email='author@example.com', password='x')
+        for i in range(3):
+            cls.post = Post.objects.create(title=f'Post {i}', content='Body', author=author, date_posted=date(2025, 1, 1 + i))
+            Comment.objects.create(post=cls.post, author=author, content='Nice')
+
+    def setUp(self):
+        cache.clear()
+
+    async def assertSameAsSync(self, path):
+        response = await AsyncClient().get(f'/api/blog/async/{path}')
+        self.assertEqual(response.status_code, 200)
+        sync_response = await sync_to_async(APIClient().get)(f'/api/blog/{path}')
+        self.assertEqual(response.json(), sync_response.json())
+        return response
+
+    async def test_matches_the_sync_endpoints(self):
+        await self.assertSameAsSync('posts/?page_size=2')
+        await self.assertSameAsSync(f'posts/{self.post.pk}/')
+        await self.assertSameAsSync(f'posts/{self.post.pk}/comments/')
+
+    async def test_cached_entries_answer_if_none_match(self):
+        response = await self.assertSameAsSync(f'posts/{self.post.pk}/')
+        response = await AsyncClient().get(f'/api/blog/async/posts/{self.post.pk}/', headers={'If-None-Match': response['ETag']})
+        self.assertEqual(response.status_code, 304)
+
+    async def test_not_found(self):
+        self.assertEqual((await AsyncClient().get('/api/blog/async/posts/0/')).status_code, 404)
+        self.assertEqual((await AsyncClient().get('/api/blog/async/posts/?cursor=junk')).status_code, 404)
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class BenchmarkTests(TestCase):
+    databases = '__all__'  # Reads may be routed to a replica
+
+    def test_seed_and_run_every_scenario(self):
+        python_index.reset()
+        user_ids = seed(users=20, posts=40, comments=80, follows=4)
+        celebrity = CustomUser.objects.get(pk=user_ids[0])
+        self.assertEqual(celebrity.followers_count, celebrity.followers.count())  # Counters rebuilt after bulk_create
+        self.assertEqual(Post.objects.count(), 40)
+
+        for name in SCENARIOS:
+            result = run_scenario(name, user_ids, requests=8)
+            self.assertEqual((result['requests'], result['errors']), (8, 0), name)
+            self.assertGreater(result['queries_per_request'], 0, name)
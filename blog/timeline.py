@@ -0,0 +1,146 @@
+"""
+Home timelines: posts from the authors a user follows.
+
+New posts are fanned out on write: create_post queues a FanoutJob and
+run_timeline_worker copies the post id into a TimelineEntry per follower,
+keeping each timeline to roughly TIMELINE_MAX_LENGTH entries. Authors with
+more than TIMELINE_FANOUT_LIMIT followers are skipped on write and their
+posts are pulled in on read instead, so one post never turns into millions
+of inserts. A new follow is queued the same way, as a BackfillJob that
+seeds the follower's timeline with the author's recent posts.
+"""
+from django.conf import settings
+from django.db import transaction
+from django.db.models import OuterRef, Q, Subquery
+
+from user.models import CustomUser
+from .models import BackfillJob, Post, TimelineEntry, FanoutJob
+
+FANOUT_BATCH_SIZE = 1000
+
+
+def is_fanout_author(user):
+    return user.followers_count <= settings.TIMELINE_FANOUT_LIMIT
+
+
+def enqueue_fanout(post):
+    """Queue ``post`` for the worker; call inside the transaction that creates it."""
+    FanoutJob.objects.create(post=post)
+
+
+def fan_out(post):
+    """Push ``post`` into every follower's timeline, FANOUT_BATCH_SIZE followers at a time."""
+    if not is_fanout_author(post.author):
+        return  # Pulled in by timeline_queryset instead
+
+    followers = (
+        CustomUser.followers.through.objects.filter(from_customuser_id=post.author_id)
+        .values_list('to_customuser_id', flat=True)
+        .iterator(chunk_size=FANOUT_BATCH_SIZE)
+    )
+    batch = []
+    for follower_id in followers:
+        batch.append(follower_id)
+        if len(batch) == FANOUT_BATCH_SIZE:
+            push_to_timelines(batch, [post.pk])
+            batch = []
+    if batch:
+        push_to_timelines(batch, [post.pk])
+
+
+def push_to_timelines(owner_ids, post_ids):
+    TimelineEntry.objects.bulk_create(
+        [TimelineEntry(owner_id=owner_id, post_id=post_id) for owner_id in owner_ids for post_id in post_ids],
+        ignore_conflicts=True,
+    )
+    trim_timelines(owner_ids)
+
+
+def trim_timelines(owner_ids):
+    """Cut timelines that have overflowed by 10% back to TIMELINE_MAX_LENGTH."""
+    limit = settings.TIMELINE_MAX_LENGTH
+    # The slack means a full timeline costs one DELETE per `slack` new posts
+    # rather than one per post.
+    slack = max(1, limit // 10)
+    # The order the timeline is read in, so a backfilled older post with a
+    # higher id is the one trimmed
+    newest_first = TimelineEntry.objects.filter(owner=OuterRef('pk')).order_by('-post__date_posted', '-post_id')
+    overflowing = (
+        CustomUser.objects.filter(pk__in=owner_ids)
+        .annotate(
+            overflow=Subquery(newest_first.values('post_id')[limit + slack:limit + slack + 1]),
+            cutoff_date=Subquery(newest_first.values('post__date_posted')[limit:limit + 1]),
+            cutoff_id=Subquery(newest_first.values('post_id')[limit:limit + 1]),
+        )
+        .filter(overflow__isnull=False)
+        .values_list('pk', 'cutoff_date', 'cutoff_id')
+    )
+    for owner_id, cutoff_date, cutoff_id in overflowing:
+        TimelineEntry.objects.filter(
+            Q(post__date_posted__lt=cutoff_date) | Q(post__date_posted=cutoff_date, post_id__lte=cutoff_id),
+            owner_id=owner_id,
+        ).delete()
+
+
+def enqueue_backfill(owner_ids, author_ids):
+    """Queue timeline backfills for new follows; call inside the transaction that adds them."""
+    BackfillJob.objects.bulk_create(
+        [BackfillJob(owner_id=owner_id, author_id=author_id) for owner_id in owner_ids for author_id in author_ids]
+    )
+
+
+def backfill_timeline(owner_id, author):
+    """Seed a new follower's timeline with the author's recent posts."""
+    if not is_fanout_author(author):
+        return
+    recent = Post.objects.filter(author=author).order_by('-date_posted', '-id').values_list('pk', flat=True)
+    push_to_timelines([owner_id], list(recent[:settings.TIMELINE_MAX_LENGTH]))
+
+
+def drop_from_timeline(owner_id, author_ids):
+    # A follow undone before the worker got to it must not be backfilled later
+    BackfillJob.objects.filter(owner_id=owner_id, author_id__in=author_ids).delete()
+    TimelineEntry.objects.filter(owner_id=owner_id, post__author_id__in=author_ids).delete()
+
+
+def process_fanout_jobs(limit=100):
+    """Run up to ``limit`` queued fan-outs; returns how many were processed."""
+    with transaction.atomic():
+        jobs = list(
+            FanoutJob.objects.select_for_update(skip_locked=True)
+            .select_related('post__author')
+            .order_by('id')[:limit]
+        )
+        for job in jobs:
+            fan_out(job.post)
+            job.delete()
+    return len(jobs)
+
+
+def process_backfill_jobs(limit=100):
+    """Run up to ``limit`` queued follow backfills; returns how many were processed."""
+    with transaction.atomic():
+        jobs = list(
+            BackfillJob.objects.select_for_update(skip_locked=True)
+            .select_related('author')
+            .order_by('id')[:limit]
+        )
+        for job in jobs:
+            backfill_timeline(job.owner_id, job.author)
+            job.delete()
+    return len(jobs)
+
+
+def timeline_queryset(user):
+    """
+    Posts for ``user``'s home timeline: fanned-out entries, posts from
+    followed authors that are too big to fan out, and the user's own posts.
+    """
+    # Only user.pk is read, so a claims-based request.user needs no lookup
+    pulled_authors = CustomUser.objects.filter(
+        followers=user.pk, followers_count__gt=settings.TIMELINE_FANOUT_LIMIT,
+    ).values('pk')
+    pushed_posts = TimelineEntry.objects.filter(owner_id=user.pk).values('post_id')
+    return Post.objects.filter(
+        Q(pk__in=pushed_posts) | Q(author__in=pulled_authors) | Q(author_id=user.pk)
+    )
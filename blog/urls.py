@@ -1,15 +1,25 @@
 from django.urls import path
-from blog import views
+from blog import views, async_views
 
 urlpatterns = [
     path('posts/', views.post_list),
     path('posts/<int:pk>/', views.post_detail),
     path('posts/create/', views.create_post),
+    path('posts/bulk/', views.bulk_create_posts, name='bulk_create_posts'),
+    path('posts/export/', views.export_posts, name='export_posts'),
+    path('timeline/', views.timeline, name='timeline'),
+    path('search/', views.search, name='search'),
     # path("posts/by-user/", views.get_user_posts, name="get_user_posts"),
+    path('posts/<int:pk>/image/', views.upload_image, name='upload_image'),
     path('posts/<int:pk>/edit/', views.edit_post, name='edit_post'),
     path('posts/<int:pk>/delete/', views.delete_post, name='delete_post'),
     path('posts/<int:pk>/comments/', views.get_comments, name='get_comments'),
     path('posts/<int:pk>/comments/add/', views.add_comment, name='add_comment'),
+    path('comments/counts/', views.get_comment_counts, name='get_comment_counts'),
     path('comments/<int:comment_id>/delete/', views.delete_comment, name='delete_comment'),
+    # Native async twins of the read endpoints, for ASGI deployments
+    path('async/posts/', async_views.post_list, name='async_post_list'),
+    path('async/posts/<int:pk>/', async_views.post_detail, name='async_post_detail'),
+    path('async/posts/<int:pk>/comments/', async_views.get_comments, name='async_get_comments'),
     # path('posts/user/<int:user_id>/', views.get_posts_by_user, name='get-posts-by-user'),
 ]
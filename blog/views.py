@@ -3,26 +3,62 @@ from rest_framework.permissions import IsAuthenticated,AllowAny
 from rest_framework.response import Response
 from rest_framework import status
 from .models import Post, Comment
-from .serializers import PostSerializer, CommentSerializer
+from .serializers import PostSerializer, PostDetailSerializer, CommentSerializer
+from .pagination import PostFeedPagination, CommentThreadPagination
+from .timeline import enqueue_fanout, timeline_queryset
+from .search import get_search_backend
+from .bulk import NDJSON_CONTENT_TYPE, export_lines, ingest_posts
+from .queryplan import sparse_fieldset, sparse_signature
+from .images import IMAGE_DIR, IMAGE_MAX_AGE, InvalidImage, upload_post_image
+from .cache import (
+    cache_entry, entry_response, invalidate_post_list, invalidate_posts, post_detail_key, post_list_key,
+    post_list_version, recently_invalidated,
+)
+from backend.conditional import not_modified
+from user.auth import IsActiveUser
+from backend.replicas import primary_reads
 from django.utils import timezone
 from django.core.cache import cache
+from django.http import StreamingHttpResponse
+from django.conf import settings
+from django.core.files.uploadhandler import TemporaryFileUploadHandler
+from django.views.decorators.http import require_GET
+from django.views.static import serve
+from django.db import transaction
+
+SEARCH_PAGE_SIZE = 20
+SEARCH_MAX_PAGE_SIZE = 50
+MAX_COMMENT_COUNT_IDS = 100
+
+# Columns CommentSerializer actually reads
+COMMENT_FIELDS = ('id', 'content', 'date_posted', 'post', 'author', 'author__username', 'author__image')
 
 
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def post_list(request):
     """
-    List all posts.
+    List posts newest first, one cursor page at a time.
     """
-    cache_key = 'post_list'  # Define a cache key for the list of posts
-    posts = cache.get(cache_key)  # Try to get the cached data
-    
-    if not posts:  # If not cached, fetch from the database
-        posts = Post.objects.all()
-        cache.set(cache_key, posts, timeout=60 * 15)  # Cache for 15 minutes
-    
-    serializer = PostSerializer(posts, many=True)
-    return Response(serializer.data)
+    paginator = PostFeedPagination()
+    context = {'sparse': sparse_fieldset(request)}  # ?fields=, ?exclude=, ?expand=
+    version = post_list_version()
+    cache_key = post_list_key(
+        paginator.get_cursor(request, Post), paginator.get_page_size(request), version, sparse_signature(context['sparse']),
+    )
+    entry = cache.get(cache_key)  # Cached pages are already rendered JSON
+
+    if entry is None:  # If not cached, fetch from the database
+        with primary_reads(recently_invalidated(version)):
+            posts = paginator.paginate_queryset(PostSerializer.plan_queryset(Post.objects.all(), context), request)
+        validators = PostSerializer.http_validators(posts, paginator.next_cursor, list_version=version)
+        unchanged = not_modified(request, *validators)
+        if unchanged is not None:
+            return unchanged  # The client's copy is current, skip serializing
+        serializer = PostSerializer(posts, many=True, context=context)
+        entry = cache_entry(cache_key, paginator.get_paginated_data(serializer.data), *validators)
+
+    return entry_response(request, entry)
 
 
 @api_view(['GET'])
@@ -31,48 +67,167 @@ def post_detail(request, pk):
     """
     Retrieve a specific post.
     """
-    cache_key = f'post_detail_{pk}'  # Define a cache key for the specific post
-    post = cache.get(cache_key)  # Try to get the cached data
-    
-    if not post:  # If not cached, fetch from the database
+    context = {'sparse': sparse_fieldset(request)}
+    shape = sparse_signature(context['sparse'])
+    cache_key = post_detail_key(pk, shape, shape and post_list_version())
+    entry = cache.get(cache_key)  # Cached posts are already rendered JSON
+
+    if entry is None:  # If not cached, fetch from the database
         try:
-            post = Post.objects.get(pk=pk)
-            cache.set(cache_key, post, timeout=60 * 15)  # Cache for 15 minutes
+            with primary_reads(recently_invalidated(post_list_version())):
+                post = PostDetailSerializer.plan_queryset(Post.objects.all(), context).get(pk=pk)
         except Post.DoesNotExist:
             return Response({"detail": "Not found."}, status=status.HTTP_404_NOT_FOUND)
-    
-    serializer = PostSerializer(post)
-    return Response(serializer.data)
+        validators = PostDetailSerializer.http_validators([post])
+        unchanged = not_modified(request, *validators)
+        if unchanged is not None:
+            return unchanged
+        entry = cache_entry(cache_key, PostDetailSerializer(post, context=context).data, *validators)
 
+    return entry_response(request, entry)
 
-@api_view(['POST'])
+
+@api_view(['GET'])
 @permission_classes([IsAuthenticated])
+def timeline(request):
+    """
+    Home timeline: posts from followed authors and your own, newest first.
+    """
+    paginator = PostFeedPagination()
+    context = {'sparse': sparse_fieldset(request)}
+    posts = paginator.paginate_queryset(PostSerializer.plan_queryset(timeline_queryset(request.user), context), request)
+    serializer = PostSerializer(posts, many=True, context=context)
+    return paginator.get_paginated_response(serializer.data)
+
+
+@api_view(['POST'])
+@permission_classes([IsActiveUser])
 def create_post(request):
     #Adding the current date:
     data = request.data.copy()
     data['date_posted'] = timezone.now().date()
 
     # Serialize the data and create the post
-    serializer = PostSerializer(data=data, context={'request': request})
+    serializer = PostDetailSerializer(data=data, context={'request': request})
     
     if serializer.is_valid():
-        serializer.save()
-        cache.delete('post_list')
+        with transaction.atomic():  # Row, counters and fan-out job commit together
+            post = serializer.save()
+            enqueue_fanout(post)
+        invalidate_post_list()
         return Response(serializer.data, status=status.HTTP_201_CREATED)  # Return the post data with the author info
     
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['POST'])
+@permission_classes([IsActiveUser])
+def bulk_create_posts(request):
+    """
+    Create many posts from an NDJSON body, one post object per line.
+    Returns how many were created and the errors of the rejected lines.
+    """
+    if request.content_type.split(';')[0].strip().lower() != NDJSON_CONTENT_TYPE:  # Ignore parameters such as charset
+        return Response({"detail": f"Send the posts as {NDJSON_CONTENT_TYPE}."}, status=status.HTTP_415_UNSUPPORTED_MEDIA_TYPE)
+
+    # Read the body line by line instead of parsing it whole
+    stream = request.stream
+    report = ingest_posts(iter(stream.readline, b'') if stream else [], request.user)
+    return Response(report, status=status.HTTP_200_OK)
+
+
+@api_view(['POST'])
+@permission_classes([IsActiveUser])
+def upload_image(request, pk):
+    """
+    Attach an image (multipart field ``image``) to a post. The variants are
+    rendered in the background; srcset appears on the post once they are.
+    """
+    try:
+        post = Post.objects.get(pk=pk)
+    except Post.DoesNotExist:
+        return Response({"detail": "Post not found."}, status=status.HTTP_404_NOT_FOUND)
+    if post.author_id != request.user.id:
+        return Response({"detail": "You can only change your own posts."}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return Response({"detail": "Invalid Content-Length header."}, status=status.HTTP_400_BAD_REQUEST)
+    if content_length > settings.POST_IMAGE_MAX_BYTES:
+        return Response({"detail": f"Images may be at most {settings.POST_IMAGE_MAX_BYTES} bytes."}, status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+
+    # Stream the body to a temporary file in chunks, however small it is;
+    # must happen before request.data is first read
+    request._request.upload_handlers = [TemporaryFileUploadHandler(request._request)]
+    upload = request.FILES.get('image')
+    if upload is None:
+        return Response({"detail": "Send the image as the multipart field 'image'."}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        with transaction.atomic():
+            image = upload_post_image(post, upload)
+    except InvalidImage as e:
+        return Response({"detail": str(e)}, status=status.HTTP_400_BAD_REQUEST)
+    return Response({"status": image.status}, status=status.HTTP_202_ACCEPTED)
+
+
+@require_GET
+def serve_post_image(request, path):
+    """Like user.views.serve_avatar: each upload has its own directory, so files never change."""
+    response = serve(request, f'{IMAGE_DIR}/{path}', document_root=settings.MEDIA_ROOT)
+    response['Cache-Control'] = f'public, max-age={IMAGE_MAX_AGE}, immutable'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_posts(request):
+    """
+    Stream posts, each followed by its comments, as NDJSON. ?author=<id>
+    limits the export to one author's posts.
+    """
+    author = request.query_params.get('author')
+    if author is not None and not author.isdigit():
+        return Response({"detail": "author must be a user id."}, status=status.HTTP_400_BAD_REQUEST)
+
+    response = StreamingHttpResponse(export_lines(author and int(author)), content_type=NDJSON_CONTENT_TYPE)
+    response['Content-Disposition'] = 'attachment; filename="posts.ndjson"'
+    return response
+
+
 @api_view(['GET'])
 @permission_classes([AllowAny])
 def get_comments(request, pk):
-    comments = Comment.objects.filter(post_id=pk)
-    serializer = CommentSerializer(comments, many=True)
-    return Response(serializer.data)
+    """
+    A post's comments, oldest first, one cursor page at a time.
+    """
+    paginator = CommentThreadPagination()
+    context = {'sparse': sparse_fieldset(request)}
+    comments = CommentSerializer.plan_queryset(Comment.objects.filter(post_id=pk).only(*COMMENT_FIELDS), context)
+    serializer = CommentSerializer(paginator.paginate_queryset(comments, request), many=True, context=context)
+    return paginator.get_paginated_response(serializer.data)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def get_comment_counts(request):
+    """
+    Comment counts for a page of posts in one query: ?ids=1,2,3
+    """
+    try:
+        post_ids = [int(post_id) for post_id in request.query_params.get('ids', '').split(',') if post_id]
+    except ValueError:
+        return Response({"detail": "ids must be a comma-separated list of post ids."}, status=status.HTTP_400_BAD_REQUEST)
+
+    if len(post_ids) > MAX_COMMENT_COUNT_IDS:
+        return Response({"detail": f"At most {MAX_COMMENT_COUNT_IDS} ids per request."}, status=status.HTTP_400_BAD_REQUEST)
+
+    counts = dict(Post.objects.filter(pk__in=post_ids).values_list('id', 'comment_count'))
+    return Response({str(post_id): counts[post_id] for post_id in post_ids if post_id in counts})
 
 # View to add a comment to a post
 @api_view(['POST'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsActiveUser])
 def add_comment(request, pk):
     data = request.data
     data['post'] = pk
@@ -82,82 +237,108 @@ def add_comment(request, pk):
     serializer = CommentSerializer(data=data, context={'request': request})
 
     if serializer.is_valid():
-        serializer.save()
+        with transaction.atomic():  # Row and counters commit together
+            serializer.save()
         return Response(serializer.data, status=status.HTTP_201_CREATED)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
 # View to delete a comment
 @api_view(['DELETE'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsActiveUser])
 def delete_comment(request, comment_id):
     try:
         comment = Comment.objects.get(id=comment_id)
     except Comment.DoesNotExist:
         return Response({"detail": "Comment not found."}, status=status.HTTP_404_NOT_FOUND)
     
-    if request.user != comment.author:  # Ensure the user is the author of the comment
+    if request.user.id != comment.author_id:  # Ensure the user is the author of the comment
         return Response({"detail": "You don't have permission to delete this comment."}, status=status.HTTP_403_FORBIDDEN)
 
-    comment.delete()
+    with transaction.atomic():  # Row and counters commit together
+        comment.delete()
     return Response(status=status.HTTP_204_NO_CONTENT)
 
 
 @api_view(['GET', 'PUT'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsActiveUser])
 def edit_post(request, pk):
-    cache_key = f'post_detail_{pk}'  # Define a cache key for the specific post
-
     if request.method == 'GET':
-        # Try to get the cached post
-        post = cache.get(cache_key)
-        
-        if not post:  # If not cached, fetch from the database
+        # Same payload as post_detail, so serve it from the same cache entry
+        context = {'sparse': sparse_fieldset(request)}
+        shape = sparse_signature(context['sparse'])
+        cache_key = post_detail_key(pk, shape, shape and post_list_version())
+        entry = cache.get(cache_key)
+
+        if entry is None:  # If not cached, fetch from the database
             try:
-                post = Post.objects.get(pk=pk)
-                cache.set(cache_key, post, timeout=60 * 15)  # Cache for 15 minutes
+                with primary_reads(recently_invalidated(post_list_version())):
+                    post = PostDetailSerializer.plan_queryset(Post.objects.all(), context).get(pk=pk)
             except Post.DoesNotExist:
                 return Response({"detail": "Post not found."}, status=status.HTTP_404_NOT_FOUND)
-        
-        serializer = PostSerializer(post)
-        return Response(serializer.data)
+            validators = PostDetailSerializer.http_validators([post])
+            unchanged = not_modified(request, *validators)
+            if unchanged is not None:
+                return unchanged
+            entry = cache_entry(cache_key, PostDetailSerializer(post, context=context).data, *validators)
+
+        return entry_response(request, entry)
 
     if request.method == 'PUT':
         # Handle the PUT request to update the post
         try:
-            post = Post.objects.get(pk=pk)
+            post = PostDetailSerializer.plan_queryset(Post.objects.all()).get(pk=pk)
         except Post.DoesNotExist:
             return Response({"detail": "Post not found."}, status=status.HTTP_404_NOT_FOUND)
 
         # Ensure the logged-in user is the author of the post
-        if post.author != request.user:
+        if post.author_id != request.user.id:
             return Response({"detail": "You can only edit your own posts."}, status=status.HTTP_403_FORBIDDEN)
 
-        serializer = PostSerializer(post, data=request.data, partial=True)  # partial=True allows partial updates
+        serializer = PostDetailSerializer(post, data=request.data, partial=True)  # partial=True allows partial updates
         if serializer.is_valid():
             serializer.save()
-            # Invalidate the cache for the post
-            cache.delete(cache_key)  # Remove the cached post
-            cache.delete('post_list')
+            # Invalidate the cache for the post and the feed pages
+            invalidate_posts([pk])
             return Response(serializer.data)
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 @api_view(['DELETE'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsActiveUser])
 def delete_post(request, pk):
-    cache_key = f'post_detail_{pk}'  # Define a cache key for the specific post
-
     try:
         post = Post.objects.get(pk=pk)
     except Post.DoesNotExist:
         return Response({"detail": "Post not found."}, status=status.HTTP_404_NOT_FOUND)
 
     # Ensure the logged-in user is the author of the post
-    if post.author != request.user:
+    if post.author_id != request.user.id:
         return Response({"detail": "You can only delete your own posts."}, status=status.HTTP_403_FORBIDDEN)
 
-    post.delete()
-    # Invalidate the cache for the post
-    cache.delete(cache_key)  # Remove the cached post
-    cache.delete('post_list')
-    return Response({"detail": "Post deleted successfully."}, status=status.HTTP_204_NO_CONTENT)
\ No newline at end of file
+    with transaction.atomic():  # Row and counters commit together
+        post.delete()
+    # Invalidate the cache for the post and the feed pages
+    invalidate_posts([pk])
+    return Response({"detail": "Post deleted successfully."}, status=status.HTTP_204_NO_CONTENT)
+
+
+@api_view(['GET'])
+@permission_classes([AllowAny])
+def search(request):
+    """
+    Ranked, highlighted full-text search over posts and comments: ?q=...&limit=...
+    """
+    text = request.query_params.get('q', '').strip()
+    if not text:
+        return Response({"detail": "The q parameter is required."}, status=status.HTTP_400_BAD_REQUEST)
+
+    try:
+        limit = max(1, min(int(request.query_params.get('limit', SEARCH_PAGE_SIZE)), SEARCH_MAX_PAGE_SIZE))
+    except ValueError:
+        limit = SEARCH_PAGE_SIZE
+
+    backend = get_search_backend()
+    return Response({
+        'posts': backend.search_posts(text, limit),
+        'comments': backend.search_comments(text, limit),
+    })
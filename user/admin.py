@@ -1,5 +1,7 @@
 from django.contrib import admin
-from .models import CustomUser
+from .models import CustomUser, OutboundEmail
+
+FOLLOWERS_PREVIEW = 20
 
 @admin.register(CustomUser)
 class CustomUserAdmin(admin.ModelAdmin):
@@ -9,22 +11,30 @@ class CustomUserAdmin(admin.ModelAdmin):
     fieldsets = (
         ('User Info', {'fields': ('username', 'email', 'about_me', 'image')}),
         ('Followers Info', {
-            'fields': ('followers_count', 'followers_list'),  # Add followers fields here
+            'fields': ('followers_count', 'following_count', 'post_count', 'followers_list'),  # Add followers fields here
             'classes': ('collapse',),  # Optional: make this section collapsible
         }),
         ('Permissions', {'fields': ('is_admin','is_staff', 'is_active')}),
     )
-    readonly_fields = ['followers_count', 'followers_list']  # Make these fields read-only
+    readonly_fields = ['followers_count', 'following_count', 'post_count', 'followers_list']  # Make these fields read-only
 
-    def followers_count(self, obj):
-        return obj.followers.count()  
+    def followers_list(self, obj):
+        # Show a bounded sample; the full list is at /api/user/followers/<id>/
+        usernames = list(obj.followers.order_by('username').values_list('username', flat=True)[:FOLLOWERS_PREVIEW])
+        remaining = obj.followers_count - len(usernames)
+        if remaining > 0:
+            usernames.append(f"and {remaining} more")
+        return ", ".join(usernames)
 
 
-    followers_count.short_description = 'Followers Count'  # Set column name in admin
 
-    def followers_list(self, obj):
-        return ", ".join([f.username for f in obj.followers.all()])  # Assuming CustomUser has a username field
+    followers_list.short_description = 'Followers List'  # Set column name in admin
 
 
 
-    followers_list.short_description = 'Followers List'  # Set column name in admin
\ No newline at end of file
+@admin.register(OutboundEmail)
+class OutboundEmailAdmin(admin.ModelAdmin):
+    list_display = ('subject', 'to', 'status', 'attempts', 'next_attempt_at', 'sent_at')
+    list_filter = ('status',)
+    ordering = ('-created_at',)
+    readonly_fields = ('last_error',)
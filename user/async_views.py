@@ -0,0 +1,63 @@
+"""
+Native async version of the public profile endpoint (see blog/async_views.py).
+
+DRF's authentication classes only run inside its sync APIView, so the JWT
+is checked here with the same ClaimsJWTAuthentication, which builds the
+user from the token without a query.
+"""
+from django.http import JsonResponse
+from django.utils.cache import patch_vary_headers
+from django.views.decorators.http import require_GET
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+
+from backend.conditional import is_conditional, not_modified, set_validators
+from blog.async_views import json_response
+from blog.queryplan import sparse_fieldset
+from .auth import ClaimsJWTAuthentication
+from .models import CustomUser
+from .serializers import UserProfileSerializer
+
+jwt_auth = ClaimsJWTAuthentication()
+
+
+async def aauthenticate(request):
+    """The claims-based user behind the request's Bearer token, or None."""
+    header = jwt_auth.get_header(request)
+    raw_token = header and jwt_auth.get_raw_token(header)
+    if not raw_token:
+        return None
+    try:
+        return jwt_auth.get_user(jwt_auth.get_validated_token(raw_token))
+    except (InvalidToken, TokenError):
+        return None
+
+
+@require_GET
+async def get_specific_user_profile(request, user_id):
+    """ Retrieve a specific user's profile.
+    - ❌ Unauthenticated users get a 401 error.
+    - ✅ Authenticated users can view profiles. """
+    user = await aauthenticate(request)
+    if user is None:
+        return JsonResponse({"detail": "Authentication credentials were not provided."}, status=401)
+    request.user = user
+
+    context = {'request': request, 'sparse': sparse_fieldset(request)}  # ✅ Pass request for is_following
+    if is_conditional(request):
+        state = await UserProfileSerializer.validator_queryset(CustomUser.objects.filter(pk=user_id), context).afirst()
+        if state is None:
+            return JsonResponse({"detail": "User not found."}, status=404)
+        unchanged = not_modified(request, *UserProfileSerializer.http_validators(context, **state))
+        if unchanged is not None:
+            patch_vary_headers(unchanged, ['Authorization'])
+            return unchanged
+
+    try:
+        profile = await UserProfileSerializer.plan_queryset(CustomUser.objects.all(), context).aget(pk=user_id)
+    except CustomUser.DoesNotExist:
+        return JsonResponse({"detail": "User not found."}, status=404)
+
+    serializer = UserProfileSerializer(profile, context=context)
+    response = set_validators(json_response(serializer.data), *UserProfileSerializer.instance_http_validators(profile, context))
+    patch_vary_headers(response, ['Authorization'])
+    return response
@@ -0,0 +1,205 @@
+"""
+Claims-based JWT authentication.
+
+Tokens from ClaimsRefreshToken carry the user's id, username, is_admin and a
+snapshot of their image. ClaimsJWTAuthentication turns a validated access
+token into a ClaimsUser without querying the database. That is all
+IsAuthenticated and the ``request.user.id`` ownership checks need.
+
+Rotated refresh tokens are blacklisted by jti, see user/blacklist.py.
+
+Any other attribute loads the full CustomUser from the database, once per
+request.
+
+An access token outlives a deactivation, a deletion or a lost admin role by
+up to its lifetime. So views that write use IsActiveUser and admin views use
+IsAdmin, which check the account through cached_user(). That is a short-lived
+(USER_CACHE_SECONDS) cache of the few columns those checks and the claims
+need, never the password hash or anything else in the row.
+"""
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.utils.functional import cached_property
+from rest_framework.exceptions import AuthenticationFailed
+from rest_framework.permissions import SAFE_METHODS, IsAuthenticated
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken, TokenError
+from rest_framework_simplejwt.serializers import TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
+from rest_framework_simplejwt.utils import datetime_from_epoch
+
+from .blacklist import token_blacklist
+from .models import CustomUser
+
+USER_CLAIMS = ('username', 'is_admin', 'image')
+
+
+class CachedUser(NamedTuple):
+    """What the auth checks and the claims read from an account."""
+    id: int
+    is_active: bool
+    is_admin: bool
+    username: str
+    image: str
+
+
+def user_cache_key(user_id):
+    return f'auth_user_{user_id}'
+
+
+def cached_user(user_id):
+    """The CachedUser for ``user_id`` from the user cache or the database, or None."""
+    user = cache.get(user_cache_key(user_id))
+    if user is None:
+        values = CustomUser.objects.filter(pk=user_id).values_list(*CachedUser._fields).first()
+        if values is not None:
+            user = CachedUser(*values)
+            cache.set(user_cache_key(user_id), user, timeout=settings.USER_CACHE_SECONDS)
+    return user
+
+
+def forget_user(user_id):
+    cache.delete(user_cache_key(user_id))
+
+
+def add_claims(token, user):
+    for claim in USER_CLAIMS:
+        token[claim] = getattr(user, claim)
+    return token
+
+
+class ClaimsRefreshToken(RefreshToken):
+    """
+    A refresh token whose access tokens carry USER_CLAIMS, checked against
+    and added to the jti blacklist in user/blacklist.py.
+    """
+
+    user = None  # Set when issued at login, so the claims need no lookup
+
+    @classmethod
+    def for_user(cls, user):
+        token = add_claims(super().for_user(user), user)
+        token.user = user
+        return token
+
+    @property
+    def access_token(self):
+        # Refreshing re-reads the claims, so a renamed user's snapshot is at
+        # most one access token old
+        user = self.user or cached_user(self[api_settings.USER_ID_CLAIM])
+        if user is None or not user.is_active:
+            raise InvalidToken("User not found or inactive.")
+        return add_claims(super().access_token, user)
+
+    def verify(self):
+        super().verify()
+        if self[api_settings.JTI_CLAIM] in token_blacklist:
+            raise TokenError("Token is blacklisted")
+
+    def blacklist(self):
+        # Called by TokenRefreshSerializer on rotation; only one of two
+        # concurrent refreshes with the same token gets through
+        if not token_blacklist.add(self[api_settings.JTI_CLAIM], datetime_from_epoch(self['exp'])):
+            raise TokenError("Token is blacklisted")
+
+
+class ClaimsTokenRefreshSerializer(TokenRefreshSerializer):
+    token_class = ClaimsRefreshToken
+
+
+class ClaimsUser:
+    """
+    The user behind a validated access token.
+
+    ``id``/``pk`` and USER_CLAIMS are read from the token, or from
+    cached_user() for an older token that lacks one. Everything else
+    hydrates the CustomUser.
+    """
+    is_anonymous = False
+    is_authenticated = True
+
+    def __init__(self, token):
+        self.token = token
+        self.id = self.pk = token[api_settings.USER_ID_CLAIM]
+
+    @cached_property
+    def instance(self):
+        user = CustomUser.objects.filter(pk=self.id).first()
+        if user is None:
+            raise AuthenticationFailed("User not found.", code='user_not_found')
+        return user
+
+    def claim(self, name):
+        if name in self.token:
+            return self.token[name]
+        user = cached_user(self.id)
+        if user is None:
+            raise AuthenticationFailed("User not found.", code='user_not_found')
+        return getattr(user, name)
+
+    username = property(lambda self: self.claim('username'))
+    is_admin = property(lambda self: self.claim('is_admin'))
+    image = property(lambda self: self.claim('image'))
+
+    def __getattr__(self, name):
+        # Only reached for attributes not defined above
+        if name.startswith('_'):
+            raise AttributeError(name)
+        return getattr(self.instance, name)
+
+    def __eq__(self, other):
+        if not isinstance(other, (ClaimsUser, CustomUser)):
+            return NotImplemented
+        return self.pk == other.pk
+
+    def __hash__(self):
+        return hash(self.pk)
+
+    def __str__(self):
+        return self.username
+
+
+def hydrated_user(user):
+    """The CustomUser behind ``request.user``, whichever way it was authenticated."""
+    return user.instance if isinstance(user, ClaimsUser) else user
+
+
+class ClaimsJWTAuthentication(JWTAuthentication):
+
+    def get_user(self, validated_token):
+        if api_settings.USER_ID_CLAIM not in validated_token:
+            raise InvalidToken("Token contained no recognizable user identification")
+        return ClaimsUser(validated_token)
+
+
+class IsActiveUser(IsAuthenticated):
+    """
+    IsAuthenticated, and for unsafe methods an account that still exists and
+    is active. Reads keep trusting the token alone.
+    """
+
+    def has_permission(self, request, view):
+        if not super().has_permission(request, view):
+            return False
+        if request.method in SAFE_METHODS:
+            return True
+        user = cached_user(request.user.pk)
+        if user is None or not user.is_active:
+            raise AuthenticationFailed("User not found or inactive.", code='user_inactive')
+        return True
+
+
+class IsAdmin(IsAuthenticated):
+    """
+    An active account whose ``is_admin`` flag is still set, checked through
+    cached_user() rather than the claim so a revoked admin loses access.
+    """
+
+    def has_permission(self, request, view):
+        if not super().has_permission(request, view):
+            return False
+        user = cached_user(request.user.pk)
+        return user is not None and user.is_active and user.is_admin
@@ -0,0 +1,127 @@
+"""
+Initials avatars, rendered locally with Pillow.
+
+A user without an uploaded image gets their initials on a background colour
+picked from the username. The avatar is rendered once per AVATAR_SIZES
+entry and stored under MEDIA_ROOT as avatars/<key>/<size>.png. The key is a
+hash of everything the pixels depend on, so a file never changes once
+written, and users who share initials and colour share files. serve_avatar
+(user/views.py) sends them with a one-year immutable Cache-Control.
+"""
+import hashlib
+from io import BytesIO
+from urllib.parse import urlsplit
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from PIL import Image, ImageDraw, ImageFont
+
+STYLE_VERSION = 1  # Bump when the rendering changes, so new files get new keys
+AVATAR_DIR = 'avatars'
+AVATAR_MAX_AGE = 60 * 60 * 24 * 365
+LEGACY_PREFIX = 'https://ui-avatars.com/'
+PALETTE = (
+    '#1abc9c', '#2ecc71', '#3498db', '#9b59b6', '#34495e', '#16a085', '#27ae60', '#2980b9',
+    '#8e44ad', '#2c3e50', '#f39c12', '#e67e22', '#e74c3c', '#c0392b', '#d35400', '#7f8c8d',
+)
+
+
+def initials(username):
+    words = username.split()
+    if len(words) > 1:
+        return (words[0][0] + words[1][0]).upper()
+    return ''.join(char for char in username if char.isalnum())[:2].upper() or '?'
+
+
+def background(username):
+    digest = hashlib.md5(username.lower().encode()).digest()
+    return PALETTE[digest[0] % len(PALETTE)]
+
+
+def avatar_key(text, colour):
+    return hashlib.sha256(f'{STYLE_VERSION}:{text}:{colour}'.encode()).hexdigest()[:32]
+
+
+def avatar_path(key, size):
+    return f'{AVATAR_DIR}/{key}/{size}.png'
+
+
+def render_avatar(text, colour, size):
+    image = Image.new('RGB', (size, size), colour)
+    font = ImageFont.load_default(size=round(size * 0.42))
+    ImageDraw.Draw(image).text((size / 2, size / 2), text, fill='white', font=font, anchor='mm')
+    out = BytesIO()
+    image.save(out, format='PNG', optimize=True)
+    return out.getvalue()
+
+
+def ensure_avatar(username):
+    """Render any missing sizes of ``username``'s avatar and return its key."""
+    text, colour = initials(username), background(username)
+    key = avatar_key(text, colour)
+    for size in settings.AVATAR_SIZES:
+        path = avatar_path(key, size)
+        if default_storage.exists(path):
+            continue
+        saved = default_storage.save(path, ContentFile(render_avatar(text, colour, size)))
+        if saved != path:  # Another worker wrote the same file first
+            default_storage.delete(saved)
+    return key
+
+
+def avatar_url(username, size=None):
+    key = ensure_avatar(username)
+    return default_storage.url(avatar_path(key, size or settings.AVATAR_DEFAULT_SIZE))
+
+
+def stale_prefixes():
+    """
+    Prefixes of generated avatar URLs that need rewriting: ui-avatars.com
+    ones, and ours from when they were stored host-relative.
+    """
+    ours = default_storage.url(f'{AVATAR_DIR}/')
+    relative = urlsplit(ours).path
+    return (LEGACY_PREFIX,) if relative == ours else (LEGACY_PREFIX, relative)
+
+
+def is_generated(url):
+    """Whether ``url`` is an initials avatar, ours or a ui-avatars.com one."""
+    return url.startswith((default_storage.url(f'{AVATAR_DIR}/'), *stale_prefixes()))
+
+
+def backfill_avatars(batch_size=500):
+    """
+    Give every user without an image, or with a ui-avatars.com or
+    host-relative one, a local avatar at an absolute URL. Returns the number
+    of users updated.
+    """
+    from django.db.models import Q
+    from django.utils import timezone
+
+    from blog.cache import invalidate_posts
+    from blog.models import Post
+    from .auth import forget_user
+    from .models import CustomUser
+
+    stale = Q(image='')
+    for prefix in stale_prefixes():
+        stale |= Q(image__startswith=prefix)
+    pending = CustomUser.objects.filter(stale).order_by('pk')
+    urls = {}  # One render check per distinct avatar
+    updated, last_pk = 0, 0
+    while batch := list(pending.filter(pk__gt=last_pk).only('pk', 'username', 'image')[:batch_size]):
+        now = timezone.now()
+        for user in batch:
+            key = (initials(user.username), background(user.username))
+            if key not in urls:
+                urls[key] = avatar_url(user.username)
+            user.image, user.updated_at = urls[key], now
+        # bulk_update skips save() and its signals, so do their work here
+        CustomUser.objects.bulk_update(batch, ['image', 'updated_at'])
+        invalidate_posts(Post.objects.filter(author__in=batch).values_list('pk', flat=True))
+        for user in batch:
+            forget_user(user.pk)
+        updated += len(batch)
+        last_pk = batch[-1].pk
+    return updated
@@ -0,0 +1,162 @@
+"""
+Refresh token blacklist.
+
+Rotating a refresh token blacklists the old one by jti (see
+ClaimsRefreshToken in user/auth.py). A BlacklistedToken row only lives until
+the token would have expired anyway. The purge_token_blacklist command
+deletes it after that, so the table never holds more than one
+REFRESH_TOKEN_LIFETIME worth of rotations.
+
+Each worker keeps a BloomFilter of the blacklisted jtis. Nearly every
+refresh presents a token that was never blacklisted, and the filter rules
+that out in memory; only possible hits reach the unique jti index. The
+table is only ever scanned by publish_filter, which purge_token_blacklist
+runs after each purge: it stores the filter in the shared cache, and a
+worker swaps it in when the published version changes. A shared cache
+counter tells a worker when another one has blacklisted tokens, and it then
+loads only the rows added since the filter was built. Until a filter is
+published every lookup goes to the jti index.
+"""
+import hashlib
+import math
+import threading
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import IntegrityError, transaction
+from django.utils import timezone
+
+from .models import BlacklistedToken
+
+GENERATION_KEY = 'token_blacklist_generation'
+FILTER_KEY = 'token_blacklist_filter'
+FILTER_VERSION_KEY = 'token_blacklist_filter_version'
+BLOOM_ERROR_RATE = 0.01
+
+# Recent rows are reloaded with this much overlap, so a row whose insert
+# committed just after a sync read is still picked up by the next one
+SYNC_OVERLAP = timedelta(seconds=5)
+
+
+class BloomFilter:
+    """A fixed-size set of strings without false negatives."""
+
+    def __init__(self, capacity, error_rate=BLOOM_ERROR_RATE):
+        self.size = max(64, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+
+    def positions(self, key):
+        # Double hashing: k positions from one 128-bit digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        first = int.from_bytes(digest[:8], 'little')
+        step = int.from_bytes(digest[8:], 'little') | 1
+        return [(first + i * step) % self.size for i in range(self.hashes)]
+
+    def add(self, key):
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    @classmethod
+    def from_bits(cls, size, hashes, bits):
+        bloom = cls.__new__(cls)
+        bloom.size, bloom.hashes, bloom.bits = size, hashes, bytearray(bits)
+        return bloom
+
+    def __contains__(self, key):
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+
+def live_rows():
+    return BlacklistedToken.objects.filter(expires_at__gt=timezone.now())
+
+
+class TokenBlacklist:
+
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.bloom = None
+        self.version = None
+        self.generation = None
+        self.synced_at = None
+
+    def sync(self):
+        current = cache.get_many([FILTER_VERSION_KEY, GENERATION_KEY])
+        version, generation = current.get(FILTER_VERSION_KEY), current.get(GENERATION_KEY, 0)
+        if version != self.version:
+            published = cache.get(FILTER_KEY) if version is not None else None
+            bloom = None
+            if published is not None and published['version'] == version:
+                bloom = BloomFilter.from_bits(published['size'], published['hashes'], published['bits'])
+            with self.lock:
+                # Rows blacklisted since the build are reloaded below
+                self.bloom, self.version, self.generation = bloom, version, None
+                self.synced_at = published['built_at'] if bloom is not None else None
+        with self.lock:
+            bloom, synced_at = self.bloom, self.synced_at
+            if bloom is None or generation == self.generation:
+                return
+        started = timezone.now()
+        recent = BlacklistedToken.objects.filter(blacklisted_at__gte=synced_at - SYNC_OVERLAP)
+        jtis = list(recent.values_list('jti', flat=True))
+        with self.lock:
+            if self.bloom is bloom:
+                for jti in jtis:
+                    bloom.add(jti)
+                self.synced_at, self.generation = started, generation
+
+    def __contains__(self, jti):
+        self.sync()
+        bloom = self.bloom
+        if bloom is not None and jti not in bloom:
+            return False  # The common case, settled without a query
+        return live_rows().filter(jti=jti).exists()
+
+    def add(self, jti, expires_at):
+        """Blacklist ``jti``; False if it already was, e.g. by a concurrent refresh."""
+        try:
+            with transaction.atomic():
+                BlacklistedToken.objects.create(jti=jti, expires_at=expires_at)
+        except IntegrityError:
+            return False
+        with self.lock:
+            if self.bloom is not None:
+                self.bloom.add(jti)
+        try:
+            cache.incr(GENERATION_KEY)
+        except ValueError:  # Never set, or evicted; a timestamp can't repeat an old value
+            cache.set(GENERATION_KEY, time.time_ns(), timeout=None)
+        return True
+
+
+token_blacklist = TokenBlacklist()
+
+
+def purge_expired(batch_size=5000):
+    """Delete the rows of tokens that have expired; returns how many went."""
+    purged = 0
+    while True:
+        pks = list(
+            BlacklistedToken.objects.filter(expires_at__lte=timezone.now()).values_list('pk', flat=True)[:batch_size]
+        )
+        if not pks:
+            return purged
+        purged += BlacklistedToken.objects.filter(pk__in=pks).delete()[0]
+
+
+def publish_filter():
+    """Build a BloomFilter of the live jtis and share it with every worker; returns its size."""
+    started = timezone.now()
+    count = live_rows().count()
+    bloom = BloomFilter(max(settings.TOKEN_BLACKLIST_BLOOM_CAPACITY, count * 2))
+    for jti in live_rows().values_list('jti', flat=True).iterator(chunk_size=10000):
+        bloom.add(jti)
+    version = time.time_ns()
+    cache.set(FILTER_KEY, {
+        'version': version, 'size': bloom.size, 'hashes': bloom.hashes,
+        'bits': bytes(bloom.bits), 'built_at': started,
+    }, timeout=None)
+    cache.set(FILTER_VERSION_KEY, version, timeout=None)
+    return count
@@ -0,0 +1,57 @@
+"""
+Follow-state lookups.
+
+Each (follower, followed) pair is answered by an EXISTS on the follow table's
+unique (from_customuser, to_customuser) index and cached per follower, so a
+page of authors needs at most one query however many follow buttons it has.
+follow_user/unfollow_user refresh the cached pair after every change.
+"""
+from django.core.cache import cache
+
+from .models import CustomUser
+
+Follow = CustomUser.followers.through
+
+FOLLOW_STATE_TIMEOUT = 60 * 15  # 15 minutes
+MAX_FOLLOW_STATE_IDS = 100
+
+
+def follow_state_key(follower_id, user_id):
+    return f'follow_state_{follower_id}_{user_id}'
+
+
+def follow_exists(follower_id, user_id):
+    """Uncached check, for write paths that must see the database."""
+    return Follow.objects.filter(from_customuser_id=user_id, to_customuser_id=follower_id).exists()
+
+
+def is_following(follower_id, user_id):
+    state = cache.get(follow_state_key(follower_id, user_id))
+    if state is None:
+        state = follow_exists(follower_id, user_id)
+        cache.set(follow_state_key(follower_id, user_id), state, timeout=FOLLOW_STATE_TIMEOUT)
+    return state
+
+
+def follow_states(follower_id, user_ids):
+    """Map each of user_ids to whether follower_id follows them, in one query at most."""
+    keys = {follow_state_key(follower_id, user_id): user_id for user_id in user_ids}
+    states = {keys[key]: state for key, state in cache.get_many(keys).items()}
+
+    missing = [user_id for user_id in user_ids if user_id not in states]
+    if missing:
+        followed = set(
+            Follow.objects.filter(to_customuser_id=follower_id, from_customuser_id__in=missing)
+            .values_list('from_customuser_id', flat=True)
+        )
+        fetched = {user_id: user_id in followed for user_id in missing}
+        cache.set_many(
+            {follow_state_key(follower_id, user_id): state for user_id, state in fetched.items()},
+            timeout=FOLLOW_STATE_TIMEOUT,
+        )
+        states.update(fetched)
+    return states
+
+
+def set_follow_state(follower_id, user_id, state):
+    cache.set(follow_state_key(follower_id, user_id), state, timeout=FOLLOW_STATE_TIMEOUT)
@@ -0,0 +1,112 @@
+"""
+Outbound mail queue.
+
+Views call queue_email() and return as soon as the OutboundEmail row is
+written. The send_queued_email worker claims due rows in batches, sends
+them over one SMTP connection, and reschedules failures with exponential
+backoff. Sent rows keep their metadata, but their body is cleared because
+it holds OTPs and reset links.
+"""
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F
+from django.utils import timezone
+
+from .models import OutboundEmail
+
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = timedelta(seconds=30)
+BACKOFF_MAX = timedelta(hours=1)
+
+# A claimed row is invisible to other workers for this long; if the worker
+# dies mid-batch the row simply becomes due again.
+CLAIM_LEASE = timedelta(minutes=5)
+
+
+def queue_email(subject, message, recipient_list, from_email=None):
+    return OutboundEmail.objects.create(
+        subject=subject,
+        body=message,
+        from_email=from_email or settings.EMAIL_HOST_USER,
+        to=list(recipient_list),
+    )
+
+
+def backoff(attempts):
+    return min(BACKOFF_BASE * 2 ** (attempts - 1), BACKOFF_MAX)
+
+
+def claim_due_emails(batch_size):
+    now = timezone.now()
+    with transaction.atomic():
+        emails = list(
+            OutboundEmail.objects.select_for_update(skip_locked=True)
+            .filter(status=OutboundEmail.PENDING, next_attempt_at__lte=now)
+            .order_by('next_attempt_at')[:batch_size]
+        )
+        OutboundEmail.objects.filter(pk__in=[email.pk for email in emails]).update(
+            attempts=F('attempts') + 1, next_attempt_at=now + CLAIM_LEASE,
+        )
+    for email in emails:
+        email.attempts += 1
+    return emails
+
+
+def send_queued_emails(batch_size=50):
+    """Send up to ``batch_size`` due emails over one connection; returns (sent, failed)."""
+    emails = claim_due_emails(batch_size)
+    if not emails:
+        return 0, 0
+
+    sent = failed = 0
+    connection = get_connection()
+    connected = False
+    try:
+        for index, email in enumerate(emails):
+            if not connected:
+                try:
+                    connection.open()
+                except Exception as e:
+                    # No server to talk to: the rest of the batch backs off unsent
+                    for unsent in emails[index:]:
+                        record_failure(unsent, e)
+                    failed += len(emails) - index
+                    break
+                connected = True
+            message = EmailMessage(email.subject, email.body, email.from_email, email.to, connection=connection)
+            try:
+                message.send()
+            except Exception as e:
+                failed += 1
+                record_failure(email, e)
+                # The SMTP session may be unusable after an error, reconnect for the next one
+                close_quietly(connection)
+                connected = False
+            else:
+                sent += 1
+                OutboundEmail.objects.filter(pk=email.pk).update(
+                    status=OutboundEmail.SENT, sent_at=timezone.now(), body='', last_error='',
+                )
+    finally:
+        if connected:
+            close_quietly(connection)
+    return sent, failed
+
+
+def close_quietly(connection):
+    try:
+        connection.close()
+    except Exception:
+        pass  # A dead session has nothing left to flush
+
+
+def record_failure(email, error):
+    if email.attempts >= MAX_ATTEMPTS:
+        OutboundEmail.objects.filter(pk=email.pk).update(status=OutboundEmail.FAILED, last_error=str(error))
+    else:
+        OutboundEmail.objects.filter(pk=email.pk).update(
+            next_attempt_at=timezone.now() + backoff(email.attempts), last_error=str(error),
+        )
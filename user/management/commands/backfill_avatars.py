@@ -0,0 +1,14 @@
+from django.core.management.base import BaseCommand
+
+from user.avatars import backfill_avatars
+
+
+class Command(BaseCommand):
+    help = "Render local initials avatars for users with no image or a ui-avatars.com one."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=500, help="Users per UPDATE (default: 500).")
+
+    def handle(self, *args, **options):
+        updated = backfill_avatars(batch_size=options['batch_size'])
+        self.stdout.write(self.style.SUCCESS(f"{updated} user(s) now use a local avatar."))
@@ -0,0 +1,26 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user.blacklist import publish_filter, purge_expired
+
+
+class Command(BaseCommand):
+    help = (
+        "Delete blacklisted refresh tokens that have expired and publish the filter of the live ones. "
+        "Run it from cron, or keep it running with --interval."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=5000, help="Rows per DELETE (default: 5000).")
+        parser.add_argument('--interval', type=float, help="Purge again every this many seconds instead of exiting.")
+
+    def handle(self, *args, **options):
+        while True:
+            purged = purge_expired(batch_size=options['batch_size'])
+            self.stdout.write(f"Purged {purged} expired token(s)")
+            live = publish_filter()
+            self.stdout.write(f"Published a filter of {live} live token(s)")
+            if options['interval'] is None:
+                break
+            time.sleep(options['interval'])
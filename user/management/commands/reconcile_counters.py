@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from user.counters import reconcile_counters
+
+
+class Command(BaseCommand):
+    help = "Recompute follower, following, post and comment counters that have drifted from their tables."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=1000, help="Rows per UPDATE (default: 1000).")
+
+    def handle(self, *args, **options):
+        fixed = reconcile_counters(batch_size=options['batch_size'])
+        for label, rows in fixed.items():
+            self.stdout.write(f"{label}: {rows} row(s) fixed")
+        self.stdout.write(self.style.SUCCESS("Counters reconciled."))
@@ -0,0 +1,24 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from user.mail import send_queued_emails
+
+
+class Command(BaseCommand):
+    help = "Deliver queued OTP and password reset emails over a pooled SMTP connection."
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true', help="Drain the queue once and exit.")
+        parser.add_argument('--batch-size', type=int, default=50, help="Emails sent per connection (default: 50).")
+        parser.add_argument('--interval', type=float, default=1.0, help="Seconds to sleep when nothing is due (default: 1).")
+
+    def handle(self, *args, **options):
+        while True:
+            sent, failed = send_queued_emails(batch_size=options['batch_size'])
+            if sent or failed:
+                self.stdout.write(f"Sent {sent} email(s), {failed} failed")
+                continue
+            if options['once']:
+                break
+            time.sleep(options['interval'])
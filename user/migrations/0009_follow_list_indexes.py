@@ -0,0 +1,23 @@
+# Cursor pagination of followers/following walks the follow table by
+# (user, id). The auto-created through model can't declare Meta.indexes, so
+# the indexes are created with plain SQL that both PostgreSQL and SQLite accept.
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('user', '0008_customuser_followers_count_and_more'),
+    ]
+
+    operations = [
+        migrations.RunSQL(
+            'CREATE INDEX follow_followers_idx ON user_customuser_followers (from_customuser_id, id);',
+            'DROP INDEX follow_followers_idx;',
+        ),
+        migrations.RunSQL(
+            'CREATE INDEX follow_following_idx ON user_customuser_followers (to_customuser_id, id);',
+            'DROP INDEX follow_following_idx;',
+        ),
+    ]
@@ -1,8 +1,11 @@
 from django.contrib.auth.models import AbstractUser
 from django.db import models
+from django.utils import timezone
 from django.core.exceptions import ValidationError
 import re
 
+from .avatars import avatar_url, is_generated
+
 
 def validate_username(value):
     regex = r'^[a-zA-Z0-9@.+_\- ]+$'
@@ -49,7 +52,16 @@ class CustomUser(AbstractUser):
     followers = models.ManyToManyField('self', symmetrical=False, related_name='following', blank=True)
     
     is_admin = models.BooleanField(default=False)
-    
+
+    # Denormalized counters, kept in sync by user/signals.py and blog/signals.py
+    # and repaired by the reconcile_counters command
+    followers_count = models.PositiveIntegerField(default=0, editable=False)
+    following_count = models.PositiveIntegerField(default=0, editable=False)
+    post_count = models.PositiveIntegerField(default=0, editable=False)
+
+    # Bumped by save() and by the counter updates, so it changes whenever the
+    # profile payload does (see backend/conditional.py)
+    updated_at = models.DateTimeField(auto_now=True)
 
 
     def clean(self):
@@ -63,10 +75,64 @@ class CustomUser(AbstractUser):
         return self.username
 
     def get_image_url(self):
-        return f"https://ui-avatars.com/api/?name={self.username.replace(' ', '+')}&background=random"
+        return avatar_url(self.username)
+
+    @classmethod
+    def from_db(cls, db, field_names, values):
+        user = super().from_db(db, field_names, values)
+        user._saved_avatar = user.avatar_source()
+        return user
+
+    def avatar_source(self):
+        # Read from __dict__ so a deferred field isn't fetched just to compare it
+        return self.__dict__.get('username'), self.__dict__.get('image')
 
     def save(self, *args, **kwargs):
-        # Set default image URL if not already set
-        if not self.image:
-            self.image = self.get_image_url()
+        # Default to an initials avatar, and keep it in step with the username.
+        # Rendering checks storage for every size, so only do it when the
+        # username or image changed, not on counter or last_login saves.
+        update_fields = kwargs.get('update_fields')
+        if update_fields is None or {'username', 'image'} & set(update_fields):
+            if self.avatar_source() != getattr(self, '_saved_avatar', None) and (not self.image or is_generated(self.image)):
+                self.image = self.get_image_url()
+                if update_fields is not None:
+                    kwargs['update_fields'] = {*update_fields, 'image'}
         super().save(*args, **kwargs)
+        self._saved_avatar = self.avatar_source()
+
+
+class OutboundEmail(models.Model):
+    """A queued email, delivered by the send_queued_email worker (see user/mail.py)."""
+    PENDING = 'pending'
+    SENT = 'sent'
+    FAILED = 'failed'
+    STATUS_CHOICES = [(PENDING, 'Pending'), (SENT, 'Sent'), (FAILED, 'Failed')]
+
+    subject = models.CharField(max_length=255)
+    body = models.TextField()
+    from_email = models.CharField(max_length=255)
+    to = models.JSONField()
+    status = models.CharField(max_length=10, choices=STATUS_CHOICES, default=PENDING)
+    attempts = models.PositiveSmallIntegerField(default=0)
+    next_attempt_at = models.DateTimeField(default=timezone.now)
+    last_error = models.TextField(blank=True, default='')
+    created_at = models.DateTimeField(auto_now_add=True)
+    sent_at = models.DateTimeField(null=True, blank=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'next_attempt_at'], name='outbox_due_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.subject} to {', '.join(self.to)} ({self.status})"
+
+
+class BlacklistedToken(models.Model):
+    """A rotated refresh token that must not be used again (see user/blacklist.py)."""
+    jti = models.CharField(max_length=255, unique=True)
+    expires_at = models.DateTimeField(db_index=True)  # Purged once the token is dead anyway
+    blacklisted_at = models.DateTimeField(auto_now_add=True, db_index=True)
+
+    def __str__(self):
+        return f"Refresh token {self.jti} (expires {self.expires_at:%Y-%m-%d %H:%M})"
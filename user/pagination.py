@@ -0,0 +1,6 @@
+from blog.pagination import KeysetPagination
+
+
+class FollowPagination(KeysetPagination):
+    # Follow rows newest first, i.e. most recent followers at the top
+    keys = ('id',)
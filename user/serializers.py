@@ -2,7 +2,11 @@ from rest_framework import serializers
 from django.core.validators import validate_email as django_validate_email
 from django.core.exceptions import ValidationError as DjangoValidationError , ObjectDoesNotExist
 from .models import CustomUser, validate_password
+from .follows import is_following
+from django.db.models import Exists, Max, OuterRef
 from blog.serializers import PostSerializer
+from blog.queryplan import QueryPlanMixin
+from backend.conditional import make_validators
 
 def validate_email_uniqueness(value, instance=None):
     try:
@@ -45,32 +49,35 @@ class UserSerializer(serializers.ModelSerializer):
         )
         return user
 
-#User Profile Serializer
-class UserProfileSerializer(serializers.ModelSerializer):
+#Lightweight profile: counts only, no embedded posts or follower lists
+class UserSummarySerializer(QueryPlanMixin, serializers.ModelSerializer):
     date_joined = serializers.DateTimeField(read_only=True)
     post_count = serializers.SerializerMethodField(read_only=True)
-    posts = PostSerializer(many=True, read_only=True)
     followers_count = serializers.SerializerMethodField(read_only=True)
-    followers_list = serializers.SerializerMethodField(read_only=True)
     is_following = serializers.SerializerMethodField(read_only=True)
 
-
     class Meta:
         model = CustomUser
-        fields = ['id', 'username', 'email', 'image', 'date_joined','about_me', 'post_count', 'posts', 'followers_count', 'followers_list', 'is_following','is_admin']
+        fields = ['id', 'username', 'image', 'date_joined', 'about_me', 'post_count', 'followers_count', 'following_count', 'is_following']
         extra_kwargs = {
             'about_me': {'read_only': True},
         }
-        
+
+    @classmethod
+    def get_annotations(cls, context):
+        request = context.get('request')
+        if not request or request.user.is_anonymous or not cls.wants_field('is_following', context):
+            return {}
+        follows = CustomUser.followers.through.objects.filter(
+            from_customuser=OuterRef('pk'), to_customuser=request.user.pk,
+        )
+        return {'is_followed_by_request_user': Exists(follows)}
+
     def get_post_count(self, obj):
-        return obj.posts.count()
+        return obj.post_count
     
     def get_followers_count(self, obj):
-        return obj.followers.count()
-    
-
-    def get_followers_list(self, obj):
-        return [f.username for f in obj.followers.all()]
+        return obj.followers_count
     
     def get_is_following(self, obj):
         request = self.context.get('request', None)
@@ -84,9 +91,44 @@ class UserProfileSerializer(serializers.ModelSerializer):
         if user == obj:
             return False
 
-        
-        return user in obj.followers.all()
+        if hasattr(obj, 'is_followed_by_request_user'):  # Annotated by plan_queryset
+            return obj.is_followed_by_request_user
+        return is_following(user.pk, obj.pk)
+
+
+#User Profile Serializer
+class UserProfileSerializer(UserSummarySerializer):
+    posts = PostSerializer(many=True, read_only=True)
+
+    # Followers are served page by page from followers/<user_id>/
+    class Meta(UserSummarySerializer.Meta):
+        fields = ['id', 'username', 'email', 'image', 'date_joined','about_me', 'post_count', 'posts', 'followers_count', 'following_count', 'is_following','is_admin']
+
+    @classmethod
+    def validator_queryset(cls, queryset, context):
+        """Just the columns http_validators needs, so a conditional GET costs one narrow query."""
+        annotations = cls.get_annotations(context)
+        if cls.wants_field('posts', context):
+            annotations['posts_updated_at'] = Max('posts__updated_at')
+        return queryset.annotate(**annotations).values('pk', 'updated_at', *annotations)
+
+    @classmethod
+    def http_validators(cls, context, pk, updated_at, posts_updated_at=None, is_followed_by_request_user=False):
+        # The user row (counters included), their posts and the viewer's own
+        # follow are everything the payload is built from
+        viewer = context['request'].user.pk
+        return make_validators(
+            [pk, updated_at, posts_updated_at, is_followed_by_request_user, viewer], [updated_at, posts_updated_at],
+        )
 
+    @classmethod
+    def instance_http_validators(cls, obj, context):
+        """http_validators for a profile loaded through plan_queryset."""
+        posts_updated_at = None
+        if cls.wants_field('posts', context):  # Otherwise they weren't prefetched
+            posts_updated_at = max((post.updated_at for post in obj.posts.all()), default=None)
+        is_followed = getattr(obj, 'is_followed_by_request_user', False)
+        return cls.http_validators(context, obj.pk, obj.updated_at, posts_updated_at, is_followed)
 
 
 #User Profile Update Serializer
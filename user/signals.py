@@ -0,0 +1,60 @@
+from django.db.models import F
+from django.db.models.functions import Greatest
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_delete
+from django.dispatch import receiver
+from django.utils import timezone
+
+from .auth import forget_user
+from .models import CustomUser
+
+Follow = CustomUser.followers.through
+
+
+def adjust_counter(pks, field, delta):
+    # update() skips auto_now; the counts are part of the profile payload
+    CustomUser.objects.filter(pk__in=pks).update(**{field: Greatest(F(field) + delta, 0), 'updated_at': timezone.now()})
+
+
+def apply_follow_delta(instance, reverse, pks, delta):
+    if not pks:
+        return
+    if reverse:  # user.following.add/remove(*followed)
+        adjust_counter([instance.pk], 'following_count', delta * len(pks))
+        adjust_counter(pks, 'followers_count', delta)
+    else:  # user.followers.add/remove(*followers)
+        adjust_counter([instance.pk], 'followers_count', delta * len(pks))
+        adjust_counter(pks, 'following_count', delta)
+
+
+@receiver(m2m_changed, sender=Follow)
+def count_follows(sender, instance, action, reverse, pk_set, **kwargs):
+    # m2m_changed runs inside the same transaction as the row changes.
+    # On post_add pk_set is the rows Django found missing with an unlocked
+    # SELECT before inserting with ignore_conflicts, so two concurrent adds of
+    # the same pair both count it. Callers must serialise adds by locking the
+    # followed user's row first, as follow_user does. On remove pk_set holds
+    # whatever was asked for, so removals lock and look up the rows that
+    # really exist before they are deleted.
+    if action == 'post_add':
+        apply_follow_delta(instance, reverse, pk_set, 1)
+
+    elif action in ('pre_remove', 'pre_clear'):
+        own, other = ('to_customuser', 'from_customuser') if reverse else ('from_customuser', 'to_customuser')
+        existing = Follow.objects.select_for_update().filter(**{own: instance.pk})
+        if action == 'pre_remove':
+            existing = existing.filter(**{f'{other}__in': pk_set})
+        apply_follow_delta(instance, reverse, list(existing.values_list(other, flat=True)), -1)
+
+
+@receiver(pre_delete, sender=CustomUser)
+def release_follows(sender, instance, **kwargs):
+    # The cascade deletes follow rows without m2m signals, so clear them
+    # first to keep the other side's counters right.
+    instance.followers.clear()
+    instance.following.clear()
+
+
+@receiver(post_save, sender=CustomUser)
+@receiver(post_delete, sender=CustomUser)
+def drop_cached_user(sender, instance, **kwargs):
+    forget_user(instance.pk)
@@ -1,3 +1,477 @@
-from django.test import TestCase
+import json
+from contextlib import ExitStack
+from datetime import date, timedelta
+from io import StringIO
+from unittest import mock
 
-# Create your tests here.
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.files.storage import default_storage
+from django.core import mail
+from django.core.mail import get_connection
+from django.core.management import call_command
+from django.db import connections
+from django.test import AsyncClient, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.utils import timezone
+from rest_framework.test import APIClient
+from rest_framework_simplejwt.tokens import AccessToken
+
+from blog.models import Post
+from blog.tests import LOCMEM_CACHES, QueryBudgetMixin
+from .auth import CachedUser, user_cache_key
+from .avatars import LEGACY_PREFIX, avatar_path, avatar_key, background, initials
+from .blacklist import BloomFilter, TokenBlacklist, publish_filter, token_blacklist
+from .models import BlacklistedToken, CustomUser, OutboundEmail
+from .mail import MAX_ATTEMPTS, queue_email, send_queued_emails
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ProfileQueryBudgetTests(QueryBudgetMixin, TestCase):
+    databases = '__all__'  # Reads may be routed to a replica
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='writer', email='writer@example.com', password='x')
+        cls.viewer = CustomUser.objects.create_user(username='viewer', email='viewer@example.com', password='x')
+        followers = [
+            CustomUser.objects.create_user(username=f'fan{i}', email=f'fan{i}@example.com', password='x')
+            for i in range(10)
+        ]
+        cls.user.followers.add(cls.viewer, *followers)
+        for i in range(10):
+            Post.objects.create(title=f'Post {i}', content='Body', author=cls.user, date_posted=date(2025, 1, 1 + i))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+
+    def test_specific_user_profile(self):
+        response = self.assertQueryBudget(2, 'get', f'/api/user/profile/{self.user.pk}/')
+        self.assertEqual(response.json()['post_count'], 10)
+        self.assertEqual(response.json()['followers_count'], 11)
+        self.assertTrue(response.json()['is_following'])
+
+    def test_user_summary(self):
+        response = self.assertQueryBudget(1, 'get', f'/api/user/profile/{self.user.pk}/summary/')
+        self.assertNotIn('posts', response.json())
+        self.assertEqual(response.json()['followers_count'], 11)
+
+    def test_followers_pages(self):
+        seen = []
+        url = f'/api/user/followers/{self.user.pk}/?page_size=4'
+        while url:
+            page = self.assertQueryBudget(2, 'get', url).json()
+            seen += [follower['username'] for follower in page['results']]
+            url = page['next'] and f'/api/user/followers/{self.user.pk}/?page_size=4&cursor={page["next"]}'
+        self.assertEqual(len(seen), 11)
+        self.assertEqual(seen[-1], 'viewer')  # Oldest follow last
+
+    def test_following_and_export(self):
+        response = self.client.get(f'/api/user/following/{self.viewer.pk}/')
+        self.assertEqual([u['username'] for u in response.json()['results']], ['writer'])
+
+        response = self.client.get(f'/api/user/followers/{self.user.pk}/export/')
+        exported = json.loads(b''.join(response.streaming_content))
+        self.assertEqual(len(exported), 11)
+
+    async def test_async_specific_user_profile(self):
+        url = f'/api/user/async/profile/{self.user.pk}/'
+        self.assertEqual((await AsyncClient().get(url)).status_code, 401)
+        self.assertEqual((await AsyncClient().get(url, headers={'Authorization': 'Bearer junk'})).status_code, 401)
+
+        response = await AsyncClient().get(url, headers={'Authorization': f'Bearer {AccessToken.for_user(self.viewer)}'})
+        sync_response = await sync_to_async(self.client.get)(f'/api/user/profile/{self.user.pk}/')
+        self.assertEqual(response.json(), sync_response.json())
+        self.assertTrue(response.json()['is_following'])
+
+    def test_profile_revalidates_in_one_query(self):
+        url = f'/api/user/profile/{self.user.pk}/'
+        first = self.client.get(url)
+        self.assertIn('Authorization', first['Vary'])
+
+        response = self.assertQueryBudget(1, 'get', url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], first['ETag'])
+
+        # Another viewer, and the same viewer after unfollowing, see a different payload
+        other = APIClient()
+        other.force_authenticate(self.user)
+        self.assertEqual(other.get(url, HTTP_IF_NONE_MATCH=first['ETag']).status_code, 200)
+        self.client.post(f'/api/user/unfollow/{self.user.pk}/')
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(response.json()['is_following'])
+
+    async def test_async_profile_revalidates(self):
+        headers = {'Authorization': f'Bearer {AccessToken.for_user(self.viewer)}'}
+        url = f'/api/user/async/profile/{self.user.pk}/'
+        first = await AsyncClient().get(url, headers=headers)
+        sync_first = await sync_to_async(self.client.get)(f'/api/user/profile/{self.user.pk}/')
+        self.assertEqual(first['ETag'], sync_first['ETag'])
+
+        response = await AsyncClient().get(url, headers={**headers, 'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, 304)
+        await sync_to_async(Post.objects.create)(title='New', content='Body', author=self.user, date_posted=date(2025, 2, 1))
+        response = await AsyncClient().get(url, headers={**headers, 'If-None-Match': first['ETag']})
+        self.assertEqual(response.status_code, 200)
+
+    def test_sparse_profile(self):
+        url = f'/api/user/profile/{self.user.pk}/'
+        response = self.assertQueryBudget(1, 'get', url, data={'fields': 'username,image'})  # No posts prefetch
+        self.assertEqual(response.json(), {'username': 'writer', 'image': self.user.image})
+
+        response = self.assertQueryBudget(2, 'get', url, data={'fields': 'username,posts.title', 'exclude': 'is_following'})
+        self.assertEqual({tuple(post) for post in response.json()['posts']}, {('title',)})
+
+        # Revalidation follows the shape: without posts it doesn't aggregate them
+        first = self.client.get(url, {'fields': 'username'})
+        with ExitStack() as stack:
+            contexts = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+            response = self.client.get(url, {'fields': 'username'}, HTTP_IF_NONE_MATCH=first['ETag'])
+        self.assertEqual(response.status_code, 304)
+        sql = ' '.join(query['sql'] for context in contexts for query in context.captured_queries)
+        self.assertIn('user_customuser', sql)
+        self.assertNotIn('blog_post', sql)
+
+    def test_own_profile(self):
+        self.client.force_authenticate(self.user)
+        response = self.assertQueryBudget(2, 'get', '/api/user/profile/')
+        self.assertFalse(response.json()['is_following'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class ClaimsAuthTests(QueryBudgetMixin, TestCase):
+    databases = '__all__'  # Reads may be routed to a replica
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = CustomUser.objects.create_user(username='writer', email='writer@example.com', password='Secret@123')
+        cls.other = CustomUser.objects.create_user(username='other', email='other@example.com', password='x')
+        cls.post = Post.objects.create(title='Post', content='Body', author=cls.other, date_posted=date(2025, 1, 1))
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.tokens = self.client.post('/api/user/login/', {'username': 'writer', 'password': 'Secret@123'}, format='json').json()
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.tokens["access"]}')
+
+    def test_access_token_carries_the_claims(self):
+        token = AccessToken(self.tokens['access'])
+        self.assertEqual((token['username'], token['is_admin'], token['image']), ('writer', False, self.user.image))
+
+    def test_authenticated_requests_skip_the_user_lookup(self):
+        self.assertQueryBudget(2, 'get', f'/api/user/profile/{self.other.pk}/')
+        self.assertQueryBudget(1, 'get', f'/api/blog/posts/{self.post.pk}/comments/')
+        self.client.post(f'/api/blog/posts/{self.post.pk}/comments/add/', {'content': 'Hi'}, format='json')
+        self.client.post(f'/api/user/follow/{self.other.pk}/')
+        self.assertEqual(self.post.comments.get().author, self.user)
+        self.assertTrue(self.other.followers.filter(pk=self.user.pk).exists())
+
+    def test_other_fields_hydrate_from_the_database(self):
+        response = self.assertQueryBudget(1, 'get', '/api/user/update-profile/')
+        self.assertEqual(response.json()['email'], 'writer@example.com')
+
+        # The user cache only ever holds what the auth checks read
+        self.client.post(f'/api/user/follow/{self.other.pk}/')
+        self.assertEqual(cache.get(user_cache_key(self.user.pk)), CachedUser(self.user.pk, True, False, 'writer', self.user.image))
+
+        self.client.patch('/api/user/update-profile/', {'username': 'renamed'}, format='json')
+        self.assertEqual(self.client.get('/api/user/update-profile/').json()['username'], 'renamed')
+        refreshed = self.client.post('/api/user/token/refresh/', {'refresh': self.tokens['refresh']}, format='json').json()
+        self.assertEqual(AccessToken(refreshed['access'])['username'], 'renamed')
+
+    def test_refresh_fails_for_a_deleted_user(self):
+        self.user.delete()
+        response = self.client.post('/api/user/token/refresh/', {'refresh': self.tokens['refresh']}, format='json')
+        self.assertEqual(response.status_code, 401)
+
+    def test_writes_fail_for_a_deactivated_user(self):
+        self.client.get('/api/user/update-profile/')  # Cache the active user
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.post('/api/blog/posts/create/', {'title': 'T', 'content': 'C'}, format='json')
+        self.assertEqual(response.status_code, 401)
+        self.assertEqual(self.client.post(f'/api/user/follow/{self.other.pk}/').status_code, 401)
+        self.assertFalse(Post.objects.filter(author=self.user).exists())
+        # Reads still trust the token until it expires
+        self.assertEqual(self.client.get(f'/api/blog/posts/{self.post.pk}/comments/').status_code, 200)
+
+    def test_writes_fail_for_a_deleted_user(self):
+        self.user.delete()
+        response = self.client.post('/api/blog/posts/create/', {'title': 'T', 'content': 'C'}, format='json')
+        self.assertEqual(response.status_code, 401)
+        response = self.client.post(f'/api/blog/posts/{self.post.pk}/comments/add/', {'content': 'Hi'}, format='json')
+        self.assertEqual(response.status_code, 401)
+        self.assertFalse(self.post.comments.exists())
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class TokenBlacklistTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        CustomUser.objects.create_user(username='writer', email='writer@example.com', password='Secret@123')
+        self.client = APIClient()
+
+    def refresh(self, token):
+        return self.client.post('/api/user/token/refresh/', {'refresh': token}, format='json')
+
+    def test_rotated_tokens_are_rejected(self):
+        first = self.client.post('/api/user/login/', {'username': 'writer', 'password': 'Secret@123'}, format='json').json()['refresh']
+        second = self.refresh(first).json()['refresh']
+        self.assertEqual(self.refresh(first).status_code, 401)
+        self.assertEqual(self.refresh(second).status_code, 200)
+        self.assertEqual(BlacklistedToken.objects.count(), 2)
+
+    def test_unknown_jtis_skip_the_database(self):
+        token_blacklist.add('known', timezone.now() + timedelta(days=1))
+        publish_filter()
+        token_blacklist.add('recent', timezone.now() + timedelta(days=1))
+        token_blacklist.sync()
+        with self.assertNumQueries(0):
+            self.assertNotIn('never-issued', token_blacklist)
+        self.assertIn('known', token_blacklist)
+        self.assertIn('recent', token_blacklist)
+        self.assertFalse(token_blacklist.add('known', timezone.now() + timedelta(days=1)))  # A concurrent rotation
+
+    def test_lookups_never_scan_the_table(self):
+        for jti in ('a', 'b', 'c'):
+            token_blacklist.add(jti, timezone.now() + timedelta(days=1))
+        for published in (False, True):
+            with ExitStack() as stack:
+                contexts = [stack.enter_context(CaptureQueriesContext(connections[alias])) for alias in connections]
+                self.assertIn('b', TokenBlacklist())
+                self.assertNotIn('never-issued', TokenBlacklist())
+            queries = [query['sql'] for context in contexts for query in context.captured_queries]
+            self.assertTrue(queries)
+            self.assertTrue(all('WHERE' in sql for sql in queries), published)
+            publish_filter()
+
+    def test_other_workers_pick_up_new_entries(self):
+        other_worker = TokenBlacklist()
+        self.assertNotIn('rotated', other_worker)
+        token_blacklist.add('rotated', timezone.now() + timedelta(days=1))
+        self.assertIn('rotated', other_worker)
+
+    def test_bloom_filter(self):
+        bloom = BloomFilter(1000)
+        for i in range(1000):
+            bloom.add(f'jti-{i}')
+        self.assertTrue(all(f'jti-{i}' in bloom for i in range(1000)))
+        self.assertLess(sum(f'other-{i}' in bloom for i in range(1000)), 50)
+
+    def test_purge_removes_expired_rows(self):
+        now = timezone.now()
+        BlacklistedToken.objects.create(jti='expired', expires_at=now - timedelta(minutes=1))
+        BlacklistedToken.objects.create(jti='live', expires_at=now + timedelta(days=1))
+        out = StringIO()
+        call_command('purge_token_blacklist', stdout=out)
+        self.assertIn('Purged 1 expired token(s)', out.getvalue())
+        self.assertEqual(list(BlacklistedToken.objects.values_list('jti', flat=True)), ['live'])
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class AvatarTests(TestCase):
+
+    def test_new_user_gets_local_avatar_files(self):
+        user = CustomUser.objects.create_user(username='ada lovelace', email='ada@example.com', password='x')
+        key = avatar_key(initials(user.username), background(user.username))
+        self.assertEqual(initials(user.username), 'AL')
+        self.assertEqual(user.image, default_storage.url(avatar_path(key, 96)))
+        for size in (48, 96, 256):
+            self.assertTrue(default_storage.exists(avatar_path(key, size)))
+
+    def test_served_immutable(self):
+        user = CustomUser.objects.create_user(username='grace', email='grace@example.com', password='x')
+        response = self.client.get(user.image)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'image/png')
+        self.assertIn('immutable', response['Cache-Control'])
+        self.assertEqual(self.client.get('/media/avatars/missing/96.png').status_code, 404)
+
+    def test_backfill_replaces_legacy_relative_and_empty_images(self):
+        legacy = CustomUser.objects.create_user(username='legacy', email='legacy@example.com', password='x')
+        relative = CustomUser.objects.create_user(username='relative', email='relative@example.com', password='x')
+        blank = CustomUser.objects.create_user(username='blank', email='blank@example.com', password='x')
+        CustomUser.objects.filter(pk=legacy.pk).update(image=f'{LEGACY_PREFIX}api/?name=legacy')
+        CustomUser.objects.filter(pk=relative.pk).update(image='/media/avatars/old/96.png')
+        CustomUser.objects.filter(pk=blank.pk).update(image='')
+
+        out = StringIO()
+        call_command('backfill_avatars', stdout=out)
+        self.assertIn('3 user(s)', out.getvalue())
+        for user in (legacy, relative, blank):
+            user.refresh_from_db()
+            self.assertTrue(user.image.startswith(f'{settings.BACKEND_URL}/media/avatars/'))
+
+    def test_avatar_is_only_regenerated_when_the_username_changes(self):
+        CustomUser.objects.create_user(username='ada', email='ada@example.com', password='Secret@123')
+        with mock.patch.object(default_storage, 'exists', wraps=default_storage.exists) as exists:
+            response = APIClient().post('/api/user/login/', {'username': 'ada', 'password': 'Secret@123'}, format='json')
+            self.assertEqual(response.status_code, 200)  # Saves last_login
+            user = CustomUser.objects.get(username='ada')
+            user.about_me = 'Hello'
+            user.save()
+            self.assertEqual(exists.call_count, 0)
+
+            user.username = 'grace'
+            user.save(update_fields=['username'])
+            self.assertTrue(exists.called)
+        user.refresh_from_db()
+        self.assertEqual(user.image, default_storage.url(avatar_path(avatar_key(initials('grace'), background('grace')), 96)))
+
+    def test_profile_patch_round_trips_the_avatar(self):
+        user = CustomUser.objects.create_user(username='ada', email='ada@example.com', password='x')
+        self.assertTrue(user.image.startswith('https://'))
+        client = APIClient()
+        client.force_authenticate(user)
+        profile = client.get('/api/user/update-profile/').json()
+        response = client.patch('/api/user/update-profile/', dict(profile, about_me='Hello'), format='json')
+        self.assertEqual(response.status_code, 200)
+        user.refresh_from_db()
+        self.assertEqual((user.about_me, user.image), ('Hello', profile['image']))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class CounterTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.alice = CustomUser.objects.create_user(username='alice', email='alice@example.com', password='x')
+        self.bob = CustomUser.objects.create_user(username='bob', email='bob@example.com', password='x')
+        self.client = APIClient()
+        self.client.force_authenticate(self.bob)
+
+    def counters(self, user):
+        user.refresh_from_db()
+        return user.followers_count, user.following_count, user.post_count
+
+    def test_follow_and_unfollow(self):
+        response = self.client.post(f'/api/user/follow/{self.alice.pk}/')
+        self.assertEqual(response.json()['followers_count'], 1)
+        self.assertEqual(self.counters(self.bob), (0, 1, 0))
+
+        response = self.client.post(f'/api/user/unfollow/{self.alice.pk}/')
+        self.assertEqual(response.json()['followers_count'], 0)
+        self.assertEqual(self.counters(self.bob), (0, 0, 0))
+
+    def test_posts_and_comments(self):
+        post_id = self.client.post('/api/blog/posts/create/', {'title': 'T', 'content': 'C'}).json()['id']
+        self.client.post(f'/api/blog/posts/{post_id}/comments/add/', {'content': 'Hi'}, format='json')
+        self.assertEqual(self.counters(self.bob), (0, 0, 1))
+        self.assertEqual(Post.objects.get(pk=post_id).comment_count, 1)
+
+        self.client.delete(f'/api/blog/posts/{post_id}/delete/')
+        self.assertEqual(self.counters(self.bob), (0, 0, 0))
+
+    def test_deleting_a_user_updates_the_other_side(self):
+        self.alice.followers.add(self.bob)
+        self.bob.followers.add(self.alice)
+        self.bob.delete()
+        self.assertEqual(self.counters(self.alice), (0, 0, 0))
+
+    def test_reconcile_counters_fixes_drift(self):
+        self.alice.followers.add(self.bob)
+        Post.objects.create(title='T', content='C', author=self.alice, date_posted=date(2025, 1, 1))
+        CustomUser.objects.update(followers_count=7, following_count=7, post_count=7)
+
+        call_command('reconcile_counters', batch_size=1, stdout=StringIO())
+        self.assertEqual(self.counters(self.alice), (1, 0, 1))
+        self.assertEqual(self.counters(self.bob), (0, 1, 0))
+
+
+@override_settings(CACHES=LOCMEM_CACHES)
+class FollowStateTests(QueryBudgetMixin, TestCase):
+    databases = '__all__'  # Reads may be routed to a replica
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.viewer = CustomUser.objects.create_user(username='viewer', email='viewer@example.com', password='x')
+        cls.authors = [
+            CustomUser.objects.create_user(username=f'author{i}', email=f'author{i}@example.com', password='x')
+            for i in range(5)
+        ]
+        cls.authors[0].followers.add(cls.viewer)
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+        self.client.force_authenticate(self.viewer)
+        self.url = '/api/user/follow-state/?ids=' + ','.join(str(author.pk) for author in self.authors)
+
+    def test_batch_lookup_is_one_query_then_cached(self):
+        states = self.assertQueryBudget(1, 'get', self.url).json()
+        self.assertEqual(list(states.values()), [True, False, False, False, False])
+        self.assertQueryBudget(0, 'get', self.url)
+
+    def test_follow_and_unfollow_refresh_the_cache(self):
+        self.client.get(self.url)
+        self.client.post(f'/api/user/follow/{self.authors[1].pk}/')
+        self.client.post(f'/api/user/unfollow/{self.authors[0].pk}/')
+        states = self.assertQueryBudget(0, 'get', self.url).json()
+        self.assertEqual(list(states.values()), [False, True, False, False, False])
+
+    def test_rejects_bad_ids(self):
+        self.assertEqual(self.client.get('/api/user/follow-state/?ids=1,x').status_code, 400)
+
+
+@override_settings(CACHES=LOCMEM_CACHES, EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class OutboundEmailTests(TestCase):
+
+    def setUp(self):
+        cache.clear()
+        self.client = APIClient()
+
+    def test_send_otp_only_queues(self):
+        response = self.client.post('/api/user/send-otp/', {'email': 'new@example.com'})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(mail.outbox), 0)
+
+        call_command('send_queued_email', once=True, stdout=StringIO())
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn(cache.get('otp_new@example.com'), mail.outbox[0].body)
+
+        queued = OutboundEmail.objects.get()
+        self.assertEqual(queued.status, OutboundEmail.SENT)
+        self.assertEqual(queued.body, '')
+
+    def test_password_reset_is_queued(self):
+        CustomUser.objects.create_user(username='alice', email='alice@example.com', password='x')
+        self.client.post('/api/user/request-password-reset/', {'email': 'alice@example.com'})
+        self.assertEqual(send_queued_emails(), (1, 0))
+        self.assertIn('reset-your-password?token=', mail.outbox[0].body)
+
+    def test_batch_shares_one_connection(self):
+        for i in range(3):
+            queue_email('Subject', 'Body', [f'user{i}@example.com'])
+        with mock.patch('user.mail.get_connection', wraps=get_connection) as connect:
+            self.assertEqual(send_queued_emails(), (3, 0))
+        connect.assert_called_once()
+
+    def test_failures_back_off_then_give_up(self):
+        queued = queue_email('Subject', 'Body', ['user@example.com'])
+        with mock.patch('django.core.mail.EmailMessage.send', side_effect=OSError('SMTP down')):
+            self.assertEqual(send_queued_emails(), (0, 1))
+            queued.refresh_from_db()
+            self.assertEqual((queued.status, queued.attempts, queued.last_error), (OutboundEmail.PENDING, 1, 'SMTP down'))
+            self.assertGreater(queued.next_attempt_at, timezone.now())
+            self.assertEqual(send_queued_emails(), (0, 0))  # Not due yet
+
+            for _ in range(MAX_ATTEMPTS - 1):
+                OutboundEmail.objects.update(next_attempt_at=timezone.now())
+                send_queued_emails()
+        queued.refresh_from_db()
+        self.assertEqual(queued.status, OutboundEmail.FAILED)
+
+    def test_connect_failure_reschedules_the_batch(self):
+        for i in range(2):
+            queue_email('Subject', 'Body', [f'user{i}@example.com'])
+        with mock.patch('django.core.mail.backends.locmem.EmailBackend.open', side_effect=OSError('Connection refused')):
+            self.assertEqual(send_queued_emails(), (0, 2))
+        self.assertEqual(len(mail.outbox), 0)
+        for queued in OutboundEmail.objects.all():
+            self.assertEqual((queued.status, queued.attempts, queued.last_error), (OutboundEmail.PENDING, 1, 'Connection refused'))
+            self.assertGreater(queued.next_attempt_at, timezone.now())
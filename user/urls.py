@@ -1,5 +1,6 @@
 from django.urls import path
 from .views import *
+from . import async_views
 from rest_framework_simplejwt import views as jwt_views
 
 urlpatterns = [
@@ -13,6 +14,13 @@ urlpatterns = [
     path('profile/<int:user_id>/', get_specific_user_profile, name='get_specific_user_profile'),
     path('follow/<int:user_id>/', follow_user, name='follow_user'),
     path('unfollow/<int:user_id>/', unfollow_user, name='unfollow_user'),
+    path('follow-state/', get_follow_states, name='get_follow_states'),
+    path('profile/<int:user_id>/summary/', get_user_summary, name='get_user_summary'),
+    path('followers/<int:user_id>/', get_followers, name='get_followers'),
+    path('following/<int:user_id>/', get_following, name='get_following'),
+    path('followers/<int:user_id>/export/', export_followers, name='export_followers'),
+    path('following/<int:user_id>/export/', export_following, name='export_following'),
+    path('async/profile/<int:user_id>/', async_views.get_specific_user_profile, name='async_get_specific_user_profile'),
     path("send-otp/", send_otp, name="send_otp"),
     path("verify-otp/", verify_otp, name="verify_otp"),
 ]
@@ -1,21 +1,37 @@
-from rest_framework.decorators import api_view,permission_classes
+from rest_framework.decorators import api_view,permission_classes,throttle_classes
 from rest_framework.permissions import AllowAny,IsAuthenticated
 from rest_framework.response import Response
 from rest_framework.status import HTTP_400_BAD_REQUEST, HTTP_201_CREATED
-from .serializers import UserSerializer,UserProfileSerializer,PasswordResetRequestSerializer, PasswordResetSerializer, UserProfileUpdateSerializer
-from rest_framework_simplejwt.tokens import RefreshToken
+from .serializers import UserSerializer,UserProfileSerializer,UserSummarySerializer,PasswordResetRequestSerializer, PasswordResetSerializer, UserProfileUpdateSerializer
+from .auth import ClaimsRefreshToken, IsActiveUser, hydrated_user
+from .avatars import AVATAR_DIR, AVATAR_MAX_AGE
+from django.views.decorators.http import require_GET
+from django.views.static import serve
 from rest_framework import status
 from django.contrib.auth import authenticate
 from django.contrib.auth.tokens import default_token_generator
-from django.core.mail import send_mail
 from django.conf import settings
 from .models import CustomUser
 from django.shortcuts import get_object_or_404
+from django.http import StreamingHttpResponse
+from django.db.models import F
+from .pagination import FollowPagination
+from .mail import queue_email
+from .follows import MAX_FOLLOW_STATE_IDS, follow_exists, follow_states, set_follow_state
+import json
 import random
 from django.core.cache import cache
+from django.db import transaction
+from blog.cache import invalidate_posts
+from backend.conditional import is_conditional, not_modified, set_validators
+from backend.ratelimit import rate_limits
+from backend.replicas import primary_reads
+from blog.queryplan import sparse_fieldset
+from django.utils.cache import patch_vary_headers
 
 @api_view(['POST'])
 @permission_classes([AllowAny]) 
+@throttle_classes(rate_limits('register'))
 def register_user(request):
     serializer = UserSerializer(data=request.data)
     if serializer.is_valid():
@@ -26,13 +42,14 @@ def register_user(request):
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes(rate_limits('login'))
 def login_user(request):
     username = request.data.get('username')
     password = request.data.get('password')
     user = authenticate(username=username, password=password)
 
     if user:
-        refresh = RefreshToken.for_user(user) 
+        refresh = ClaimsRefreshToken.for_user(user)
         return Response({
             'access': str(refresh.access_token),
             'refresh': str(refresh),
@@ -44,12 +61,15 @@ def login_user(request):
 @permission_classes([IsAuthenticated]) 
 def user_profile(request): 
     """Fetch the profile details of the authenticated user.""" 
-    serializer = UserProfileSerializer(request.user, context={'request': request})
+    context = {'request': request, 'sparse': sparse_fieldset(request)}
+    user = UserProfileSerializer.plan_queryset(CustomUser.objects.all(), context).get(pk=request.user.pk)
+    serializer = UserProfileSerializer(user, context=context)
     return Response(serializer.data, status=status.HTTP_200_OK)
 
 
 @api_view(['POST'])
 @permission_classes([AllowAny])
+@throttle_classes(rate_limits('password_reset'))
 def request_password_reset(request):
     serializer = PasswordResetRequestSerializer(data=request.data)
     if serializer.is_valid():
@@ -70,25 +90,16 @@ def request_password_reset(request):
         # Create the frontend reset password URL
         reset_link = f"{settings.FRONTEND_URL}reset-your-password?token={token}&email={email}"
 
-        try:
-            # Send the email using Gmail
-            send_mail(
-                subject="Password Reset Request",
-                message=f"Hi {user.username},\n\nClick the link below to reset your password:\n\n{reset_link}\n\nIf you didn't request this, please ignore this email.",
-                from_email=settings.EMAIL_HOST_USER,
-                recipient_list=[email],
-            )
-            return Response(
-                {"detail": "If the email exists, a password reset link will be sent."},
-                status=status.HTTP_200_OK,
-            )
-        except Exception as e:
-            # Log the error for debugging purposes
-            print(f"Failed to send password reset email: {e}")
-            return Response(
-                {"error": "Failed to send email. Please try again later."},
-                status=status.HTTP_500_INTERNAL_SERVER_ERROR,
-            )
+        # Queue the email; the send_queued_email worker delivers it
+        queue_email(
+            subject="Password Reset Request",
+            message=f"Hi {user.username},\n\nClick the link below to reset your password:\n\n{reset_link}\n\nIf you didn't request this, please ignore this email.",
+            recipient_list=[email],
+        )
+        return Response(
+            {"detail": "If the email exists, a password reset link will be sent."},
+            status=status.HTTP_200_OK,
+        )
 
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -123,17 +134,20 @@ def reset_password(request):
 
 
 @api_view(['GET', 'PATCH'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsActiveUser])
 def update_user_profile(request): 
     """ Retrieve or update the authenticated user's profile (username, email, image). """ 
-    user = request.user 
     # Handle GET request to retrieve the user's profile data 
     if request.method == 'GET': 
-        serializer = UserProfileUpdateSerializer(user) 
+        serializer = UserProfileUpdateSerializer(hydrated_user(request.user))
         return Response(serializer.data, status=status.HTTP_200_OK) # Handle PATCH request to update the user's profile data 
     elif request.method == 'PATCH': 
+        user = CustomUser.objects.get(pk=request.user.pk)  # Fresh row, the cached one may have stale counters
         serializer = UserProfileUpdateSerializer(user, data=request.data, partial=True)
-        if serializer.is_valid(): serializer.save() 
+        if serializer.is_valid():
+            serializer.save()
+            # Cached posts embed the author's username and image
+            invalidate_posts(user.posts.values_list('id', flat=True))
         return Response(serializer.data, status=status.HTTP_200_OK)
     return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
@@ -144,57 +158,180 @@ def get_specific_user_profile(request, user_id):
     """ Retrieve a specific user's profile.
     - ❌ Unauthenticated users get a 401 error. 
     - ✅ Authenticated users can view profiles. """ 
+    context = {'request': request, 'sparse': sparse_fieldset(request)}  # ✅ Pass request for is_following
+    if is_conditional(request):
+        # Settle revalidations from the validators before loading the profile
+        state = UserProfileSerializer.validator_queryset(CustomUser.objects.filter(pk=user_id), context).first()
+        if state is None:
+            return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+        unchanged = not_modified(request, *UserProfileSerializer.http_validators(context, **state))
+        if unchanged is not None:
+            patch_vary_headers(unchanged, ['Authorization'])  # is_following is per viewer
+            return unchanged
+
     try: 
-        user = CustomUser.objects.get(pk=user_id) 
+        user = UserProfileSerializer.plan_queryset(CustomUser.objects.all(), context).get(pk=user_id)
     except CustomUser.DoesNotExist: 
             return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
          
-    serializer = UserProfileSerializer(user, context={'request': request})  # ✅ Pass request for is_following 
+    serializer = UserProfileSerializer(user, context=context)
+    response = set_validators(Response(serializer.data), *UserProfileSerializer.instance_http_validators(user, context))
+    patch_vary_headers(response, ['Authorization'])
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_user_summary(request, user_id):
+    """ Lightweight profile: counts only, no embedded posts. """
+    context = {'request': request, 'sparse': sparse_fieldset(request)}
+    try:
+        user = UserSummarySerializer.plan_queryset(CustomUser.objects.all(), context).get(pk=user_id)
+    except CustomUser.DoesNotExist:
+        return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    serializer = UserSummarySerializer(user, context=context)
     return Response(serializer.data)
 
 
 @api_view(['POST'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsActiveUser])
 def follow_user(request, user_id):
-    user_to_follow = get_object_or_404(CustomUser, id=user_id)
     current_user = request.user
-
-    if user_to_follow == current_user:
+    if user_id == current_user.pk:
         return Response({"detail": "You cannot follow yourself."}, status=status.HTTP_400_BAD_REQUEST)
 
-    if current_user in user_to_follow.followers.all():
-        return Response({"detail": "You are already following this user."}, status=status.HTTP_400_BAD_REQUEST)
-
-    user_to_follow.followers.add(current_user)
-    
+    # Locking the followed user serialises concurrent follows of them, so the
+    # check and add below run one at a time and the counters move once per row
+    with transaction.atomic(), primary_reads():  # Follow row and counters commit together
+        user_to_follow = get_object_or_404(CustomUser.objects.select_for_update(), id=user_id)
+        if follow_exists(current_user.pk, user_to_follow.pk):
+            return Response({"detail": "You are already following this user."}, status=status.HTTP_400_BAD_REQUEST)
+        user_to_follow.followers.add(current_user.pk)
+    set_follow_state(current_user.pk, user_to_follow.pk, True)
+    user_to_follow.refresh_from_db(fields=['followers_count'])
 
     return Response({
         "detail": f"You are now following {user_to_follow.username}.",
         "is_following": True,  # ✅ Send updated state
-        "followers_count": user_to_follow.followers.count()  # ✅ Send updated count
+        "followers_count": user_to_follow.followers_count  # ✅ Send updated count
     }, status=status.HTTP_200_OK)
 
 
 @api_view(['POST'])
-@permission_classes([IsAuthenticated])
+@permission_classes([IsActiveUser])
 def unfollow_user(request, user_id):
-    user_to_unfollow = get_object_or_404(CustomUser, id=user_id)
     current_user = request.user
-
-    if user_to_unfollow == current_user:
+    if user_id == current_user.pk:
         return Response({"detail": "You cannot unfollow yourself."}, status=status.HTTP_400_BAD_REQUEST)
 
-    if current_user not in user_to_unfollow.followers.all():
-        return Response({"detail": "You are not following this user."}, status=status.HTTP_400_BAD_REQUEST)
-
-    user_to_unfollow.followers.remove(current_user)
+    with transaction.atomic(), primary_reads():  # Same lock as follow_user
+        user_to_unfollow = get_object_or_404(CustomUser.objects.select_for_update(), id=user_id)
+        if not follow_exists(current_user.pk, user_to_unfollow.pk):
+            return Response({"detail": "You are not following this user."}, status=status.HTTP_400_BAD_REQUEST)
+        user_to_unfollow.followers.remove(current_user.pk)
+    set_follow_state(current_user.pk, user_to_unfollow.pk, False)
+    user_to_unfollow.refresh_from_db(fields=['followers_count'])
 
     return Response({
         "detail": f"You have unfollowed {user_to_unfollow.username}.",
         "is_following": False,  # ✅ Send updated state
-        "followers_count": user_to_unfollow.followers.count()  # ✅ Send updated count
+        "followers_count": user_to_unfollow.followers_count  # ✅ Send updated count
     }, status=status.HTTP_200_OK)
 
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_follow_states(request):
+    """ Follow state of the current user for a page of authors: ?ids=1,2,3 """
+    try:
+        user_ids = [int(user_id) for user_id in request.query_params.get('ids', '').split(',') if user_id]
+    except ValueError:
+        return Response({"detail": "ids must be a comma-separated list of user ids."}, status=status.HTTP_400_BAD_REQUEST)
+
+    if len(user_ids) > MAX_FOLLOW_STATE_IDS:
+        return Response({"detail": f"At most {MAX_FOLLOW_STATE_IDS} ids per request."}, status=status.HTTP_400_BAD_REQUEST)
+
+    states = follow_states(request.user.pk, user_ids)
+    return Response({str(user_id): states[user_id] for user_id in user_ids})
+
+
+#Followers / following lists
+FOLLOW_LISTS = {
+    # relation: (column holding user_id, column holding the listed users)
+    'followers': ('from_customuser', 'to_customuser'),
+    'following': ('to_customuser', 'from_customuser'),
+}
+
+
+def follow_list_queryset(user_id, relation):
+    """Follow rows of user_id projected to the listed user's id, username and image."""
+    own, other = FOLLOW_LISTS[relation]
+    return CustomUser.followers.through.objects.filter(**{own: user_id}).values(
+        'id',
+        user_id=F(f'{other}_id'),
+        username=F(f'{other}__username'),
+        image=F(f'{other}__image'),
+    )
+
+
+def follow_list_item(row):
+    return {'id': row['user_id'], 'username': row['username'], 'image': row['image']}
+
+
+def follow_list_response(request, user_id, relation):
+    if not CustomUser.objects.filter(pk=user_id).exists():
+        return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    paginator = FollowPagination()
+    rows = paginator.paginate_queryset(follow_list_queryset(user_id, relation), request)
+    return paginator.get_paginated_response([follow_list_item(row) for row in rows])
+
+
+def follow_export_response(user_id, relation, chunk_size=2000):
+    """Stream the whole list as one JSON array without holding it in memory."""
+    if not CustomUser.objects.filter(pk=user_id).exists():
+        return Response({"detail": "User not found."}, status=status.HTTP_404_NOT_FOUND)
+
+    rows = follow_list_queryset(user_id, relation).order_by('-id').iterator(chunk_size=chunk_size)
+
+    def stream():
+        yield '['
+        separator = ''
+        for row in rows:
+            yield separator + json.dumps(follow_list_item(row))
+            separator = ','
+        yield ']'
+
+    response = StreamingHttpResponse(stream(), content_type='application/json')
+    response['Content-Disposition'] = f'attachment; filename="user-{user_id}-{relation}.json"'
+    return response
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_followers(request, user_id):
+    """Cursor-paginated list of the users following user_id."""
+    return follow_list_response(request, user_id, 'followers')
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def get_following(request, user_id):
+    """Cursor-paginated list of the users user_id follows."""
+    return follow_list_response(request, user_id, 'following')
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_followers(request, user_id):
+    return follow_export_response(user_id, 'followers')
+
+
+@api_view(['GET'])
+@permission_classes([IsAuthenticated])
+def export_following(request, user_id):
+    return follow_export_response(user_id, 'following')
+
 #OTP verification for registering
 def generate_otp():
     return str(random.randint(100000,999999))
@@ -202,6 +339,7 @@ def generate_otp():
 # API to send OTP
 @api_view(["POST"])
 @permission_classes([AllowAny])
+@throttle_classes(rate_limits('send_otp'))
 def send_otp(request):
     email = request.data.get("email")
 
@@ -215,13 +353,11 @@ def send_otp(request):
     otp = generate_otp()  # Generate OTP
     cache.set(f"otp_{email}", otp, timeout=300)  # Store in cache for 5 minutes
 
-    # Send OTP email
-    send_mail(
+    # Queue the OTP email; the send_queued_email worker delivers it
+    queue_email(
         subject="Your OTP Code",
         message = f"Your OTP is:\n\n{otp}\n\nIt is valid for 5 minutes.",
-        from_email=settings.EMAIL_HOST_USER,
         recipient_list=[email],
-        fail_silently=False,
     )
 
     return Response({"message": "OTP sent successfully!"})
@@ -242,4 +378,12 @@ def verify_otp(request):
         cache.delete(f"otp_{email}")  # Remove OTP after successful verification
         return Response({"success": "OTP verified successfully!"})
 
-    return Response({"error": "Invalid or expired OTP"}, status=400)
\ No newline at end of file
+    return Response({"error": "Invalid or expired OTP"}, status=400)
+
+
+@require_GET
+def serve_avatar(request, path):
+    """Avatar files never change once written (see user/avatars.py), so any cache may keep them."""
+    response = serve(request, f'{AVATAR_DIR}/{path}', document_root=settings.MEDIA_ROOT)
+    response['Cache-Control'] = f'public, max-age={AVATAR_MAX_AGE}, immutable'
+    return response